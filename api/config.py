@@ -16,17 +16,107 @@ class Settings:
     # API
     API_SECRET_KEY: str = os.getenv("API_SECRET_KEY", "your-secret-key-here")
     
+    # Сервер (api/server.py)
+    API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
+    API_PORT: int = int(os.getenv("API_PORT", "8000"))
+    # Число воркеров (0 - по числу ядер)
+    API_WORKERS: int = int(os.getenv("API_WORKERS", "0"))
+    API_BACKLOG: int = int(os.getenv("API_BACKLOG", "2048"))
+    # Keep-alive дольше idle timeout балансировщика, чтобы он не получал сброс
+    API_KEEPALIVE_TIMEOUT: int = int(os.getenv("API_KEEPALIVE_TIMEOUT", "75"))
+    # Сколько ждать запросы в обработке при остановке, секунд
+    API_GRACEFUL_TIMEOUT: int = int(os.getenv("API_GRACEFUL_TIMEOUT", "30"))
+    API_FORWARDED_ALLOW_IPS: str = os.getenv("API_FORWARDED_ALLOW_IPS", "127.0.0.1")
+    # Снимки метрик воркеров для общего /metrics (пусто - временный каталог)
+    API_METRICS_DIR: str = os.getenv("API_METRICS_DIR", "")
+    API_METRICS_INTERVAL: float = float(os.getenv("API_METRICS_INTERVAL", "5"))
+    # Только для разработки: один процесс с перезагрузкой при изменении файлов
+    API_RELOAD: bool = os.getenv("API_RELOAD", "false").lower() == "true"
+    
+    # Telegram (токен нужен для проверки подписи initData)
+    BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
+    SUPERADMIN_ID: int = int(os.getenv("SUPERADMIN_ID", "0"))
+    
     # Database
     DB_HOST: str = os.getenv("DB_HOST", "localhost")
     DB_PORT: int = int(os.getenv("DB_PORT", "5432"))
     DB_NAME: str = os.getenv("DB_NAME", "oprosy_db")
     DB_USER: str = os.getenv("DB_USER", "oprosy_user")
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    # Реплики для тяжелого чтения (get_read_db): "replica1:5432,replica2:5432"
+    DB_REPLICA_HOSTS: str = os.getenv("DB_REPLICA_HOSTS", "")
+    # Реплика с большим отставанием (секунд) пропускается, чтение идет в primary
+    DB_REPLICA_MAX_LAG: float = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+    DB_REPLICA_CHECK_INTERVAL: float = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "2"))
+    # Подключений, открываемых воркером до приема трафика
+    API_WARM_CONNECTIONS: int = int(os.getenv("API_WARM_CONNECTIONS", os.getenv("DB_POOL_SIZE", "5")))
     
     # File Upload
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "./uploads")
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
     
+    # Кэш прохождения опросов (секунд до перезагрузки списка ответивших)
+    COMPLETION_CACHE_TTL: float = float(os.getenv("COMPLETION_CACHE_TTL", "60"))
+    
+    # Максимальная длина ответа на текстовый вопрос
+    ANSWER_TEXT_MAX_LENGTH: int = int(os.getenv("ANSWER_TEXT_MAX_LENGTH", "4000"))
+    
+    # Опубликованные опросы (GET /api/quizzes/{id}/published)
+    PUBLISHED_CACHE_SIZE: int = int(os.getenv("PUBLISHED_CACHE_SIZE", "256"))
+    # Каталог готовых артефактов; пусто - только память
+    PUBLISHED_CACHE_DIR: str = os.getenv("PUBLISHED_CACHE_DIR", "./cache/published")
+    
+    # Колонки ответов аналитики в памяти воркера: опросов в кэше
+    ANALYTICS_CACHE_SIZE: int = int(os.getenv("ANALYTICS_CACHE_SIZE", "32"))
+    
+    # Аналитика в реальном времени (SSE, LISTEN/NOTIFY)
+    LIVE_ANALYTICS_ENABLED: bool = os.getenv("LIVE_ANALYTICS_ENABLED", "true").lower() == "true"
+    # Потоков на воркер
+    LIVE_ANALYTICS_MAX_SUBSCRIBERS: int = int(os.getenv("LIVE_ANALYTICS_MAX_SUBSCRIBERS", "100"))
+    # Интервал комментария-пинга в потоке, секунд
+    LIVE_ANALYTICS_HEARTBEAT: float = float(os.getenv("LIVE_ANALYTICS_HEARTBEAT", "15"))
+    
+    # Инвалидация кэшей между воркерами и ботом через LISTEN/NOTIFY
+    CACHE_INVALIDATION_ENABLED: bool = os.getenv("CACHE_INVALIDATION_ENABLED", "true").lower() == "true"
+    
+    # Учет SQL запросов
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "200"))
+    SLOW_QUERY_EXPLAIN: bool = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+    N_PLUS_ONE_THRESHOLD: int = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+    
+    # Трассировка (OpenTelemetry): exporter none | memory | file | console | otlp
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACING_EXPORTER: str = os.getenv("TRACING_EXPORTER", "file").lower()
+    TRACING_SAMPLE_RATIO: float = float(os.getenv("TRACING_SAMPLE_RATIO", "0.1"))
+    TRACING_FILE: str = os.getenv("TRACING_FILE", "./traces/api.jsonl")
+    OTEL_EXPORTER_OTLP_ENDPOINT: str = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+    
+    # Логирование: формат json | text, лимиты вида "utils.auth=5/60,uvicorn.error=0"
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json").lower()
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # Записей в секунду и размер всплеска из одного места вызова
+    LOG_RATE_LIMIT: float = float(os.getenv("LOG_RATE_LIMIT", "10"))
+    LOG_RATE_BURST: float = float(os.getenv("LOG_RATE_BURST", "20"))
+    LOG_RATE_LIMITS: str = os.getenv("LOG_RATE_LIMITS", "")
+    
+    # Профилирование воркера (/api/debug, только superadmin)
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILER_MAX_SECONDS: float = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+    # Глубина стека tracemalloc при включении через API
+    TRACEMALLOC_FRAMES: int = int(os.getenv("TRACEMALLOC_FRAMES", "10"))
+    
+    # Изоляция классов маршрутов (middlewares/bulkhead.py)
+    BULKHEAD_ENABLED: bool = os.getenv("BULKHEAD_ENABLED", "true").lower() == "true"
+    # Одновременных запросов на воркер (0 - DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    BULKHEAD_CAPACITY: int = int(os.getenv("BULKHEAD_CAPACITY", "0"))
+    # Слоты, которые могут занимать только респонденты
+    BULKHEAD_RESERVED: int = int(os.getenv("BULKHEAD_RESERVED", "2"))
+    # Лимиты классов: "analytics=4:16:2,export=1:2:1" (limit:queue:timeout)
+    BULKHEAD_LIMITS: str = os.getenv("BULKHEAD_LIMITS", "")
+    
     # Rate Limiting
     RATE_LIMIT_REQUESTS: int = int(os.getenv("RATE_LIMIT_REQUESTS", "10"))
     RATE_LIMIT_PERIOD: int = int(os.getenv("RATE_LIMIT_PERIOD", "60"))
@@ -38,6 +128,18 @@ class Settings:
         password_encoded = quote_plus(self.DB_PASSWORD)
         return f"postgresql://{self.DB_USER}:{password_encoded}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
     
+    @property
+    def replica_urls(self) -> list:
+        """URL реплик (те же база и пользователь, что у primary)"""
+        from urllib.parse import quote_plus
+        password_encoded = quote_plus(self.DB_PASSWORD)
+        urls = []
+        for host in filter(None, (part.strip() for part in self.DB_REPLICA_HOSTS.split(","))):
+            if ":" not in host:
+                host = f"{host}:{self.DB_PORT}"
+            urls.append(f"postgresql://{self.DB_USER}:{password_encoded}@{host}/{self.DB_NAME}")
+        return urls
+    
     @property
     def async_database_url(self) -> str:
         """Асинхронный URL для подключения к PostgreSQL"""
@@ -0,0 +1,278 @@
+"""
+Подключение к базе данных для API
+
+Запись и чтение по умолчанию идут в primary (get_db). Тяжелое чтение
+админских маршрутов (аналитика, выгрузка, списки) берет сессию через
+get_read_db: она привязана к реплике, отставание которой не больше
+DB_REPLICA_MAX_LAG; если таких реплик нет - к primary.
+"""
+import logging
+import threading
+from itertools import count
+from time import monotonic, perf_counter
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool
+
+from config import Settings
+from common import tracing
+from common.metrics import REGISTRY, gauge_samples
+from utils.query_recorder import install_query_recorder
+
+logger = logging.getLogger(__name__)
+
+
+DB_POOL_WAIT = REGISTRY.histogram(
+    "api_db_pool_checkout_wait_seconds",
+    "Ожидание подключения из пула SQLAlchemy",
+    ("pool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0)
+)
+DB_POOL_TIMEOUTS = REGISTRY.counter(
+    "api_db_pool_checkout_timeouts",
+    "Таймауты ожидания подключения из пула SQLAlchemy",
+    ("pool",)
+)
+DB_REPLICA_LAG = REGISTRY.gauge(
+    "api_db_replica_lag_seconds",
+    "Отставание реплики при последней проверке (-1 - недоступна)",
+    ("pool",)
+)
+DB_READ_ROUTED = REGISTRY.counter(
+    "api_db_read_sessions",
+    "Сессии чтения по месту выполнения",
+    ("target",)
+)
+
+# Отставание реплики: 0, если WAL принимается потоком и все полученное
+# уже применено (на простаивающей базе время последней транзакции не
+# растет вместе с отставанием). Без потоковой репликации равенство LSN
+# ничего не говорит - отставание считается по времени последней
+# примененной транзакции; NULL (ничего не применено) - реплика не используется.
+# status виден роли с pg_read_all_stats, иначе NULL и проверка по времени.
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+             AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool, который замеряет ожидание свободного подключения"""
+
+    # Метка пула в метриках
+    metrics_label = "primary"
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.inc(self.metrics_label)
+            raise
+        finally:
+            DB_POOL_WAIT.observe(perf_counter() - start, self.metrics_label)
+
+
+# Логгер подкласса пула не входит в иерархию "sqlalchemy" (там по умолчанию
+# WARN) и при basicConfig(INFO) пишет каждый dispose/recreate
+logging.getLogger(f"{InstrumentedQueuePool.__module__}.{InstrumentedQueuePool.__name__}").setLevel(logging.WARNING)
+
+
+# Движки по меткам пулов: коллектор регистрируется один раз на метку
+# и читает текущий движок (после пересоздания движка или пула)
+_pool_engines: Dict[str, Engine] = {}
+
+
+def register_pool_metrics(engine: Engine, label: str):
+    """Отдает занятость пула движка в метриках (считается при чтении /metrics)"""
+    engine.pool.metrics_label = label
+    registered = label in _pool_engines
+    _pool_engines[label] = engine
+    if registered:
+        return
+
+    def collect():
+        pool = _pool_engines[label].pool
+        yield gauge_samples(
+            "api_db_pool_connections",
+            "Подключения пула SQLAlchemy",
+            {
+                (label, "checked_out"): pool.checkedout(),
+                (label, "checked_in"): pool.checkedin(),
+                (label, "overflow"): max(pool.overflow(), 0),
+                (label, "size"): pool.size(),
+            },
+            ("pool", "state")
+        )
+
+    REGISTRY.add_collector(collect)
+
+
+# Движок создается при старте приложения (init_engine из lifespan),
+# а не при импорте: импорт модуля не открывает пул и не читает настройки БД
+engine: Optional[Engine] = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+class Replica:
+    """Движок реплики и результат последней проверки отставания"""
+
+    def __init__(self, engine: Engine, label: str):
+        self.engine = engine
+        self.label = label
+        self.lag: Optional[float] = None
+        self.down = False
+        self.checked_at = float("-inf")
+        self.lock = threading.Lock()
+
+    def current_lag(self, interval: float) -> Optional[float]:
+        """
+        Отставание в секундах или None, если реплика недоступна или
+        еще не применила ни одной транзакции
+
+        Проверяется не чаще раза в interval секунд; остальные потоки
+        в это время используют предыдущее значение.
+        """
+        if monotonic() - self.checked_at < interval or not self.lock.acquire(blocking=False):
+            return self.lag
+        try:
+            with self.engine.connect() as connection:
+                lag = connection.execute(REPLICA_LAG_SQL).scalar()
+            self.lag = None if lag is None else float(lag)
+            if self.down:
+                logger.info(f"Реплика {self.label} снова доступна")
+            self.down = False
+        except Exception as e:
+            if not self.down:
+                logger.warning(f"Реплика {self.label} недоступна, чтение идет в primary: {e}")
+            self.lag = None
+            self.down = True
+        finally:
+            self.checked_at = monotonic()
+            self.lock.release()
+        DB_REPLICA_LAG.set(-1 if self.lag is None else self.lag, self.label)
+        return self.lag
+
+
+replicas: List[Replica] = []
+_replica_turn = count()
+_replica_max_lag = 0.0
+_replica_check_interval = 0.0
+
+
+def _create_engine(settings: Settings, url: str, label: str, **kwargs) -> Engine:
+    """Движок с пулом, метриками пула, учетом SQL и трассировкой"""
+    db_engine = create_engine(
+        url,
+        echo=False,
+        pool_pre_ping=True,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        **kwargs
+    )
+    register_pool_metrics(db_engine, label)
+    install_query_recorder(db_engine, settings)
+    if tracing.is_enabled():
+        from utils.tracing import instrument_engine
+        instrument_engine(db_engine, label)
+    return db_engine
+
+
+def init_engine(settings: Settings) -> Engine:
+    """Создает движки primary и реплик и привязывает к primary SessionLocal"""
+    global engine, _replica_max_lag, _replica_check_interval
+    if engine is not None:
+        return engine
+
+    engine = _create_engine(settings, settings.database_url, "primary")
+    SessionLocal.configure(bind=engine)
+
+    for number, url in enumerate(settings.replica_urls, start=1):
+        label = f"replica{number}"
+        # Проверка отставания идет на пути запроса: недоступный хост не должен держать его долго
+        replica_engine = _create_engine(settings, url, label, connect_args={"connect_timeout": 3})
+        replicas.append(Replica(replica_engine, label))
+    _replica_max_lag = settings.DB_REPLICA_MAX_LAG
+    _replica_check_interval = settings.DB_REPLICA_CHECK_INTERVAL
+    return engine
+
+
+def dispose_engine():
+    """Закрывает подключения пулов (остановка приложения)"""
+    global engine
+    if engine is not None:
+        engine.dispose()
+        engine = None
+    for replica in replicas:
+        replica.engine.dispose()
+    replicas.clear()
+
+
+def read_engine() -> Engine:
+    """
+    Движок для чтения: реплики по кругу, пропуская недоступные и
+    отстающие больше DB_REPLICA_MAX_LAG; без подходящих - primary
+    """
+    for _ in range(len(replicas)):
+        replica = replicas[next(_replica_turn) % len(replicas)]
+        lag = replica.current_lag(_replica_check_interval)
+        if lag is not None and lag <= _replica_max_lag:
+            DB_READ_ROUTED.inc(replica.label)
+            return replica.engine
+
+    DB_READ_ROUTED.inc("primary_fallback" if replicas else "primary")
+    return engine
+
+
+def warm_pool(engine: Engine, connections: int) -> int:
+    """
+    Открывает connections подключений и возвращает их в пул
+
+    Вызывается воркером до приема трафика, чтобы первые запросы
+    не ждали установку соединений с PostgreSQL.
+    """
+    opened = []
+    try:
+        for _ in range(min(connections, engine.pool.size())):
+            connection = engine.raw_connection()
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            opened.append(connection)
+    finally:
+        for connection in opened:
+            connection.close()
+    return len(opened)
+
+
+def get_db() -> Session:
+    """Dependency для получения синхронной сессии БД"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db() -> Session:
+    """
+    Dependency сессии только для чтения (реплика или primary)
+
+    Данные могут отставать на DB_REPLICA_MAX_LAG секунд, поэтому
+    только для маршрутов, которые не читают собственные записи.
+    """
+    db = SessionLocal(bind=read_engine())
+    try:
+        yield db
+    finally:
+        db.close()
+
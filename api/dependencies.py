@@ -1,22 +1,30 @@
 """
 Dependencies для FastAPI endpoints
 """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-
-from fastapi import Header, HTTPException, Depends
+from fastapi import Header, HTTPException, Depends, Request
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Dict, Optional
 
-from database import get_db
+from config import Settings
+from db import get_db
 from utils.auth import validate_init_data
 from database.models import User
 
 
+def get_settings(request: Request) -> Settings:
+    """
+    Dependency: настройки приложения, с которыми его собрал create_app
+    
+    Обработчики читают настройки отсюда, а не из config.settings, чтобы
+    create_app(Settings(...)) целиком следовал переданной конфигурации.
+    """
+    return request.app.state.settings
+
+
 async def get_current_user(
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    app_settings: Settings = Depends(get_settings)
 ) -> User:
     """
     Dependency для получения текущего пользователя из initData
@@ -47,7 +55,7 @@ async def get_current_user(
     init_data = authorization.replace("Bearer ", "")
     
     # Валидируем initData
-    user_data = validate_init_data(init_data)
+    user_data = validate_init_data(init_data, app_settings.BOT_TOKEN)
     
     if not user_data:
         raise HTTPException(
@@ -68,6 +76,37 @@ async def get_current_user(
     return user
 
 
+async def get_init_data(
+    authorization: Optional[str] = Header(None),
+    app_settings: Settings = Depends(get_settings)
+) -> Optional[Dict]:
+    """
+    Dependency: проверка подписи initData без обращения к БД
+    
+    Для endpoints респондентов, которым не нужен пользователь из БД.
+    
+    ДЛЯ РАЗРАБОТКИ: без authorization возвращает None (как get_current_user)
+    """
+    if not authorization:
+        return None
+    
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid authorization header format"
+        )
+    
+    user_data = validate_init_data(authorization.replace("Bearer ", ""), app_settings.BOT_TOKEN)
+    
+    if not user_data:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid initData"
+        )
+    
+    return user_data
+
+
 async def get_current_admin(
     current_user: User = Depends(get_current_user)
 ) -> User:
@@ -81,3 +120,30 @@ async def get_current_admin(
         )
     
     return current_user
+
+
+async def get_current_superadmin(
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    app_settings: Settings = Depends(get_settings)
+) -> User:
+    """
+    Dependency для проверки прав главного администратора (SUPERADMIN_ID)
+    
+    Только по проверенному initData: запасной вариант разработки
+    (первый админ без authorization) здесь не действует.
+    """
+    if not authorization:
+        raise HTTPException(
+            status_code=401,
+            detail="Authorization header missing"
+        )
+    
+    current_user = await get_current_user(authorization, db, app_settings)
+    if not app_settings.SUPERADMIN_ID or current_user.telegram_id != app_settings.SUPERADMIN_ID:
+        raise HTTPException(
+            status_code=403,
+            detail="Superadmin access required"
+        )
+    
+    return current_user
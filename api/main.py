@@ -1,61 +1,49 @@
 """
 Главный файл FastAPI приложения
+
+create_app(settings) собирает приложение без побочных эффектов: движок БД,
+пул подключений, трассировка и кэши сервисов настраиваются в lifespan при
+старте воркера. Обработчики читают настройки через dependencies.get_settings.
+Готового app на уровне модуля нет, чтобы импорт не собирал приложение:
+uvicorn вызывает фабрику (main:create_app, factory=True).
 """
 import sys
 from pathlib import Path
 
-# Добавляем корневую директорию в sys.path
+# Корень проекта (пакеты common и database) для запуска через uvicorn main:create_app
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 
-from config import settings
+from fastapi import APIRouter, FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+import db
+from config import Settings, settings
+from common import invalidation, metrics as process_metrics, tracing
+from common.logs import parse_rate_limits, setup_logging
+from common.metrics import CONTENT_TYPE, render_metrics
+from common.pg_notify import PgListener
+from middlewares.bulkhead import BulkheadMiddleware, parse_bulkhead_limits
+from middlewares.metrics import MetricsMiddleware
+from middlewares.query_stats import QueryStatsMiddleware
 from middlewares.rate_limit import RateLimitMiddleware
-from routes import auth, quizzes, responses, users, analytics, files, links, settings as settings_route
+from middlewares.request_id import RequestIdMiddleware
+from services import column_store, completions, live_analytics, quiz_delivery, segments
+from routes import auth, quizzes, responses, users, analytics, files, links, debug, settings as settings_route
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-# Создаем приложение FastAPI
-app = FastAPI(
-    title="Oprosy API",
-    description="API для системы опросов в Telegram",
-    version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc"
-)
-
-# Настройка CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # В продакшене указать конкретные домены
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Добавляем Rate Limiting middleware
-app.add_middleware(RateLimitMiddleware)
-
-# Подключаем роутеры
-app.include_router(auth.router, prefix="/api")
-app.include_router(quizzes.router, prefix="/api")
-app.include_router(responses.router, prefix="/api")
-app.include_router(users.router, prefix="/api")
-app.include_router(analytics.router, prefix="/api")
-app.include_router(files.router, prefix="/api")
-app.include_router(links.router, prefix="/api")
-app.include_router(settings_route.router, prefix="/api")
-
-
-@app.get("/")
+# Служебные endpoints без префикса /api
+service_router = APIRouter()
+
+
+@service_router.get("/")
 async def root():
     """Корневой endpoint"""
     return {
@@ -65,7 +53,7 @@ async def root():
     }
 
 
-@app.get("/health")
+@service_router.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
@@ -74,7 +62,12 @@ async def health_check():
     }
 
 
-@app.exception_handler(Exception)
+@service_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в формате Prometheus (под api/server.py - всех воркеров, с меткой worker)"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
+
 async def global_exception_handler(request, exc):
     """Глобальный обработчик ошибок"""
     logger.error(f"Unhandled exception: {exc}", exc_info=True)
@@ -87,15 +80,161 @@ async def global_exception_handler(request, exc):
     )
 
 
-if __name__ == "__main__":
-    import uvicorn
-    
-    logger.info(f"Starting API server on {settings.API_HOST}:{settings.API_PORT}")
-    
-    uvicorn.run(
-        "main:app",
-        host=settings.API_HOST,
-        port=settings.API_PORT,
-        reload=True,
-        log_level="info"
+def create_lifespan(app_settings: Settings):
+    """Старт и остановка воркера: трассировка, кэши, движок БД, прогрев пула"""
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        started = time.perf_counter()
+
+        # Трассировка настраивается до движка, чтобы SQL запросы получили спаны
+        if app_settings.TRACING_ENABLED:
+            tracing.setup_tracing(
+                "oprosy-api",
+                exporter=app_settings.TRACING_EXPORTER,
+                sample_ratio=app_settings.TRACING_SAMPLE_RATIO,
+                file_path=app_settings.TRACING_FILE,
+                otlp_endpoint=app_settings.OTEL_EXPORTER_OTLP_ENDPOINT or None
+            )
+
+        configure_caches(app_settings)
+        engine = db.init_engine(app_settings)
+        warmed = 0
+        if app_settings.API_WARM_CONNECTIONS:
+            warmed = await run_in_threadpool(db.warm_pool, engine, app_settings.API_WARM_CONNECTIONS)
+            for replica in db.replicas:
+                try:
+                    warmed += await run_in_threadpool(db.warm_pool, replica.engine, app_settings.API_WARM_CONNECTIONS)
+                except Exception as e:
+                    # Недоступная реплика не мешает старту: чтение уйдет в primary
+                    logger.warning(f"Не удалось прогреть {replica.label}: {e}")
+        # Одно подключение LISTEN воркера на все каналы
+        listener = None
+        if app_settings.LIVE_ANALYTICS_ENABLED or app_settings.CACHE_INVALIDATION_ENABLED:
+            listener = PgListener(app_settings.database_url)
+            if app_settings.LIVE_ANALYTICS_ENABLED:
+                live_analytics.hub.attach(listener)
+            if app_settings.CACHE_INVALIDATION_ENABLED:
+                invalidation.bus.attach(listener)
+            await listener.start()
+
+        # Снимок метрик для /metrics остальных воркеров (только под api/server.py)
+        exporter = process_metrics.multiprocess
+        snapshots = asyncio.create_task(exporter.run()) if exporter is not None else None
+
+        logger.info(
+            f"Воркер готов за {(time.perf_counter() - started) * 1000:.0f} ms "
+            f"(подключений к БД: {warmed})"
+        )
+
+        try:
+            yield
+        finally:
+            # Выгружаем накопленные спаны и закрываем подключения к БД
+            live_analytics.hub.close_all()
+            if snapshots is not None:
+                snapshots.cancel()
+                exporter.remove_snapshot()
+            if listener is not None:
+                await listener.stop()
+            tracing.shutdown_tracing()
+            db.dispose_engine()
+
+    return lifespan
+
+
+def configure_caches(app_settings: Settings):
+    """Кэши сервисов воркера по настройкам приложения"""
+    completions.configure(app_settings)
+    column_store.configure(app_settings)
+    quiz_delivery.configure(app_settings)
+    segments.configure(app_settings)
+
+
+def configure_logging(app_settings: Settings):
+    """Очередь логов процесса (повторный вызов ничего не меняет)"""
+    setup_logging(
+        "oprosy-api",
+        level=app_settings.LOG_LEVEL,
+        fmt=app_settings.LOG_FORMAT,
+        queue_size=app_settings.LOG_QUEUE_SIZE,
+        rate=app_settings.LOG_RATE_LIMIT,
+        burst=app_settings.LOG_RATE_BURST,
+        limits=parse_rate_limits(app_settings.LOG_RATE_LIMITS)
+    )
+
+
+def create_app(app_settings: Settings = settings) -> FastAPI:
+    """Собирает приложение FastAPI"""
+    configure_logging(app_settings)
+
+    app = FastAPI(
+        title="Oprosy API",
+        description="API для системы опросов в Telegram",
+        version="1.0.0",
+        docs_url="/docs",
+        redoc_url="/redoc",
+        lifespan=create_lifespan(app_settings)
     )
+    app.state.settings = app_settings
+
+    # Учет SQL запросов: Server-Timing и поиск N+1
+    app.add_middleware(QueryStatsMiddleware, n_plus_one_threshold=app_settings.N_PLUS_ONE_THRESHOLD)
+
+    # Добавляем Rate Limiting middleware
+    app.add_middleware(
+        RateLimitMiddleware,
+        requests=app_settings.RATE_LIMIT_REQUESTS,
+        period=app_settings.RATE_LIMIT_PERIOD
+    )
+
+    # Ограничение классов маршрутов до rate limit: отказ 503 дешевле
+    if app_settings.BULKHEAD_ENABLED:
+        app.add_middleware(
+            BulkheadMiddleware,
+            limits=parse_bulkhead_limits(app_settings.BULKHEAD_LIMITS),
+            capacity=app_settings.BULKHEAD_CAPACITY or app_settings.DB_POOL_SIZE + app_settings.DB_MAX_OVERFLOW,
+            reserved=app_settings.BULKHEAD_RESERVED
+        )
+
+    # CORS снаружи bulkhead и rate limit: ответы 503/429 тоже получают
+    # Access-Control-Allow-Origin, и WebApp видит статус и Retry-After
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # В продакшене указать конкретные домены
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Спан запроса охватывает bulkhead, rate limit и учет SQL
+    if app_settings.TRACING_ENABLED and tracing.OTEL_AVAILABLE:
+        from middlewares.tracing import TracingMiddleware
+        app.add_middleware(TracingMiddleware)
+
+    # Метрики добавляются последними, чтобы учитывать и отклоненные запросы
+    app.add_middleware(MetricsMiddleware)
+
+    # request_id нужен всем записям лога, включая логи метрик и трассировки
+    app.add_middleware(RequestIdMiddleware)
+
+    # Подключаем роутеры
+    app.include_router(service_router)
+    app.include_router(auth.router, prefix="/api")
+    app.include_router(quizzes.router, prefix="/api")
+    app.include_router(responses.router, prefix="/api")
+    app.include_router(users.router, prefix="/api")
+    app.include_router(analytics.router, prefix="/api")
+    app.include_router(files.router, prefix="/api")
+    app.include_router(links.router, prefix="/api")
+    app.include_router(settings_route.router, prefix="/api")
+    app.include_router(debug.router, prefix="/api")
+
+    app.add_exception_handler(Exception, global_exception_handler)
+    return app
+
+
+if __name__ == "__main__":
+    # Продакшен запуск (воркеры, uvloop, graceful shutdown) - api/server.py
+    from server import run
+    run()
@@ -0,0 +1,294 @@
+"""
+Изоляция классов маршрутов (bulkhead) и сброс нагрузки
+
+Чистое ASGI middleware. Каждый маршрут относится к классу (отправка
+ответа, открытие опроса, аналитика, выгрузка, файлы, остальное админское
+API), у класса свой лимит одновременных запросов и своя очередь. Все
+классы делят общую емкость воркера (по умолчанию пул подключений БД),
+из которой часть зарезервирована за респондентами (приоритет 0).
+
+Запрос, который не получил слот:
+- при полной очереди класса сразу получает 503 с Retry-After
+- иначе ждет не дольше таймаута класса, после чего тоже 503
+
+Освободившийся слот получает ожидающий запрос с наивысшим приоритетом
+(внутри приоритета - первый пришедший), поэтому при перегрузке
+отправка ответов опережает отчеты администраторов.
+"""
+import asyncio
+import math
+from bisect import insort
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from common.metrics import REGISTRY
+from middlewares.metrics import resolve_route
+
+
+BULKHEAD_ACTIVE = REGISTRY.gauge(
+    "api_bulkhead_active",
+    "Запросы, занимающие слот класса",
+    ("route_class",)
+)
+BULKHEAD_QUEUED = REGISTRY.gauge(
+    "api_bulkhead_queued",
+    "Запросы в очереди класса",
+    ("route_class",)
+)
+BULKHEAD_REJECTIONS = REGISTRY.counter(
+    "api_bulkhead_rejections",
+    "Запросы, отклоненные 503 (queue_full | timeout)",
+    ("route_class", "reason")
+)
+BULKHEAD_WAIT = REGISTRY.histogram(
+    "api_bulkhead_wait_seconds",
+    "Ожидание слота перед обработкой",
+    ("route_class",)
+)
+
+# (метод, шаблон маршрута) -> класс; остальные маршруты /api - класс admin
+ROUTE_CLASSES: Dict[Tuple[str, str], str] = {
+    ("POST", "/api/responses"): "submit",
+    ("GET", "/api/links/resolve/{link_uuid}"): "resolve",
+    ("GET", "/api/quizzes/{quiz_id}"): "resolve",
+    ("GET", "/api/quizzes/{quiz_id}/published"): "resolve",
+    ("POST", "/api/quizzes/{quiz_id}/next"): "resolve",
+    ("GET", "/api/responses/my/{quiz_id}"): "resolve",
+    ("POST", "/api/auth/validate"): "resolve",
+    ("GET", "/api/analytics/{quiz_id}"): "analytics",
+    ("GET", "/api/analytics/{quiz_id}/reach"): "analytics",
+    ("GET", "/api/analytics/{quiz_id}/crosstab"): "analytics",
+    ("GET", "/api/quizzes/{quiz_id}/stats"): "analytics",
+    ("GET", "/api/responses/{quiz_id}"): "analytics",
+    ("GET", "/api/analytics/{quiz_id}/export"): "export",
+    ("POST", "/api/files/upload"): "files",
+    ("GET", "/api/files/{file_id}"): "files",
+    ("DELETE", "/api/files/{file_id}"): "files",
+}
+DEFAULT_CLASS = "admin"
+
+# Долгие потоки не держат подключение к БД и ограничены своим лимитом
+UNLIMITED_ROUTES = {
+    ("GET", "/api/analytics/{quiz_id}/stream"),
+}
+
+# Маршруты вне /api (health, metrics, docs) не ограничиваются
+API_PREFIX = "/api/"
+
+
+@dataclass
+class RouteClassLimit:
+    """Лимиты класса маршрутов"""
+    # Одновременно обрабатываемых запросов
+    limit: int
+    # Ожидающих слот запросов; сверх этого - сразу 503
+    queue_size: int
+    # Сколько секунд запрос может ждать слот
+    timeout: float
+    # 0 - респонденты: могут занимать резерв общей емкости
+    priority: int
+
+
+DEFAULT_LIMITS: Dict[str, RouteClassLimit] = {
+    "submit": RouteClassLimit(limit=64, queue_size=512, timeout=5.0, priority=0),
+    "resolve": RouteClassLimit(limit=64, queue_size=512, timeout=3.0, priority=0),
+    "files": RouteClassLimit(limit=8, queue_size=32, timeout=5.0, priority=1),
+    "admin": RouteClassLimit(limit=16, queue_size=64, timeout=5.0, priority=1),
+    "analytics": RouteClassLimit(limit=4, queue_size=16, timeout=2.0, priority=2),
+    "export": RouteClassLimit(limit=2, queue_size=4, timeout=1.0, priority=2),
+}
+
+
+def parse_bulkhead_limits(raw: str) -> Dict[str, RouteClassLimit]:
+    """
+    Лимиты классов вида "analytics=4:16:2,export=1:2:1"
+
+    limit:queue_size:timeout; не указанные классы берутся из DEFAULT_LIMITS
+    """
+    limits = {name: RouteClassLimit(**vars(value)) for name, value in DEFAULT_LIMITS.items()}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        limit, queue_size, timeout = value.split(":")
+        priority = limits[name].priority if name in limits else 1
+        limits[name] = RouteClassLimit(int(limit), int(queue_size), float(timeout), priority)
+    return limits
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    route_class: "_RouteClass" = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class _RouteClass:
+    def __init__(self, name: str, limits: RouteClassLimit):
+        self.name = name
+        self.limits = limits
+        self.active = 0
+        self.queued = 0
+
+
+class BulkheadRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Слоты классов и общая емкость воркера
+
+    Работает в одном event loop, поэтому состояние меняется без блокировок.
+    """
+
+    def __init__(self, limits: Dict[str, RouteClassLimit], capacity: int, reserved: int):
+        self.classes = {name: _RouteClass(name, value) for name, value in limits.items()}
+        self.capacity = capacity
+        self.reserved = min(reserved, capacity - 1)
+        self.active = 0
+        self._waiters: List[_Waiter] = []
+        self._seq = 0
+
+    def _can_admit(self, route_class: _RouteClass) -> bool:
+        if route_class.active >= route_class.limits.limit:
+            return False
+        # Резерв общей емкости доступен только респондентам
+        reserve = 0 if route_class.limits.priority == 0 else self.reserved
+        return self.active < self.capacity - reserve
+
+    def _admit(self, route_class: _RouteClass):
+        route_class.active += 1
+        self.active += 1
+        BULKHEAD_ACTIVE.inc(route_class.name)
+
+    def _wake(self):
+        """Отдает свободные слоты ожидающим по приоритету"""
+        for waiter in list(self._waiters):
+            if self.active >= self.capacity:
+                break
+            if waiter.future.done() or not self._can_admit(waiter.route_class):
+                continue
+            self._waiters.remove(waiter)
+            self._admit(waiter.route_class)
+            waiter.future.set_result(None)
+
+    async def acquire(self, name: str):
+        route_class = self.classes[name]
+        limits = route_class.limits
+
+        # Свободный слот и никто с тем же или более высоким приоритетом не ждет
+        if self._can_admit(route_class) and not (self._waiters and self._waiters[0].priority <= limits.priority):
+            self._admit(route_class)
+            return
+
+        if route_class.queued >= limits.queue_size:
+            raise BulkheadRejected("queue_full", self._retry_after(limits))
+
+        self._seq += 1
+        waiter = _Waiter(limits.priority, self._seq, route_class, asyncio.get_running_loop().create_future())
+        insort(self._waiters, waiter)
+        route_class.queued += 1
+        BULKHEAD_QUEUED.inc(name)
+        try:
+            # Слот мог освободиться для этого запроса, если впереди ждут другие классы
+            self._wake()
+            if not waiter.future.done():
+                await asyncio.wait_for(asyncio.shield(waiter.future), limits.timeout)
+        except asyncio.TimeoutError:
+            # Слот мог быть выдан в тот же момент, когда истек таймаут
+            if not (waiter.future.done() and not waiter.future.cancelled()):
+                raise BulkheadRejected("timeout", self._retry_after(limits))
+        except BaseException:
+            # Клиент отключился, пока ждал: слот, выданный в этот момент, возвращаем
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(name)
+            raise
+        finally:
+            route_class.queued -= 1
+            BULKHEAD_QUEUED.dec(name)
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                waiter.future.cancel()
+
+    def release(self, name: str):
+        route_class = self.classes[name]
+        route_class.active -= 1
+        self.active -= 1
+        BULKHEAD_ACTIVE.dec(name)
+        if self._waiters:
+            self._wake()
+
+    @staticmethod
+    def _retry_after(limits: RouteClassLimit) -> int:
+        return max(1, math.ceil(limits.timeout))
+
+
+def classify(method: str, route: str, path: str) -> Optional[str]:
+    """Класс маршрута или None, если запрос не ограничивается"""
+    if (method, route) in UNLIMITED_ROUTES:
+        return None
+    route_class = ROUTE_CLASSES.get((method, route))
+    if route_class is not None:
+        return route_class
+    return DEFAULT_CLASS if path.startswith(API_PREFIX) else None
+
+
+class BulkheadMiddleware:
+    """Допускает запрос к обработке только при свободном слоте его класса"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limits: Optional[Dict[str, RouteClassLimit]] = None,
+        capacity: int = 15,
+        reserved: int = 2
+    ):
+        self.app = app
+        self.controller = AdmissionController(limits or DEFAULT_LIMITS, capacity, reserved)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        route = scope.get("route_template") or resolve_route(scope)
+        name = classify(scope["method"], route, scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        try:
+            await self.controller.acquire(name)
+        except BulkheadRejected as e:
+            BULKHEAD_REJECTIONS.inc(name, e.reason)
+            await _reject(send, e.retry_after)
+            return
+        BULKHEAD_WAIT.observe(perf_counter() - start, name)
+
+        # Слот держится до конца ответа, включая потоковую выгрузку
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name)
+
+
+async def _reject(send: Send, retry_after: int):
+    body = b'{"detail":"Service overloaded, retry later"}'
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,82 @@
+"""
+Метрики HTTP запросов
+
+Чистое ASGI middleware (без BaseHTTPMiddleware): задержка запросов по
+шаблону маршрута, запросы в обработке и счетчик ответов по статусу.
+"""
+from time import perf_counter
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.metrics import REGISTRY
+
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "api_http_request_duration_seconds",
+    "Время обработки HTTP запроса",
+    ("method", "route")
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "api_http_requests",
+    "Обработанные HTTP запросы",
+    ("method", "route", "status")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "api_http_requests_in_flight",
+    "HTTP запросы в обработке",
+    ("method", "route")
+)
+
+# Метка для путей без маршрута, чтобы 404 не плодили метки
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def resolve_route(scope: Scope) -> str:
+    """Шаблон маршрута запроса (/api/quizzes/{quiz_id})"""
+    route = scope.get("route_template")
+    if route is not None:
+        return route
+
+    app = scope.get("app")
+    router = getattr(app, "router", None)
+    if router is None:
+        return UNMATCHED_ROUTE
+
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Собирает метрики всех HTTP запросов приложения"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        # Сохраняем шаблон в scope, чтобы внутренние middleware не искали его заново
+        route = scope["route_template"] = resolve_route(scope)
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(method, route)
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_DURATION.observe(perf_counter() - start, method, route)
+            HTTP_IN_FLIGHT.dec(method, route)
+            HTTP_REQUESTS.inc(method, route, str(status))
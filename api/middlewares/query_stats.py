@@ -0,0 +1,69 @@
+"""
+Статистика SQL запросов на HTTP запрос
+
+Добавляет заголовок Server-Timing со временем в БД и предупреждает
+о вероятных N+1: одна и та же форма запроса повторяется в рамках
+одного HTTP запроса N_PLUS_ONE_THRESHOLD раз и больше.
+"""
+import logging
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.metrics import REGISTRY
+from middlewares.metrics import resolve_route
+from utils.query_recorder import start_recording, stop_recording
+
+logger = logging.getLogger(__name__)
+
+
+DB_QUERIES_PER_REQUEST = REGISTRY.histogram(
+    "api_db_queries_per_request",
+    "Количество SQL запросов на HTTP запрос",
+    ("route",),
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100)
+)
+N_PLUS_ONE_DETECTED = REGISTRY.counter(
+    "api_db_n_plus_one",
+    "HTTP запросы с повторяющимися формами SQL запросов",
+    ("route",)
+)
+
+
+class QueryStatsMiddleware:
+    """Ведет QueryRecorder на время HTTP запроса"""
+
+    def __init__(self, app: ASGIApp, n_plus_one_threshold: int = 5):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        recorder, token = start_recording()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and recorder.count:
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", recorder.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stop_recording(token)
+
+            if recorder.count:
+                route = resolve_route(scope)
+                DB_QUERIES_PER_REQUEST.observe(recorder.count, route)
+
+                repeated = recorder.repeated(self.n_plus_one_threshold)
+                if repeated:
+                    N_PLUS_ONE_DETECTED.inc(route)
+                    details = "; ".join(f"{count}x {shape[:200]}" for shape, count in repeated)
+                    logger.warning(
+                        f"Вероятный N+1 в {scope['method']} {route}: "
+                        f"{recorder.count} запросов, повторы: {details}"
+                    )
@@ -1,17 +1,20 @@
 """
 Rate limiting middleware
 """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
-
-from fastapi import Request, HTTPException
+from fastapi import Request
+from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from collections import defaultdict
 from time import time
 from typing import Dict, Tuple
 
-from config import settings
+from common.metrics import REGISTRY
+
+
+RATE_LIMIT_REJECTIONS = REGISTRY.counter(
+    "api_rate_limit_rejections",
+    "Запросы, отклоненные rate limit"
+)
 
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
@@ -19,8 +22,10 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
     Middleware для ограничения количества запросов
     """
     
-    def __init__(self, app):
+    def __init__(self, app, requests: int = 10, period: int = 60):
         super().__init__(app)
+        self.limit = requests
+        self.period = period
         # Хранилище: {user_id: [(timestamp, count)]}
         self.requests: Dict[str, list[Tuple[float, int]]] = defaultdict(list)
     
@@ -32,7 +37,7 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
 
     async def dispatch(self, request: Request, call_next):
         # Пропускаем health check и docs
-        if request.url.path in ["/health", "/docs", "/redoc", "/openapi.json"]:
+        if request.url.path in ["/health", "/metrics", "/docs", "/redoc", "/openapi.json"]:
             return await call_next(request)
 
         # Пропускаем административные маршруты, где rate limit не нужен
@@ -46,17 +51,22 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         current_time = time()
         self.requests[client_id] = [
             (ts, count) for ts, count in self.requests[client_id]
-            if current_time - ts < settings.RATE_LIMIT_PERIOD
+            if current_time - ts < self.period
         ]
         
         # Подсчитываем количество запросов
         total_requests = sum(count for _, count in self.requests[client_id])
         
         # Проверяем лимит
-        if total_requests >= settings.RATE_LIMIT_REQUESTS:
-            raise HTTPException(
+        if total_requests >= self.limit:
+            RATE_LIMIT_REJECTIONS.inc()
+            # HTTPException из middleware не доходит до обработчиков FastAPI
+            # и превращается в 500, поэтому отвечаем 429 напрямую
+            return JSONResponse(
                 status_code=429,
-                detail=f"Rate limit exceeded. Max {settings.RATE_LIMIT_REQUESTS} requests per {settings.RATE_LIMIT_PERIOD} seconds."
+                content={
+                    "detail": f"Rate limit exceeded. Max {self.limit} requests per {self.period} seconds."
+                }
             )
         
         # Добавляем текущий запрос
@@ -66,9 +76,9 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         response = await call_next(request)
         
         # Добавляем заголовки с информацией о лимите
-        response.headers["X-RateLimit-Limit"] = str(settings.RATE_LIMIT_REQUESTS)
+        response.headers["X-RateLimit-Limit"] = str(self.limit)
         response.headers["X-RateLimit-Remaining"] = str(
-            settings.RATE_LIMIT_REQUESTS - total_requests - 1
+            self.limit - total_requests - 1
         )
         
         return response
@@ -0,0 +1,53 @@
+"""
+Идентификатор запроса
+
+Чистое ASGI middleware: берет X-Request-ID от прокси или клиента (если он
+похож на идентификатор) либо создает новый, кладет его в контекст логов
+(common.logs.request_id_var) и возвращает в заголовке ответа. Все записи
+лога, сделанные при обработке запроса, получают поле request_id.
+"""
+import re
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.logs import new_request_id, request_id_var
+
+HEADER = "X-Request-ID"
+
+# Чужой идентификатор попадает в логи, поэтому только безопасные символы
+_VALID_ID = re.compile(rb"^[A-Za-z0-9._:\-]{1,128}$")
+
+
+def _incoming_id(scope: Scope):
+    for name, value in scope["headers"]:
+        if name == b"x-request-id":
+            return value.decode("latin-1") if _VALID_ID.match(value) else None
+    return None
+
+
+class RequestIdMiddleware:
+    """Проставляет request_id запросу, логам и ответу"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _incoming_id(scope) or new_request_id()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[HEADER] = request_id
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        await self.app(scope, receive, send_wrapper)
+        # При исключении значение остается: глобальный обработчик ошибок
+        # (ServerErrorMiddleware снаружи всех middleware) логирует его с тем же
+        # request_id. Каждый запрос выполняется в своей задаче, поэтому
+        # значение не переходит в другие запросы
+        request_id_var.reset(token)
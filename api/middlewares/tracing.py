@@ -0,0 +1,74 @@
+"""
+Трассировка HTTP запросов
+
+Чистое ASGI middleware: SERVER спан на каждый запрос с именем
+"METHOD /шаблон/маршрута". Контекст родителя берется из заголовка
+traceparent, а если его нет - из query параметра traceparent
+(его добавляет бот в ссылки WebApp).
+"""
+from urllib.parse import parse_qsl
+
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.tracing import TRACEPARENT_PARAM, attach_context, detach_context, extract_context
+from middlewares.metrics import resolve_route
+
+
+def _carrier(scope: Scope) -> dict:
+    """Заголовки трассировки запроса (с запасным вариантом из query)"""
+    carrier = {}
+    for name, value in scope["headers"]:
+        if name in (b"traceparent", b"tracestate"):
+            carrier[name.decode("latin-1")] = value.decode("latin-1")
+
+    if "traceparent" not in carrier and scope.get("query_string"):
+        for key, value in parse_qsl(scope["query_string"].decode("latin-1")):
+            if key == TRACEPARENT_PARAM:
+                carrier["traceparent"] = value
+                break
+    return carrier
+
+
+class TracingMiddleware:
+    """Создает спан на каждый HTTP запрос"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.tracer = trace.get_tracer("oprosy.api")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = scope.get("route_template") or resolve_route(scope)
+        status = None
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = attach_context(extract_context(_carrier(scope)))
+        try:
+            with self.tracer.start_as_current_span(
+                f"{method} {route}",
+                kind=SpanKind.SERVER,
+                attributes={
+                    "http.request.method": method,
+                    "http.route": route,
+                    "url.path": scope["path"],
+                    "client.address": scope["client"][0] if scope.get("client") else "",
+                }
+            ) as span:
+                await self.app(scope, receive, send_wrapper)
+                if status is not None:
+                    span.set_attribute("http.response.status_code", status)
+                    if status >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+        finally:
+            detach_context(token)
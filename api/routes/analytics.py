@@ -1,22 +1,22 @@
 """
 Endpoints для аналитики и экспорта данных
 """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
-
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import Dict, Any
-from collections import Counter
+from sqlalchemy.orm import Session, defer
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Any, List
 import io
-import csv
-import json
 
-from database import get_db
-from dependencies import get_current_admin
+from config import Settings
+from db import get_read_db
+from dependencies import get_current_admin, get_settings
 from database.models import User, Quiz, Response
+from services import live_analytics
+from services.analytics import write_csv
+from services.branching import get_branching
+from services.column_store import load_columns
+from services.quiz_structure import get_structure
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
@@ -24,16 +24,22 @@ router = APIRouter(prefix="/analytics", tags=["Analytics"])
 @router.get("/{quiz_id}")
 async def get_quiz_analytics(
     quiz_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_admin)
 ) -> Dict[str, Any]:
     """
     Получить аналитику по опросу
     
-    Возвращает агрегированные данные для построения графиков
+    Возвращает агрегированные данные для построения графиков: по шкалам
+    кроме среднего - медиану, перцентили, std, 95% интервал и NPS (0-10).
+    Колонки ответов кэшируются по опросу (services/column_store);
+    загрузка и расчет идут в пуле потоков, не блокируя event loop.
     """
-    # Проверяем существование опроса
-    quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
+    # numpy нужен только аналитике
+    from services.column_analytics import analyze
+
+    # Проверяем существование опроса; structure загрузится только при промахе кэша структур
+    quiz = db.query(Quiz).options(defer(Quiz.structure)).filter(Quiz.id == quiz_id).first()
     
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
@@ -42,10 +48,10 @@ async def get_quiz_analytics(
     if quiz.creator_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Получаем все ответы
-    responses = db.query(Response).filter(Response.quiz_id == quiz_id).all()
+    structure = get_structure(quiz)
+    columns = await run_in_threadpool(load_columns, db, quiz, structure)
     
-    if not responses:
+    if not columns.size:
         return {
             "quiz_id": quiz_id,
             "title": quiz.title,
@@ -53,77 +59,145 @@ async def get_quiz_analytics(
             "questions_analytics": {}
         }
     
-    # Анализируем ответы по вопросам
-    questions_analytics = {}
+    return {
+        "quiz_id": quiz_id,
+        "title": quiz.title,
+        "total_responses": columns.size,
+        "questions_analytics": await run_in_threadpool(analyze, structure, columns)
+    }
+
+
+@router.get("/{quiz_id}/reach")
+async def get_quiz_reach(
+    quiz_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_admin)
+) -> Dict[str, Any]:
+    """
+    Охват вопросов с учетом логики переходов
     
-    # Получаем структуру опроса
-    structure = quiz.structure
-    questions = structure.get("questions", [])
+    Для каждого вопроса: reached - скольким респондентам он был показан
+    (путь восстанавливается по их ответам), answered - сколько ответили,
+    skipped - показан, но без ответа; reachable - достижим ли вопрос
+    из начала опроса вообще.
+    """
+    quiz = db.query(Quiz).options(defer(Quiz.structure)).filter(Quiz.id == quiz_id).first()
     
-    for question in questions:
-        question_id = question.get("id")
-        question_type = question.get("type")
-        question_text = question.get("text")
-        
-        # Собираем все ответы на этот вопрос
-        answers_for_question = []
-        for response in responses:
-            answer = response.answers.get(question_id)
-            if answer is not None:
-                answers_for_question.append(answer)
-        
-        # Анализируем в зависимости от типа вопроса
-        if question_type in ["radio", "checkbox"]:
-            # Подсчитываем частоту выбора каждого варианта
-            answer_counts = Counter(
-                ans if isinstance(ans, str) else json.dumps(ans)
-                for ans in answers_for_question
-            )
-            
-            questions_analytics[question_id] = {
-                "question": question_text,
-                "type": question_type,
-                "total_answers": len(answers_for_question),
-                "distribution": dict(answer_counts)
-            }
-        
-        elif question_type == "scale":
-            # Для шкалы считаем среднее и распределение
-            numeric_answers = [int(ans) for ans in answers_for_question if isinstance(ans, (int, str)) and str(ans).isdigit()]
-            
-            if numeric_answers:
-                avg_score = sum(numeric_answers) / len(numeric_answers)
-                answer_counts = Counter(numeric_answers)
-                
-                questions_analytics[question_id] = {
-                    "question": question_text,
-                    "type": question_type,
-                    "total_answers": len(numeric_answers),
-                    "average": round(avg_score, 2),
-                    "distribution": dict(answer_counts)
-                }
-        
-        elif question_type == "text":
-            # Для текстовых ответов просто считаем количество
-            questions_analytics[question_id] = {
-                "question": question_text,
-                "type": question_type,
-                "total_answers": len(answers_for_question),
-                "sample_answers": answers_for_question[:5]  # Первые 5 ответов для примера
-            }
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    
+    if quiz.creator_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    structure = get_structure(quiz)
+    graph = get_branching(structure)
+    columns = await run_in_threadpool(load_columns, db, quiz, structure)
+    
+    reached = (await run_in_threadpool(graph.bulk_paths, columns)).sum(axis=0)
+    questions = {}
+    for index, question_id in enumerate(graph.ids):
+        answered = int(columns.columns[question_id].present.sum())
+        questions[question_id] = {
+            "reachable": graph.is_reachable(question_id),
+            "reached": int(reached[index]),
+            "answered": answered,
+            "skipped": max(int(reached[index]) - answered, 0)
+        }
     
     return {
         "quiz_id": quiz_id,
-        "title": quiz.title,
-        "total_responses": len(responses),
-        "questions_analytics": questions_analytics
+        "total_responses": columns.size,
+        "branching": not graph.linear,
+        "questions": questions
     }
 
 
+@router.get("/{quiz_id}/crosstab")
+async def get_quiz_crosstab(
+    quiz_id: int,
+    row: str,
+    col: str,
+    segment: List[str] = Query([], alias="filter"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_admin)
+) -> Dict[str, Any]:
+    """
+    Перекрестная таблица двух вопросов по сегменту ответов
+    
+    - row, col: id вопросов (radio, checkbox, scale)
+    - filter: question:value, можно несколько; значения одного вопроса
+      объединяются (ИЛИ), разные вопросы - пересекаются (И)
+    
+    table[i][j] - сколько ответов сегмента выбрали row.values[i] и col.values[j].
+    Считается по битовым индексам ответов (services/segments).
+    """
+    # numpy нужен только аналитике
+    from services import segments
+
+    quiz = db.query(Quiz).options(defer(Quiz.structure)).filter(Quiz.id == quiz_id).first()
+    
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    
+    if quiz.creator_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    try:
+        filters = segments.parse_filters(segment)
+        result = await run_in_threadpool(segments.crosstab, db, quiz, get_structure(quiz), row, col, filters)
+    except segments.SegmentError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"quiz_id": quiz_id, "filters": filters, **result}
+
+
+@router.get("/{quiz_id}/stream")
+async def stream_quiz_analytics(
+    quiz_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_admin),
+    app_settings: Settings = Depends(get_settings)
+):
+    """
+    Аналитика в реальном времени (Server-Sent Events)
+
+    Первое событие snapshot - аналитика в формате aggregate_answers
+    (total_answers, distribution, co_occurrence, average, sample_answers)
+    без статистик шкалы GET /analytics/{quiz_id} (median, std, percentiles,
+    ci95, nps): их нельзя обновлять по одному ответу. Затем delta
+    с суммарными изменениями тех же полей по новым ответам. Если клиент
+    не успевает читать, несколько ответов приходят одним delta.
+    """
+    if not app_settings.LIVE_ANALYTICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Live analytics is disabled")
+
+    quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
+    
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    
+    if quiz.creator_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    if live_analytics.hub.count >= app_settings.LIVE_ANALYTICS_MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=503, detail="Too many live analytics subscribers", headers={"Retry-After": "10"})
+
+    subscriber = live_analytics.hub.subscribe(quiz_id, quiz.structure.get("questions", []))
+    return StreamingResponse(
+        live_analytics.stream(subscriber, app_settings.LIVE_ANALYTICS_HEARTBEAT),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # nginx не должен буферизовать поток
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
 @router.get("/{quiz_id}/export")
 async def export_quiz_responses(
     quiz_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_admin)
 ):
     """
@@ -165,38 +239,14 @@ async def export_quiz_responses(
     
     # Создаем CSV в памяти
     output = io.StringIO()
-    
-    # Формируем заголовки
-    headers = ["user_id", "telegram_id", "username", "first_name", "email", "completed_at"]
-    for question in questions:
-        headers.append(f"q_{question.get('id')}")
-    
-    writer = csv.DictWriter(output, fieldnames=headers)
-    writer.writeheader()
-    
-    # Записываем данные
-    for resp, telegram_id, username, first_name, email in responses:
-        row = {
-            "user_id": resp.user_id,
-            "telegram_id": telegram_id,
-            "username": username or "",
-            "first_name": first_name or "",
-            "email": email or "",
-            "completed_at": resp.completed_at.isoformat()
-        }
-        
-        # Добавляем ответы на вопросы
-        for question in questions:
-            question_id = question.get("id")
-            answer = resp.answers.get(question_id, "")
-            
-            # Преобразуем сложные ответы в строку
-            if isinstance(answer, (dict, list)):
-                answer = json.dumps(answer, ensure_ascii=False)
-            
-            row[f"q_{question_id}"] = answer
-        
-        writer.writerow(row)
+    write_csv(
+        output,
+        questions,
+        (
+            (resp.user_id, telegram_id, username, first_name, email, resp.completed_at, resp.answers)
+            for resp, telegram_id, username, first_name, email in responses
+        )
+    )
     
     # Возвращаем CSV файл
     output.seek(0)
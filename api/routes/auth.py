@@ -1,14 +1,12 @@
 """
 Endpoints для аутентификации
 """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
-
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
-from database import get_db
+from config import Settings
+from db import get_db
+from dependencies import get_settings
 from schemas.auth import InitDataValidation, AuthResponse
 from utils.auth import validate_init_data
 from database.models import User
@@ -19,7 +17,8 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 @router.post("/validate", response_model=AuthResponse)
 async def validate_init_data_endpoint(
     data: InitDataValidation,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    app_settings: Settings = Depends(get_settings)
 ):
     """
     Валидация initData от Telegram WebApp
@@ -27,7 +26,7 @@ async def validate_init_data_endpoint(
     Проверяет подпись и возвращает данные пользователя
     """
     # Валидируем initData
-    user_data = validate_init_data(data.init_data)
+    user_data = validate_init_data(data.init_data, app_settings.BOT_TOKEN)
     
     if not user_data:
         raise HTTPException(
@@ -0,0 +1,122 @@
+"""
+Endpoints диагностики работающего воркера
+
+Только для главного администратора. Профиль и снимок памяти относятся
+к воркеру, который обработал запрос (pid в ответе).
+"""
+import asyncio
+import tracemalloc
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from config import Settings
+from dependencies import get_current_superadmin, get_settings
+from database.models import User
+from utils.profiler import (
+    ProfilerBusyError, SamplingProfiler, acquire_profiler, memory_snapshot,
+    release_profiler, start_memory_tracing, stop_memory_tracing
+)
+
+router = APIRouter(prefix="/debug", tags=["Debug"])
+
+
+def _ensure_enabled(app_settings: Settings):
+    if not app_settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+
+@router.get("/profile")
+async def profile_worker(
+    seconds: float = Query(10, gt=0),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    format: str = Query("speedscope", pattern="^(speedscope|collapsed)$"),
+    include_idle: bool = False,
+    current_user: User = Depends(get_current_superadmin),
+    app_settings: Settings = Depends(get_settings)
+):
+    """
+    Семплирующий профиль воркера за seconds секунд
+
+    speedscope - JSON для https://speedscope.app,
+    collapsed - стеки для flamegraph.pl / speedscope.
+    Простаивающие потоки (ожидание событий) по умолчанию не учитываются.
+    """
+    _ensure_enabled(app_settings)
+    seconds = min(seconds, app_settings.PROFILER_MAX_SECONDS)
+
+    try:
+        acquire_profiler()
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    profiler = SamplingProfiler(interval=interval_ms / 1000, include_idle=include_idle)
+    try:
+        profiler.start()
+        try:
+            # Event loop продолжает обслуживать запросы, пока поток семплирует
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+    finally:
+        release_profiler()
+
+    headers = {
+        "X-Profile-Samples": str(profiler.samples),
+        "X-Profile-Duration": f"{profiler.duration:.3f}",
+    }
+    if format == "collapsed":
+        return PlainTextResponse(profiler.to_collapsed(), headers=headers)
+
+    headers["Content-Disposition"] = 'attachment; filename="oprosy-api.speedscope.json"'
+    return JSONResponse(profiler.to_speedscope(), headers=headers)
+
+
+@router.get("/memory")
+async def memory_top(
+    top: int = Query(25, ge=1, le=500),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    compare: bool = False,
+    current_user: User = Depends(get_current_superadmin),
+    app_settings: Settings = Depends(get_settings)
+):
+    """
+    Топ аллокаций tracemalloc
+
+    compare=true показывает рост с предыдущего вызова: так видно
+    структуры, которые растут без ограничений.
+    """
+    _ensure_enabled(app_settings)
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="tracemalloc is not running, POST /api/debug/memory/start first")
+
+    return await run_in_threadpool(memory_snapshot, top, group_by, compare)
+
+
+@router.post("/memory/start")
+async def memory_start(
+    frames: int = Query(None, ge=1, le=100),
+    current_user: User = Depends(get_current_superadmin),
+    app_settings: Settings = Depends(get_settings)
+):
+    """
+    Включить tracemalloc
+
+    Учитываются только аллокации после включения; пока он работает,
+    аллокации заметно медленнее, поэтому после диагностики его нужно выключить.
+    """
+    _ensure_enabled(app_settings)
+    started = start_memory_tracing(frames or app_settings.TRACEMALLOC_FRAMES)
+    return {"tracing": True, "started": started, "frames": tracemalloc.get_traceback_limit()}
+
+
+@router.post("/memory/stop")
+async def memory_stop(
+    current_user: User = Depends(get_current_superadmin),
+    app_settings: Settings = Depends(get_settings)
+):
+    """Выключить tracemalloc"""
+    _ensure_enabled(app_settings)
+    stop_memory_tracing()
+    return {"tracing": False}
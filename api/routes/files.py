@@ -1,20 +1,18 @@
 """
 Endpoints для загрузки и получения файлов
 """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
-
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File as FastAPIFile
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
+from pathlib import Path
 import os
 import uuid
 
-from database import get_db
-from dependencies import get_current_user
-from config import settings
+from db import get_db
+from dependencies import get_current_user, get_settings
+from config import Settings
 from database.models import User, File
+from common.tracing import span
 
 router = APIRouter(prefix="/files", tags=["Files"])
 
@@ -24,7 +22,8 @@ async def upload_file(
     file: UploadFile = FastAPIFile(...),
     quiz_id: int = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    app_settings: Settings = Depends(get_settings)
 ):
     """
     Загрузить файл
@@ -32,13 +31,16 @@ async def upload_file(
     Сохраняет файл в локальное хранилище и возвращает путь
     """
     # Проверяем размер файла
-    contents = await file.read()
-    file_size = len(contents)
+    with span("file.read_upload", {"file.content_type": file.content_type or ""}) as read_span:
+        contents = await file.read()
+        file_size = len(contents)
+        if read_span is not None:
+            read_span.set_attribute("file.size", file_size)
     
-    if file_size > settings.MAX_FILE_SIZE:
+    if file_size > app_settings.MAX_FILE_SIZE:
         raise HTTPException(
             status_code=400,
-            detail=f"File too large. Max size: {settings.MAX_FILE_SIZE} bytes"
+            detail=f"File too large. Max size: {app_settings.MAX_FILE_SIZE} bytes"
         )
     
     # Проверяем тип файла
@@ -60,19 +62,20 @@ async def upload_file(
     
     # Определяем путь для сохранения
     if quiz_id:
-        upload_dir = Path(settings.UPLOAD_DIR) / f"quiz_{quiz_id}"
+        upload_dir = Path(app_settings.UPLOAD_DIR) / f"quiz_{quiz_id}"
     else:
-        upload_dir = Path(settings.UPLOAD_DIR) / "general"
+        upload_dir = Path(app_settings.UPLOAD_DIR) / "general"
     
-    upload_dir.mkdir(parents=True, exist_ok=True)
     file_path = upload_dir / unique_filename
     
     # Сохраняем файл
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    with span("file.write", {"file.path": str(file_path), "file.size": file_size}):
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(contents)
     
     # Сохраняем метаданные в БД
-    relative_path = str(file_path.relative_to(settings.UPLOAD_DIR))
+    relative_path = str(file_path.relative_to(app_settings.UPLOAD_DIR))
     
     file_record = File(
         quiz_id=quiz_id,
@@ -98,7 +101,8 @@ async def upload_file(
 @router.get("/{file_id}")
 async def get_file(
     file_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    app_settings: Settings = Depends(get_settings)
 ):
     """
     Получить файл по ID
@@ -112,9 +116,12 @@ async def get_file(
         raise HTTPException(status_code=404, detail="File not found")
     
     # Формируем полный путь к файлу
-    file_path = Path(settings.UPLOAD_DIR) / file_record.file_path
+    file_path = Path(app_settings.UPLOAD_DIR) / file_record.file_path
+    
+    with span("file.stat", {"file.path": str(file_path)}):
+        exists = file_path.exists()
     
-    if not file_path.exists():
+    if not exists:
         raise HTTPException(status_code=404, detail="File not found on disk")
     
     # Возвращаем файл
@@ -129,7 +136,8 @@ async def get_file(
 async def delete_file(
     file_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    app_settings: Settings = Depends(get_settings)
 ):
     """
     Удалить файл
@@ -147,10 +155,11 @@ async def delete_file(
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Удаляем файл с диска
-    file_path = Path(settings.UPLOAD_DIR) / file_record.file_path
+    file_path = Path(app_settings.UPLOAD_DIR) / file_record.file_path
     
-    if file_path.exists():
-        os.remove(file_path)
+    with span("file.delete", {"file.path": str(file_path)}):
+        if file_path.exists():
+            os.remove(file_path)
     
     # Удаляем запись из БД
     db.delete(file_record)
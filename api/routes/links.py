@@ -1,18 +1,15 @@
 """
 Endpoints для управления ссылками на опросы
 """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
-
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 import uuid
 
-from database import get_db
+from db import get_db
 from dependencies import get_current_admin
 from database.models import User, Quiz, QuizLink
+from common import invalidation
 
 router = APIRouter(prefix="/links", tags=["Links"])
 
@@ -49,6 +46,8 @@ async def create_quiz_link(
     )
     
     db.add(new_link)
+    db.flush()
+    invalidation.publish(db, "link", "insert", [new_link.id])
     db.commit()
     db.refresh(new_link)
     
@@ -109,18 +108,18 @@ async def resolve_link(
     Публичный endpoint - не требует авторизации
     """
     try:
-        link = db.query(QuizLink).filter(
+        # Ссылка и опрос одним запросом
+        quiz = db.query(
+            Quiz.id, Quiz.title, Quiz.description, Quiz.status
+        ).join(
+            QuizLink, QuizLink.quiz_id == Quiz.id
+        ).filter(
             QuizLink.link_uuid == link_uuid,
             QuizLink.is_active == True
         ).first()
         
-        if not link:
-            raise HTTPException(status_code=404, detail="Link not found or inactive")
-        
-        quiz = db.query(Quiz).filter(Quiz.id == link.quiz_id).first()
-        
         if not quiz:
-            raise HTTPException(status_code=404, detail="Quiz not found")
+            raise HTTPException(status_code=404, detail="Link not found or inactive")
         
         # Возвращаем quiz_id даже если опрос не активен - пусть фронт решает
         return {
@@ -146,18 +145,22 @@ async def delete_link(
     
     Только создатель опроса может удалять ссылки
     """
-    link = db.query(QuizLink).filter(QuizLink.id == link_id).first()
+    # Ссылка вместе с создателем опроса одним запросом
+    row = db.query(QuizLink, Quiz.creator_id).join(
+        Quiz, Quiz.id == QuizLink.quiz_id
+    ).filter(QuizLink.id == link_id).first()
     
-    if not link:
+    if not row:
         raise HTTPException(status_code=404, detail="Link not found")
     
-    quiz = db.query(Quiz).filter(Quiz.id == link.quiz_id).first()
+    link, creator_id = row
     
-    if quiz.creator_id != current_user.id:
+    if creator_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Деактивируем ссылку вместо удаления
     link.is_active = False
+    invalidation.publish(db, "link", "update", [link.id])
     db.commit()
     
     return {"message": "Link deactivated successfully"}
@@ -1,25 +1,73 @@
 """
 Endpoints для управления опросами
 """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+import base64
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, defer
+from starlette.concurrency import run_in_threadpool
 
-from database import get_db
-from dependencies import get_current_user, get_current_admin
-from schemas.quiz import QuizCreate, QuizUpdate, QuizResponse, QuizListResponse, QuizStatsResponse
-from database.models import User, Quiz, Response
+from db import get_db
+from dependencies import get_current_user, get_current_admin, get_init_data
+from schemas.quiz import (
+    QuizCreate, QuizUpdate, QuizResponse, QuizListResponse, QuizStatsResponse, QuizSummary,
+    NextQuestionRequest, NextQuestionResponse, QUIZ_LIST_FIELDS, QUIZ_SUMMARY_FIELDS
+)
+from database.models import User, Quiz
+from services import quiz_delivery
+from services.branching import BranchingError, check_branching, get_branching
+from services.quiz_structure import compile_structure, get_structure
 
 router = APIRouter(prefix="/quizzes", tags=["Quizzes"])
 
 
-@router.get("", response_model=QuizListResponse)
+def _check_logic(structure: Optional[Dict]):
+    """Логика переходов должна компилироваться до сохранения опроса"""
+    if structure is None:
+        return
+    try:
+        check_branching(compile_structure(structure))
+    except BranchingError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+
+
+def _parse_fields(fields: Optional[str]) -> List[str]:
+    """Поля списка из fields=title,status (id возвращается всегда)"""
+    if not fields:
+        return list(QUIZ_SUMMARY_FIELDS)
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in QUIZ_LIST_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(QUIZ_LIST_FIELDS)}"
+        )
+    return ["id"] + [name for name in dict.fromkeys(requested) if name != "id"]
+
+
+def _encode_cursor(created_at: datetime, quiz_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{quiz_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, quiz_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(quiz_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("", response_model=QuizListResponse, response_model_exclude_unset=True)
 async def get_quizzes(
     status: str = None,
+    fields: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin)
 ):
@@ -27,24 +75,46 @@ async def get_quizzes(
     Получить список всех опросов текущего администратора
     
     Опционально фильтровать по статусу: draft, active, archived
+    
+    - fields: поля опроса через запятую (по умолчанию без structure/settings)
+    - limit, cursor: страница по created_at (новые первыми); курсор
+      следующей страницы - next_cursor предыдущего ответа
     """
+    selected = _parse_fields(fields)
+    # Читаются только нужные колонки: JSONB structure/settings - лишь по запросу
+    columns = [getattr(Quiz, name) for name in selected]
+    if "created_at" not in selected:
+        columns.append(Quiz.created_at)
+
     query = db.query(Quiz).filter(Quiz.creator_id == current_user.id)
-    
     if status:
         query = query.filter(Quiz.status == status)
-    
-    quizzes = query.order_by(Quiz.created_at.desc()).all()
-    
+    total = query.count()
+
+    page = query.with_entities(*columns)
+    if cursor:
+        # Keyset: индекс (creator_id, created_at, id) без OFFSET
+        created_at, quiz_id = _decode_cursor(cursor)
+        page = page.filter(tuple_(Quiz.created_at, Quiz.id) < tuple_(created_at, quiz_id))
+    rows = page.order_by(Quiz.created_at.desc(), Quiz.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id)
+
     return QuizListResponse(
-        quizzes=quizzes,
-        total=len(quizzes)
+        quizzes=[QuizSummary(**{name: getattr(row, name) for name in selected}) for row in rows],
+        total=total,
+        next_cursor=next_cursor
     )
 
 
 @router.get("/{quiz_id}", response_model=QuizResponse)
 async def get_quiz(
     quiz_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
 ):
     """
     Получить опрос по ID
@@ -69,6 +139,58 @@ async def get_quiz(
     return quiz
 
 
+@router.get("/{quiz_id}/published")
+async def get_published_quiz(
+    quiz_id: int,
+    accept_encoding: str = Header(""),
+    if_none_match: Optional[str] = Header(None),
+    init_data: Optional[Dict] = Depends(get_init_data)
+):
+    """
+    Опубликованный опрос для прохождения
+    
+    Только активные опросы. Отдается заранее собранный и сжатый
+    артефакт текущей версии (services/quiz_delivery) с ETag:
+    повторный запрос с If-None-Match получает 304.
+    """
+    published = quiz_delivery.cached_published(quiz_id)
+    if published is None:
+        published = await run_in_threadpool(quiz_delivery.load_published, quiz_id)
+    if published is None:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    
+    return quiz_delivery.published_response(published, accept_encoding, if_none_match)
+
+
+@router.post("/{quiz_id}/next", response_model=NextQuestionResponse)
+async def get_next_question(
+    quiz_id: int,
+    request: NextQuestionRequest,
+    db: Session = Depends(get_db),
+    init_data: Optional[Dict] = Depends(get_init_data)
+):
+    """
+    Следующий вопрос по логике опроса
+    
+    Переход считается по ответу на current скомпилированным графом
+    версии опроса (services/branching); structure читается из БД только
+    при промахе кэша структур.
+    """
+    quiz = db.query(Quiz).options(
+        defer(Quiz.structure), defer(Quiz.settings)
+    ).filter(Quiz.id == quiz_id).first()
+    
+    if not quiz or quiz.status != "active":
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    
+    graph = get_branching(get_structure(quiz))
+    if request.current is not None and request.current not in graph.ids:
+        raise HTTPException(status_code=400, detail="Unknown question")
+    
+    next_id, remaining = graph.next_question(request.current, request.answers)
+    return NextQuestionResponse(next=next_id, finished=next_id is None, remaining=remaining)
+
+
 @router.post("", response_model=QuizResponse, status_code=201)
 async def create_quiz(
     quiz_data: QuizCreate,
@@ -80,6 +202,8 @@ async def create_quiz(
     
     Только для администраторов
     """
+    _check_logic(quiz_data.structure)
+    
     new_quiz = Quiz(
         creator_id=current_user.id,
         title=quiz_data.title,
@@ -118,6 +242,7 @@ async def update_quiz(
     
     # Обновляем только переданные поля
     update_data = quiz_data.model_dump(exclude_unset=True)
+    _check_logic(update_data.get("structure"))
     for field, value in update_data.items():
         setattr(quiz, field, value)
     
@@ -171,13 +296,12 @@ async def get_quiz_stats(
     if quiz.creator_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Подсчитываем количество ответов
-    total_responses = db.query(Response).filter(Response.quiz_id == quiz_id).count()
-    
+    # Счетчик ведет триггер на responses, count(*) не нужен
     return QuizStatsResponse(
         quiz_id=quiz.id,
         title=quiz.title,
-        total_responses=total_responses,
+        total_responses=quiz.response_count,
+        last_response_at=quiz.last_response_at,
         status=quiz.status,
         created_at=quiz.created_at
     )
@@ -1,18 +1,20 @@
 """
 Endpoints для работы с ответами на опросы
 """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
-
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
 from sqlalchemy.exc import IntegrityError
 
-from database import get_db
-from dependencies import get_current_user, get_current_admin
+from db import get_db, get_read_db
+from dependencies import get_current_user, get_current_admin, get_settings
 from schemas.response import ResponseCreate, ResponseResponse, ResponseListResponse, ResponseWithUserResponse, ResponseSubmit, ResponseSubmitResponse
 from database.models import User, Quiz, Response
+from config import Settings
+from services import segments
+from services.completions import completion_cache, known_completion
+from services.live_analytics import publish_response
+from services.answer_validation import AnswerValidationError, get_validator
+from services.quiz_structure import get_structure
 
 router = APIRouter(prefix="/responses", tags=["Responses"])
 
@@ -20,15 +22,19 @@ router = APIRouter(prefix="/responses", tags=["Responses"])
 @router.post("", response_model=ResponseSubmitResponse)
 async def submit_response(
     response_data: ResponseSubmit,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    app_settings: Settings = Depends(get_settings)
 ):
     """
     Сохранить ответы пользователя на опрос
     
     Пользователь может пройти опрос только один раз
     """
-    # Проверяем существование опроса
-    quiz = db.query(Quiz).filter(Quiz.id == response_data.quiz_id).first()
+    # Проверяем существование опроса; structure загрузится только при промахе кэша структур
+    quiz = db.query(Quiz).options(
+        defer(Quiz.structure), defer(Quiz.settings)
+    ).filter(Quiz.id == response_data.quiz_id).first()
     
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
@@ -37,30 +43,60 @@ async def submit_response(
     if quiz.status != "active":
         raise HTTPException(status_code=400, detail="Quiz is not active")
     
+    # Ответы проверяются и нормализуются до записи
+    try:
+        answers = get_validator(get_structure(quiz), app_settings.ANSWER_TEXT_MAX_LENGTH).validate(response_data.answers)
+    except AnswerValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+    
+    already_completed = HTTPException(
+        status_code=400,
+        detail="Failed to save response. You may have already completed this quiz."
+    )
+    
+    # Повторная отправка отсекается без INSERT, если прохождение уже подтверждено
+    if completion_cache.check(quiz.id, current_user.id):
+        raise already_completed
+    
+    # Счетчики опроса до вставки: по ним ответ дописывается в битовый индекс аналитики
+    counters = (quiz.response_count, quiz.last_response_at)
+    
     new_response = Response(
         quiz_id=response_data.quiz_id,
-        user_id=None,
-        answers=response_data.answers
+        user_id=current_user.id,
+        answers=answers
     )
     
     try:
         db.add(new_response)
+        if app_settings.LIVE_ANALYTICS_ENABLED:
+            # id ответа нужен в уведомлении; NOTIFY уйдет вместе с COMMIT
+            db.flush()
+            publish_response(db, new_response)
         db.commit()
         db.refresh(new_response)
     except IntegrityError:
         db.rollback()
-        raise HTTPException(
-            status_code=400,
-            detail="Failed to save response. You may have already completed this quiz."
+        completion_cache.confirm(quiz.id, current_user.id)
+        raise already_completed
+    
+    completion_cache.add(quiz.id, current_user.id)
+    if segments.index_cache.get(quiz.id) is not None:
+        db.refresh(quiz, ["response_count", "last_response_at"])
+        segments.record_response(
+            quiz.id, counters, (quiz.response_count, quiz.last_response_at), new_response, answers
         )
     
-    return new_response
+    return ResponseSubmitResponse(
+        message="Response saved successfully",
+        response_id=new_response.id
+    )
 
 
 @router.get("/{quiz_id}", response_model=ResponseListResponse)
 async def get_responses(
     quiz_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_admin)
 ):
     """
@@ -127,15 +163,22 @@ async def get_my_response(
     
     Для проверки, проходил ли пользователь опрос
     """
+    not_completed = HTTPException(
+        status_code=404,
+        detail="You haven't completed this quiz yet"
+    )
+    
+    # Отрицательный ответ обычно известен без запроса к responses
+    if known_completion(db, quiz_id, current_user.id) is False:
+        raise not_completed
+    
     response = db.query(Response).filter(
         Response.quiz_id == quiz_id,
         Response.user_id == current_user.id
     ).first()
     
     if not response:
-        raise HTTPException(
-            status_code=404,
-            detail="You haven't completed this quiz yet"
-        )
+        raise not_completed
     
+    completion_cache.confirm(quiz_id, current_user.id)
     return response
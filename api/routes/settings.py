@@ -1,16 +1,13 @@
 """
 Endpoints для управления настройками
 """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
-
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
-from database import get_db
+from db import get_db
 from dependencies import get_current_admin
+from common import invalidation
 
 router = APIRouter(prefix="/settings", tags=["Settings"])
 
@@ -23,10 +20,20 @@ class SettingsModel(BaseModel):
     collectLastName: bool = False
 
 
-# Временное хранилище настроек (в продакшене - БД)
+# Временное хранилище настроек (в продакшене - БД); в остальные воркеры
+# новое значение приходит событием шины инвалидации
 _settings_storage = SettingsModel()
 
 
+def _apply_settings(event: invalidation.ChangeEvent):
+    global _settings_storage
+    if event.data is not None:
+        _settings_storage = SettingsModel(**event.data)
+
+
+invalidation.bus.subscribe("settings", _apply_settings)
+
+
 @router.get("")
 async def get_settings(
     current_user = Depends(get_current_admin)
@@ -40,6 +47,7 @@ async def get_settings(
 @router.post("")
 async def save_settings(
     settings: SettingsModel,
+    db: Session = Depends(get_db),
     current_user = Depends(get_current_admin)
 ):
     """
@@ -47,5 +55,7 @@ async def save_settings(
     """
     global _settings_storage
     _settings_storage = settings
+    invalidation.publish(db, "settings", "update", data=settings.model_dump())
+    db.commit()
     
     return {"message": "Settings saved successfully"}
@@ -1,17 +1,14 @@
 """
 Endpoints для управления пользователями
 """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
-
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
-from database import get_db
+from db import get_db, get_read_db
 from dependencies import get_current_admin
 from schemas.user import UserResponse, UserListResponse
 from database.models import User
+from common import invalidation
 from config import settings
 import os
 
@@ -20,7 +17,7 @@ router = APIRouter(prefix="/users", tags=["Users"])
 
 @router.get("", response_model=UserListResponse)
 async def get_users(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_admin)
 ):
     """
@@ -81,6 +78,7 @@ async def set_admin_status(
     
     # Обновляем статус
     user.is_admin = is_admin
+    invalidation.publish(db, "user", "update", [user.id])
     db.commit()
     db.refresh(user)
     
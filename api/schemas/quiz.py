@@ -33,6 +33,8 @@ class QuizResponse(QuizBase):
     """Схема ответа с данными опроса"""
     id: int
     creator_id: int
+    response_count: int = 0
+    last_response_at: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
 
@@ -40,10 +42,37 @@ class QuizResponse(QuizBase):
         from_attributes = True
 
 
+# Поля опроса, доступные в списке через fields=
+QUIZ_LIST_FIELDS = (
+    "id", "creator_id", "title", "description", "status",
+    "response_count", "last_response_at", "created_at", "updated_at",
+    "structure", "settings",
+)
+# Поля по умолчанию: карточка опроса без JSONB
+QUIZ_SUMMARY_FIELDS = ("id", "title", "status", "response_count", "last_response_at", "created_at", "updated_at")
+
+
+class QuizSummary(BaseModel):
+    """Опрос в списке: в ответ попадают только загруженные поля"""
+    id: int
+    creator_id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[str] = None
+    response_count: Optional[int] = None
+    last_response_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    structure: Optional[Dict[str, Any]] = None
+    settings: Optional[Dict[str, Any]] = None
+
+
 class QuizListResponse(BaseModel):
     """Схема списка опросов"""
-    quizzes: list[QuizResponse]
+    quizzes: list[QuizSummary]
     total: int
+    # Курсор следующей страницы; None - страница последняя
+    next_cursor: Optional[str] = None
 
 
 class QuizStatsResponse(BaseModel):
@@ -51,5 +80,21 @@ class QuizStatsResponse(BaseModel):
     quiz_id: int
     title: str
     total_responses: int
+    last_response_at: Optional[datetime] = None
     status: str
     created_at: datetime
+
+
+class NextQuestionRequest(BaseModel):
+    """Схема запроса следующего вопроса"""
+    # None - начало опроса
+    current: Optional[str] = None
+    answers: Dict[str, Any] = Field(default_factory=dict)
+
+
+class NextQuestionResponse(BaseModel):
+    """Схема следующего вопроса по логике опроса"""
+    next: Optional[str] = None
+    finished: bool
+    # Сколько вопросов еще может быть показано (длиннейший путь), включая next
+    remaining: int
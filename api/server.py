@@ -0,0 +1,231 @@
+"""
+Продакшен запуск API
+
+Pre-fork сервер поверх uvicorn:
+- мастер создает слушающий сокет (backlog), импортирует приложение
+  до fork (preload) и запускает API_WORKERS воркеров
+- воркер: uvloop + httptools, keep-alive из настроек; lifespan
+  приложения создает движок и прогревает пул БД до приема трафика
+- SIGTERM/SIGINT: мастер передает SIGTERM воркерам, uvicorn перестает
+  принимать подключения, дожидается запросов в обработке и выполняет
+  shutdown приложения (сброс спанов и буферов); через
+  API_GRACEFUL_TIMEOUT оставшиеся воркеры убиваются
+- упавший воркер перезапускается с тем же номером
+- /metrics любого воркера отдает метрики всех воркеров с меткой worker
+  (снимки в API_METRICS_DIR, common.metrics.MultiprocessMetrics)
+
+Запуск:
+    python api/server.py
+    API_WORKERS=4 API_PORT=8000 python api/server.py
+    API_RELOAD=true python api/server.py    # разработка: один процесс с перезагрузкой
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import Dict
+
+import uvicorn
+
+from config import settings
+from common import metrics
+from common.logs import shutdown_logging
+
+logger = logging.getLogger("api.server")
+
+# Пауза перед перезапуском упавшего воркера, секунд
+RESPAWN_DELAY = 1.0
+
+
+def create_socket() -> socket.socket:
+    """Слушающий сокет, общий для всех воркеров"""
+    family = socket.AF_INET6 if ":" in settings.API_HOST else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((settings.API_HOST, settings.API_PORT))
+    sock.listen(settings.API_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def server_config(app) -> uvicorn.Config:
+    return uvicorn.Config(
+        app,
+        loop="uvloop",
+        http="httptools",
+        lifespan="on",
+        backlog=settings.API_BACKLOG,
+        timeout_keep_alive=settings.API_KEEPALIVE_TIMEOUT,
+        timeout_graceful_shutdown=settings.API_GRACEFUL_TIMEOUT,
+        # Адрес клиента из X-Forwarded-For только от доверенного прокси
+        proxy_headers=True,
+        forwarded_allow_ips=settings.API_FORWARDED_ALLOW_IPS,
+        access_log=False,
+        log_level="info",
+        # Логгеры uvicorn пишут через очередь корневого логгера (common.logs)
+        log_config=None,
+    )
+
+
+class WorkerServer(uvicorn.Server):
+    def handle_exit(self, sig, frame):
+        # Потоки SSE не завершаются сами: закрываем их сразу, иначе дренаж
+        # ждал бы их до API_GRACEFUL_TIMEOUT
+        from services.live_analytics import hub
+        hub.close_all_threadsafe()
+        super().handle_exit(sig, frame)
+
+
+def run_worker(app, sock: socket.socket, number: int, metrics_dir: str):
+    """Процесс воркера: обслуживание запросов до SIGTERM"""
+    # SIGTERM до старта uvicorn - просто выходим; дальше сигналы
+    # обрабатывает uvicorn и после дренажа повторяет их сюда
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    # Снимки метрик пишет lifespan приложения
+    metrics.enable_multiprocess(metrics_dir, str(number), settings.API_METRICS_INTERVAL)
+
+    # Движок БД и прогрев пула - в lifespan приложения, то есть уже
+    # в процессе воркера и до того, как uvicorn начнет принимать подключения
+    config = server_config(app)
+    config.setup_event_loop()
+    server = WorkerServer(config)
+    asyncio.run(server.serve(sockets=[sock]))
+
+
+def spawn_worker(app, sock: socket.socket, number: int, metrics_dir: str) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+
+    code = 0
+    try:
+        run_worker(app, sock, number, metrics_dir)
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 0
+    except BaseException:
+        logger.exception("Воркер завершился с ошибкой")
+        code = 1
+    finally:
+        # Дописываем очередь логов воркера: os._exit не вызывает atexit
+        shutdown_logging()
+        logging.shutdown()
+        os._exit(code)
+
+
+def supervise(app, sock: socket.socket, workers: int, metrics_dir: str):
+    """Мастер: держит workers воркеров и останавливает их по сигналу"""
+    # pid -> номер воркера
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def handle_stop(sig, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        logger.info(f"Получен {signal.Signals(sig).name}, останавливаем воркеры")
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    for number in range(workers):
+        children[spawn_worker(app, sock, number, metrics_dir)] = number
+    logger.info(f"API слушает {settings.API_HOST}:{settings.API_PORT}, воркеров: {workers}, pid: {list(children)}")
+
+    deadline = None
+    while children:
+        if stopping and deadline is None:
+            # Запас сверх graceful timeout на shutdown приложения
+            deadline = time.monotonic() + settings.API_GRACEFUL_TIMEOUT + 5
+
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+
+        if pid == 0:
+            if deadline is not None and time.monotonic() > deadline:
+                for pid in list(children):
+                    logger.warning(f"Воркер {pid} не завершился за отведенное время, SIGKILL")
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                deadline = float("inf")
+            time.sleep(0.2)
+            continue
+
+        number = children.pop(pid, None)
+        if stopping or number is None:
+            continue
+
+        logger.error(f"Воркер {pid} завершился (status {status}), перезапуск")
+        time.sleep(RESPAWN_DELAY)
+        if not stopping:
+            children[spawn_worker(app, sock, number, metrics_dir)] = number
+
+    sock.close()
+    logger.info("API остановлен")
+
+
+def run():
+    from main import configure_logging
+    configure_logging(settings)
+
+    if settings.API_RELOAD:
+        # Перезагрузка требует импорта по строке в отдельном процессе
+        uvicorn.run(
+            "main:create_app",
+            factory=True,
+            app_dir=str(Path(__file__).resolve().parent),
+            host=settings.API_HOST,
+            port=settings.API_PORT,
+            reload=True,
+            reload_dirs=[str(Path(__file__).resolve().parent.parent)],
+            log_level="info",
+            log_config=None
+        )
+        return
+
+    workers = settings.API_WORKERS or os.cpu_count() or 1
+    sock = create_socket()
+
+    # Preload: код приложения импортируется один раз до fork и разделяется
+    # воркерами через copy-on-write; подключений к БД у мастера нет
+    from main import create_app
+    app = create_app(settings)
+
+    # Снимки метрик воркеров; снимки прошлого запуска не должны попасть в /metrics
+    metrics_dir = settings.API_METRICS_DIR or tempfile.mkdtemp(prefix="oprosy-metrics-")
+    os.makedirs(metrics_dir, exist_ok=True)
+    for stale in Path(metrics_dir).glob("*.json"):
+        stale.unlink()
+
+    try:
+        supervise(app, sock, workers, metrics_dir)
+    finally:
+        if settings.API_METRICS_DIR:
+            for snapshot in Path(metrics_dir).glob("*.json"):
+                snapshot.unlink()
+        else:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,236 @@
+"""
+Агрегация ответов для аналитики и экспорта
+
+Чистые функции без обращения к БД: их используют роуты аналитики
+и микро-бенчмарки (benchmarks/micro.py).
+
+Вариант checkbox считается отдельно: distribution - сколько ответов
+выбрали вариант, co_occurrence - сколько выбрали пару вариантов вместе
+({вариант: {другой вариант: число}}, только ненулевые пары).
+"""
+import csv
+import json
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+# Служебные колонки CSV экспорта
+EXPORT_BASE_HEADERS = ["user_id", "telegram_id", "username", "first_name", "email", "completed_at"]
+
+
+def _selected(answer: Any) -> List[str]:
+    """Выбранные варианты checkbox без повторов (старые ответы - строкой)"""
+    items = answer if isinstance(answer, list) else [answer]
+    return list(dict.fromkeys(item if isinstance(item, str) else json.dumps(item) for item in items))
+
+
+def _add_pairs(co_occurrence: Dict[str, Dict[str, int]], selected: List[str]):
+    for option in selected:
+        row = co_occurrence.setdefault(option, {})
+        for other in selected:
+            if other != option:
+                row[other] = row.get(other, 0) + 1
+
+
+def aggregate_answers(questions: List[Dict[str, Any]], answers_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Аналитика по вопросам опроса
+
+    Args:
+        questions: Вопросы из quiz.structure["questions"]
+        answers_list: Ответы (Response.answers) всех респондентов
+
+    Returns:
+        {question_id: аналитика вопроса}
+    """
+    questions_analytics = {}
+
+    for question in questions:
+        question_id = question.get("id")
+        question_type = question.get("type")
+        question_text = question.get("text")
+
+        # Собираем все ответы на этот вопрос
+        answers_for_question = []
+        for answers in answers_list:
+            answer = answers.get(question_id)
+            if answer is not None:
+                answers_for_question.append(answer)
+
+        # Анализируем в зависимости от типа вопроса
+        if question_type == "checkbox":
+            # Каждый вариант и каждая пара вариантов считаются отдельно
+            option_counts = Counter()
+            co_occurrence: Dict[str, Dict[str, int]] = {}
+            for ans in answers_for_question:
+                selected = _selected(ans)
+                option_counts.update(selected)
+                _add_pairs(co_occurrence, selected)
+
+            questions_analytics[question_id] = {
+                "question": question_text,
+                "type": question_type,
+                "total_answers": len(answers_for_question),
+                "distribution": dict(option_counts),
+                "co_occurrence": {option: row for option, row in co_occurrence.items() if row}
+            }
+
+        elif question_type == "radio":
+            # Подсчитываем частоту выбора каждого варианта
+            answer_counts = Counter(
+                ans if isinstance(ans, str) else json.dumps(ans)
+                for ans in answers_for_question
+            )
+
+            questions_analytics[question_id] = {
+                "question": question_text,
+                "type": question_type,
+                "total_answers": len(answers_for_question),
+                "distribution": dict(answer_counts)
+            }
+
+        elif question_type == "scale":
+            # Для шкалы считаем среднее и распределение
+            numeric_answers = [int(ans) for ans in answers_for_question if isinstance(ans, (int, str)) and str(ans).isdigit()]
+
+            if numeric_answers:
+                avg_score = sum(numeric_answers) / len(numeric_answers)
+                answer_counts = Counter(numeric_answers)
+
+                questions_analytics[question_id] = {
+                    "question": question_text,
+                    "type": question_type,
+                    "total_answers": len(numeric_answers),
+                    "average": round(avg_score, 2),
+                    "distribution": dict(answer_counts)
+                }
+
+        elif question_type == "text":
+            # Для текстовых ответов просто считаем количество
+            questions_analytics[question_id] = {
+                "question": question_text,
+                "type": question_type,
+                "total_answers": len(answers_for_question),
+                "sample_answers": answers_for_question[:5]  # Первые 5 ответов для примера
+            }
+
+    return questions_analytics
+
+
+def answer_delta(questions: List[Dict[str, Any]], answers: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Вклад одного ответа в результат aggregate_answers
+
+    Для шкалы вместо среднего отдается sum: новое среднее получается
+    из прежних average и total_answers.
+    """
+    delta = {}
+
+    for question in questions:
+        question_id = question.get("id")
+        question_type = question.get("type")
+        answer = answers.get(question_id)
+        if answer is None:
+            continue
+
+        if question_type == "checkbox":
+            selected = _selected(answer)
+            co_occurrence: Dict[str, Dict[str, int]] = {}
+            _add_pairs(co_occurrence, selected)
+            delta[question_id] = {
+                "total_answers": 1,
+                "distribution": {option: 1 for option in selected},
+                "co_occurrence": {option: row for option, row in co_occurrence.items() if row}
+            }
+
+        elif question_type == "radio":
+            key = answer if isinstance(answer, str) else json.dumps(answer)
+            delta[question_id] = {"total_answers": 1, "distribution": {key: 1}}
+
+        elif question_type == "scale":
+            if isinstance(answer, (int, str)) and str(answer).isdigit():
+                value = int(answer)
+                delta[question_id] = {"total_answers": 1, "sum": value, "distribution": {value: 1}}
+
+        elif question_type == "text":
+            delta[question_id] = {"total_answers": 1, "sample_answers": [answer]}
+
+    return delta
+
+
+def merge_delta(target: Dict[str, Any], delta: Dict[str, Any], max_samples: int = 5) -> Dict[str, Any]:
+    """Складывает delta в target (несколько ответов - одно изменение)"""
+    for question_id, change in delta.items():
+        merged = target.setdefault(question_id, {"total_answers": 0})
+        merged["total_answers"] += change["total_answers"]
+        if "sum" in change:
+            merged["sum"] = merged.get("sum", 0) + change["sum"]
+        if "distribution" in change:
+            distribution = merged.setdefault("distribution", {})
+            for key, value in change["distribution"].items():
+                distribution[key] = distribution.get(key, 0) + value
+        if "co_occurrence" in change:
+            co_occurrence = merged.setdefault("co_occurrence", {})
+            for option, pairs in change["co_occurrence"].items():
+                row = co_occurrence.setdefault(option, {})
+                for other, value in pairs.items():
+                    row[other] = row.get(other, 0) + value
+        if "sample_answers" in change:
+            samples = merged.setdefault("sample_answers", [])
+            samples.extend(change["sample_answers"][:max_samples - len(samples)])
+    return target
+
+
+def export_headers(questions: List[Dict[str, Any]]) -> List[str]:
+    """Заголовки CSV экспорта"""
+    return EXPORT_BASE_HEADERS + [f"q_{question.get('id')}" for question in questions]
+
+
+def export_row(
+    questions: List[Dict[str, Any]],
+    user_id: int,
+    telegram_id: Optional[int],
+    username: Optional[str],
+    first_name: Optional[str],
+    email: Optional[str],
+    completed_at,
+    answers: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Строка CSV экспорта для одного ответа"""
+    row = {
+        "user_id": user_id,
+        "telegram_id": telegram_id,
+        "username": username or "",
+        "first_name": first_name or "",
+        "email": email or "",
+        "completed_at": completed_at.isoformat()
+    }
+
+    # Добавляем ответы на вопросы
+    for question in questions:
+        question_id = question.get("id")
+        answer = answers.get(question_id, "")
+
+        # Преобразуем сложные ответы в строку
+        if isinstance(answer, (dict, list)):
+            answer = json.dumps(answer, ensure_ascii=False)
+
+        row[f"q_{question_id}"] = answer
+
+    return row
+
+
+def write_csv(output, questions: List[Dict[str, Any]], rows: Iterable[Tuple]):
+    """
+    Пишет CSV экспорт в output
+
+    Args:
+        output: Текстовый поток
+        questions: Вопросы опроса
+        rows: Кортежи (user_id, telegram_id, username, first_name, email, completed_at, answers)
+    """
+    writer = csv.DictWriter(output, fieldnames=export_headers(questions))
+    writer.writeheader()
+
+    for row in rows:
+        writer.writerow(export_row(questions, *row))
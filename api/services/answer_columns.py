@@ -0,0 +1,151 @@
+"""
+Ответы опроса по колонкам NumPy
+
+Ответы всех респондентов раскладываются по вопросам в массивы длины N
+(число ответов), чтобы условия и статистика считались векторно:
+
+- radio, text и вопросы неизвестного типа: codes (int32, -1 - нет ответа)
+  и labels - словарь значений (для radio - варианты опроса, затем
+  встреченные в старых ответах)
+- checkbox: matrix (N x K, bool) - выбран ли вариант k
+- scale: values (float64, NaN - нет ответа или не число)
+
+У каждой колонки present - был ли ответ. Старые ответы, записанные до
+проверки ответов, приводятся к тем же типам ("7" -> 7, одиночный вариант
+checkbox строкой). Новые ответы дописываются к готовым колонкам
+(extend_columns) с тем же словарем значений.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from services.quiz_structure import Question, QuizStructure
+
+
+@dataclass
+class Column:
+    """Ответы на один вопрос"""
+    kind: str  # codes | multi | numeric
+    present: np.ndarray
+    codes: Optional[np.ndarray] = None
+    labels: Optional[List[str]] = None
+    matrix: Optional[np.ndarray] = None
+    values: Optional[np.ndarray] = None
+
+    def code(self, label: Any) -> int:
+        """Код значения или -1"""
+        try:
+            return self.labels.index(label)
+        except ValueError:
+            return -1
+
+    def concat(self, other: "Column") -> "Column":
+        """Колонка из строк self и other (словарь other продолжает словарь self)"""
+        present = np.concatenate([self.present, other.present])
+        if self.kind == "codes":
+            return Column("codes", present, codes=np.concatenate([self.codes, other.codes]), labels=other.labels)
+        if self.kind == "multi":
+            matrix = np.zeros((present.size, len(other.labels)), dtype=bool)
+            matrix[:self.present.size, :self.matrix.shape[1]] = self.matrix
+            matrix[self.present.size:] = other.matrix
+            return Column("multi", present, labels=other.labels, matrix=matrix)
+        return Column("numeric", present, values=np.concatenate([self.values, other.values]))
+
+
+@dataclass
+class AnswerColumns:
+    """Колонки ответов опроса"""
+    size: int
+    columns: Dict[str, Column]
+
+
+def _numeric(value: Any) -> float:
+    if isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return np.nan
+    return np.nan
+
+
+def _codes_column(question: Question, values: List[Any], labels: Optional[List[str]] = None) -> Column:
+    labels = list(question.options if labels is None else labels)
+    lookup = {label: code for code, label in enumerate(labels)}
+    codes = np.full(len(values), -1, dtype=np.int32)
+    for row, value in enumerate(values):
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            value = str(value)
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(labels)
+            labels.append(value)
+        codes[row] = code
+    return Column("codes", codes >= 0, codes=codes, labels=labels)
+
+
+def _multi_column(question: Question, values: List[Any], labels: Optional[List[str]] = None) -> Column:
+    labels = list(question.options if labels is None else labels)
+    lookup = {label: code for code, label in enumerate(labels)}
+    rows: List[int] = []
+    cols: List[int] = []
+    present = np.zeros(len(values), dtype=bool)
+    for row, value in enumerate(values):
+        if value is None:
+            continue
+        items = value if isinstance(value, list) else [value]
+        present[row] = True
+        for item in items:
+            if not isinstance(item, str):
+                item = str(item)
+            code = lookup.get(item)
+            if code is None:
+                code = lookup[item] = len(labels)
+                labels.append(item)
+            rows.append(row)
+            cols.append(code)
+    matrix = np.zeros((len(values), len(labels)), dtype=bool)
+    if rows:
+        matrix[rows, cols] = True
+    return Column("multi", present, labels=labels, matrix=matrix)
+
+
+def _numeric_column(values: List[Any]) -> Column:
+    array = np.fromiter((np.nan if value is None else _numeric(value) for value in values), dtype=np.float64, count=len(values))
+    return Column("numeric", ~np.isnan(array), values=array)
+
+
+def build_column(question: Question, values: List[Any], labels: Optional[List[str]] = None) -> Column:
+    """labels - словарь значений, который продолжают новые значения"""
+    if question.type == "checkbox":
+        return _multi_column(question, values, labels)
+    if question.type == "scale":
+        return _numeric_column(values)
+    return _codes_column(question, values, labels)
+
+
+def build_columns(structure: QuizStructure, answers_list: Iterable[Dict[str, Any]]) -> AnswerColumns:
+    """Колонки по всем вопросам структуры из списка Response.answers"""
+    answers_list = [answers if isinstance(answers, dict) else {} for answers in answers_list]
+    columns = {}
+    for question in structure.questions:
+        values = [answers.get(question.id) for answers in answers_list]
+        columns[question.id] = build_column(question, values)
+    return AnswerColumns(len(answers_list), columns)
+
+
+def extend_columns(structure: QuizStructure, columns: AnswerColumns, answers_list: Iterable[Dict[str, Any]]) -> AnswerColumns:
+    """Новые колонки: строки columns и затем answers_list (columns не меняются)"""
+    answers_list = [answers if isinstance(answers, dict) else {} for answers in answers_list]
+    extended = {}
+    for question in structure.questions:
+        column = columns.columns[question.id]
+        values = [answers.get(question.id) for answers in answers_list]
+        extended[question.id] = column.concat(build_column(question, values, column.labels))
+    return AnswerColumns(columns.size + len(answers_list), extended)
@@ -0,0 +1,213 @@
+"""
+Проверка и нормализация ответов перед записью
+
+Из скомпилированной структуры опроса (quiz_structure) один раз на версию
+собирается AnswerValidator: для каждого вопроса своя функция проверки по
+типу. В БД попадают только ответы на вопросы опроса в нормальной форме:
+
+- radio: строка из вариантов
+- checkbox: непустой список вариантов без повторов, в порядке вариантов
+- scale: int в границах шкалы ("7" -> 7)
+- text: строка без крайних пробелов не длиннее ANSWER_TEXT_MAX_LENGTH
+
+Пустой ответ на необязательный вопрос отбрасывается. В опросе с
+ветвлениями (services/branching) обязательность проверяется только для
+вопросов на пути респондента, а ответы на вопросы вне пути (остались
+после возврата назад и смены ответа) отбрасываются. Ошибки собираются
+по всем вопросам и отдаются 422 в формате ошибок валидации FastAPI.
+"""
+from typing import Any, Callable, Dict, List
+
+from services.branching import get_branching
+from services.quiz_structure import Question, QuizStructure, parse_int
+
+# Ответы без значения
+EMPTY = (None, "", [])
+
+# Больше ошибок не собирается (payload с тысячами лишних ключей)
+MAX_ERRORS = 50
+
+
+class AnswerValidationError(Exception):
+    """Ответы не прошли проверку"""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__(f"{len(errors)} invalid answers")
+        self.errors = errors
+
+
+class _Invalid(Exception):
+    def __init__(self, message: str, error_type: str = "value_error"):
+        super().__init__(message)
+        self.message = message
+        self.error_type = error_type
+
+
+Checker = Callable[[Any], Any]
+
+
+def _radio(question: Question) -> Checker:
+    options = frozenset(question.options)
+
+    def check(value: Any) -> str:
+        if not isinstance(value, str):
+            raise _Invalid("Expected one option", "string_type")
+        if value not in options:
+            raise _Invalid("Unknown option", "enum")
+        return value
+
+    return check
+
+
+def _checkbox(question: Question) -> Checker:
+    order = {option: position for position, option in enumerate(question.options)}
+
+    def check(value: Any) -> List[str]:
+        if not isinstance(value, list):
+            raise _Invalid("Expected a list of options", "list_type")
+        selected = set()
+        for item in value:
+            if not isinstance(item, str) or item not in order:
+                raise _Invalid("Unknown option", "enum")
+            selected.add(item)
+        return sorted(selected, key=order.__getitem__)
+
+    return check
+
+
+def _scale(question: Question) -> Checker:
+    low, high = question.min, question.max
+
+    def check(value: Any) -> int:
+        # bool - подкласс int, но на шкале не значение
+        if isinstance(value, bool):
+            raise _Invalid("Expected an integer", "int_type")
+        if isinstance(value, str):
+            parsed = parse_int(value)
+            if parsed is None:
+                raise _Invalid("Expected an integer", "int_type")
+            value = parsed
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        elif not isinstance(value, int):
+            raise _Invalid("Expected an integer", "int_type")
+        if not low <= value <= high:
+            raise _Invalid(f"Expected a value from {low} to {high}", "less_than_equal")
+        return value
+
+    return check
+
+
+def _text(question: Question, max_length: int) -> Checker:
+    def check(value: Any) -> str:
+        if not isinstance(value, str):
+            raise _Invalid("Expected a string", "string_type")
+        value = value.strip()
+        if len(value) > max_length:
+            raise _Invalid(f"Text is longer than {max_length} characters", "string_too_long")
+        return value
+
+    return check
+
+
+def _scalar(question: Question, max_text_length: int) -> Checker:
+    """Вопрос неизвестного типа: принимается строка, число или bool"""
+    text = _text(question, max_text_length)
+
+    def check(value: Any) -> Any:
+        if isinstance(value, str):
+            return text(value)
+        if isinstance(value, (int, float, bool)):
+            return value
+        raise _Invalid("Expected a scalar value", "type_error")
+
+    return check
+
+
+CHECKERS: Dict[str, Callable[[Question], Checker]] = {
+    "radio": _radio,
+    "checkbox": _checkbox,
+    "scale": _scale,
+}
+
+
+def _checker(question: Question, max_text_length: int) -> Checker:
+    if question.type == "text":
+        return _text(question, max_text_length)
+    factory = CHECKERS.get(question.type)
+    return factory(question) if factory is not None else _scalar(question, max_text_length)
+
+
+class AnswerValidator:
+    """Проверка ответов для одной версии опроса"""
+
+    def __init__(self, structure: QuizStructure, max_text_length: int):
+        self.checkers: Dict[str, Checker] = {
+            question.id: _checker(question, max_text_length)
+            for question in structure.questions
+        }
+        self.required = tuple(question.id for question in structure.questions if question.required)
+        graph = get_branching(structure)
+        self.graph = None if graph.linear else graph
+
+    def validate(self, answers: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Нормализованные ответы
+
+        Raises:
+            AnswerValidationError: со списком ошибок по вопросам
+        """
+        errors: List[Dict[str, Any]] = []
+        normalized: Dict[str, Any] = {}
+
+        for question_id, value in answers.items():
+            if len(errors) >= MAX_ERRORS:
+                break
+            check = self.checkers.get(question_id)
+            if check is None:
+                errors.append(_error(question_id, "Unknown question", "extra_forbidden"))
+                continue
+            if value in EMPTY:
+                continue
+            try:
+                value = check(value)
+            except _Invalid as e:
+                errors.append(_error(question_id, e.message, e.error_type))
+                continue
+            # Пустой после нормализации (пробелы, пустой выбор) - как отсутствующий
+            if value not in EMPTY:
+                normalized[question_id] = value
+
+        required = self.required
+        if self.graph is not None:
+            on_path = {self.graph.ids[index] for index in self.graph.path(normalized)}
+            normalized = {key: value for key, value in normalized.items() if key in on_path}
+            required = [question_id for question_id in required if question_id in on_path]
+
+        for question_id in required:
+            if question_id not in normalized and not _has_error(errors, question_id):
+                errors.append(_error(question_id, "Answer is required", "missing"))
+
+        if errors:
+            raise AnswerValidationError(errors)
+        return normalized
+
+
+def _error(question_id: str, message: str, error_type: str) -> Dict[str, Any]:
+    return {"loc": ["body", "answers", question_id], "msg": message, "type": error_type}
+
+
+def _has_error(errors: List[Dict[str, Any]], question_id: str) -> bool:
+    return any(error["loc"][2] == question_id for error in errors)
+
+
+def get_validator(structure: QuizStructure, max_text_length: int) -> AnswerValidator:
+    """
+    Валидатор версии опроса (собирается один раз и живет вместе со структурой)
+
+    max_text_length - ANSWER_TEXT_MAX_LENGTH из настроек приложения.
+    """
+    return structure.derive(
+        f"answer_validator:{max_text_length}",
+        lambda compiled: AnswerValidator(compiled, max_text_length)
+    )
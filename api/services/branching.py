@@ -0,0 +1,357 @@
+"""
+Условная логика опроса (ветвления)
+
+Правила вопросов из quiz_structure компилируются в граф переходов
+BranchGraph: вершины - вопросы по индексу, конец опроса - индекс
+size. Граф обязан быть ациклическим; при компиляции один раз считаются
+топологический порядок, достижимость (битовые маски) и длина самого
+длинного оставшегося пути.
+
+Правило - условие на ответ текущего вопроса:
+    eq, ne      - равно / не равно значению (radio, scale, text)
+    in          - одно из значений (radio, scale); для checkbox - выбран любой
+    contains    - вариант выбран (checkbox)
+    gt, gte, lt, lte - сравнение (scale)
+    answered    - ответ есть (value: true) или пропущен (false)
+
+Правила проверяются по порядку, первое выполненное задает переход;
+иначе - next вопроса или следующий вопрос. Каждое правило умеет
+проверить один ответ (test) и колонку ответов NumPy (mask), поэтому пути
+тысяч респондентов восстанавливаются за несколько векторных операций
+на вершину (bulk_paths).
+"""
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.quiz_structure import Question, QuizStructure, parse_int
+
+logger = logging.getLogger(__name__)
+
+END = "end"
+
+# Допустимые операции по типу вопроса
+TYPE_OPS = {
+    "radio": {"eq", "ne", "in", "answered"},
+    "checkbox": {"contains", "in", "answered"},
+    "scale": {"eq", "ne", "in", "gt", "gte", "lt", "lte", "answered"},
+    "text": {"eq", "ne", "answered"},
+}
+DEFAULT_OPS = {"eq", "ne", "answered"}
+
+_COMPARE = {
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+
+class BranchingError(ValueError):
+    """Логика опроса не компилируется (неизвестные переходы, циклы и т.п.)"""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__("; ".join(error["msg"] for error in errors))
+        self.errors = errors
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class Rule:
+    """Условие перехода на ответ вопроса"""
+
+    __slots__ = ("op", "value", "target", "question_type")
+
+    def __init__(self, op: str, value: Any, target: int, question_type: str):
+        self.op = op
+        self.value = value
+        self.target = target
+        self.question_type = question_type
+
+    def test(self, answer: Any) -> bool:
+        op, value = self.op, self.value
+        if op == "answered":
+            return (answer is not None) == value
+        if answer is None:
+            return False
+        if self.question_type == "checkbox":
+            selected = answer if isinstance(answer, list) else [answer]
+            if op == "contains":
+                return value in selected
+            return any(item in value for item in selected)
+        if self.question_type == "scale":
+            # Нечисловой ответ не выполняет ни одного условия шкалы
+            if isinstance(answer, str):
+                answer = parse_int(answer)
+            if not _is_number(answer):
+                return False
+        if op == "eq":
+            return answer == value
+        if op == "ne":
+            return answer != value
+        if op == "in":
+            return answer in value
+        return _COMPARE[op](answer, value)
+
+    def mask(self, column):
+        """Вектор выполнения условия по колонке answer_columns.Column"""
+        import numpy as np
+
+        op, value = self.op, self.value
+        if op == "answered":
+            return column.present if value else ~column.present
+        if column.kind == "multi":
+            codes = [column.code(item) for item in ([value] if op == "contains" else value)]
+            codes = [code for code in codes if code >= 0]
+            if not codes:
+                return np.zeros(column.present.shape, dtype=bool)
+            return column.matrix[:, codes].any(axis=1)
+        if column.kind == "numeric":
+            values = column.values
+            with np.errstate(invalid="ignore"):
+                if op == "eq":
+                    return values == value
+                if op == "ne":
+                    return column.present & (values != value)
+                if op == "in":
+                    return np.isin(values, np.asarray(value, dtype=np.float64))
+                return _COMPARE[op](values, value)
+        # codes
+        if op == "in":
+            codes = [code for code in (column.code(item) for item in value) if code >= 0]
+            return np.isin(column.codes, codes) if codes else np.zeros(column.present.shape, dtype=bool)
+        code = column.code(value)
+        if op == "eq":
+            return column.codes == code if code >= 0 else np.zeros(column.present.shape, dtype=bool)
+        return column.present & (column.codes != code)
+
+    def to_published(self) -> List[Any]:
+        return [self.op, self.value, self.target]
+
+
+def _rule_value(question: Question, op: str, value: Any) -> Any:
+    """Значение правила в типе ответов вопроса; ValueError - некорректно"""
+    if op == "answered":
+        if not isinstance(value, bool):
+            raise ValueError("value must be true or false")
+        return value
+
+    values = value if op == "in" else [value]
+    if not isinstance(values, list) or not values:
+        raise ValueError("value must be a non-empty list")
+
+    if question.type == "scale":
+        if not all(_is_number(item) for item in values):
+            raise ValueError("value must be a number")
+    elif question.type in ("radio", "checkbox"):
+        unknown = [item for item in values if item not in question.options]
+        if unknown:
+            raise ValueError(f"unknown options: {unknown}")
+    elif not all(isinstance(item, str) for item in values):
+        raise ValueError("value must be a string")
+
+    return list(values) if op == "in" else values[0]
+
+
+class BranchGraph:
+    """Скомпилированный граф переходов одной версии опроса"""
+
+    def __init__(self, structure: QuizStructure):
+        questions = structure.questions
+        self.ids: Tuple[str, ...] = tuple(question.id for question in questions)
+        self.size = size = len(questions)
+        errors: List[Dict[str, Any]] = []
+
+        def target_index(question_id: str, goto: str, loc: List[Any]) -> Optional[int]:
+            if goto == END:
+                return size
+            index = structure.index.get(goto)
+            if index is None:
+                errors.append(_error(loc, f"{question_id}: unknown goto '{goto}'"))
+            elif questions[index].id == question_id:
+                errors.append(_error(loc, f"{question_id}: goto to itself"))
+                index = None
+            return index
+
+        rules: List[Tuple[Rule, ...]] = []
+        defaults: List[int] = []
+        for position, question in enumerate(questions):
+            allowed = TYPE_OPS.get(question.type, DEFAULT_OPS)
+            compiled = []
+            for number, (op, value, goto) in enumerate(question.rules):
+                loc = [question.id, "logic", number]
+                if op not in allowed:
+                    errors.append(_error(loc, f"{question.id}: operation '{op}' is not allowed for {question.type}"))
+                    continue
+                try:
+                    value = _rule_value(question, op, value)
+                except ValueError as e:
+                    errors.append(_error(loc, f"{question.id}: {e}"))
+                    continue
+                target = target_index(question.id, goto, loc)
+                if target is not None:
+                    compiled.append(Rule(op, value, target, question.type))
+            rules.append(tuple(compiled))
+
+            default = position + 1
+            if question.next is not None:
+                target = target_index(question.id, question.next, [question.id, "next"])
+                default = position + 1 if target is None else target
+            defaults.append(default)
+
+        self.rules: Tuple[Tuple[Rule, ...], ...] = tuple(rules)
+        self.defaults: Tuple[int, ...] = tuple(defaults)
+        self.successors: Tuple[Tuple[int, ...], ...] = tuple(
+            tuple(dict.fromkeys([rule.target for rule in self.rules[i]] + [self.defaults[i]]))
+            for i in range(size)
+        )
+
+        self.order = self._topological_order(errors)
+        if errors:
+            raise BranchingError(errors)
+
+        # Достижимость: бит j в reach[i] - из вопроса i можно попасть в j
+        reach = [0] * size
+        longest = [0] * (size + 1)
+        for i in reversed(self.order):
+            mask = 1 << i
+            for target in self.successors[i]:
+                if target < size:
+                    mask |= reach[target]
+                longest[i] = max(longest[i], longest[target] + 1)
+            reach[i] = mask
+        self.reach: Tuple[int, ...] = tuple(reach)
+        # Сколько вопросов еще может быть показано, включая текущий
+        self.longest: Tuple[int, ...] = tuple(longest)
+        self.reachable = reach[0] if size else 0
+        self.linear = all(
+            not self.rules[i] and self.defaults[i] == i + 1 for i in range(size)
+        )
+
+    def _topological_order(self, errors: List[Dict[str, Any]]) -> Tuple[int, ...]:
+        incoming = [0] * self.size
+        for i in range(self.size):
+            for target in self.successors[i]:
+                if target < self.size:
+                    incoming[target] += 1
+        ready = [i for i in range(self.size) if incoming[i] == 0]
+        order = []
+        while ready:
+            i = ready.pop()
+            order.append(i)
+            for target in self.successors[i]:
+                if target < self.size:
+                    incoming[target] -= 1
+                    if incoming[target] == 0:
+                        ready.append(target)
+        if len(order) < self.size:
+            cycle = [self.ids[i] for i in range(self.size) if incoming[i] > 0]
+            errors.append(_error([], f"logic contains a cycle through: {', '.join(cycle)}"))
+        return tuple(order)
+
+    # ---- один респондент ----
+
+    def is_reachable(self, question_id: str) -> bool:
+        index = self.ids.index(question_id)
+        return bool(self.reachable >> index & 1)
+
+    def next_index(self, index: int, answer: Any) -> int:
+        for rule in self.rules[index]:
+            if rule.test(answer):
+                return rule.target
+        return self.defaults[index]
+
+    def next_question(self, current: Optional[str], answers: Dict[str, Any]) -> Tuple[Optional[str], int]:
+        """
+        Следующий вопрос после current (None - первый вопрос)
+
+        Returns:
+            (id вопроса или None в конце, сколько вопросов еще может быть показано)
+        """
+        if current is None:
+            index = 0
+        else:
+            position = self.ids.index(current)
+            index = self.next_index(position, answers.get(current))
+        if index >= self.size:
+            return None, 0
+        return self.ids[index], self.longest[index]
+
+    def path(self, answers: Dict[str, Any]) -> List[int]:
+        """Индексы вопросов, которые увидит респондент с такими ответами"""
+        visited = []
+        index = 0
+        while index < self.size:
+            visited.append(index)
+            index = self.next_index(index, answers.get(self.ids[index]))
+        return visited
+
+    # ---- много респондентов ----
+
+    def bulk_paths(self, columns):
+        """
+        Пройденные вопросы для всех ответов (answer_columns.AnswerColumns)
+
+        Returns:
+            np.ndarray (N x size, bool): респондент n видел вопрос i
+        """
+        import numpy as np
+
+        visited = np.zeros((columns.size, self.size), dtype=bool)
+        if not self.size or not columns.size:
+            return visited
+        visited[:, 0] = True
+        # В топологическом порядке все входящие переходы вопроса уже посчитаны
+        for i in self.order:
+            remaining = visited[:, i].copy()
+            if not remaining.any():
+                continue
+            column = columns.columns[self.ids[i]]
+            for rule in self.rules[i]:
+                matched = remaining & rule.mask(column)
+                if rule.target < self.size:
+                    visited[:, rule.target] |= matched
+                remaining &= ~matched
+            if self.defaults[i] < self.size:
+                visited[:, self.defaults[i]] |= remaining
+        return visited
+
+    def to_published(self, index: int) -> Dict[str, Any]:
+        """Переходы вопроса в компактной форме: индексы вместо id, size - конец"""
+        published: Dict[str, Any] = {}
+        if self.rules[index]:
+            published["logic"] = [rule.to_published() for rule in self.rules[index]]
+        if self.defaults[index] != index + 1:
+            published["next"] = self.defaults[index]
+        return published
+
+
+def _error(loc: List[Any], message: str) -> Dict[str, Any]:
+    return {"loc": ["body", "structure", "questions", *loc], "msg": message, "type": "branching"}
+
+
+def _linear(structure: QuizStructure) -> BranchGraph:
+    return BranchGraph(QuizStructure(
+        tuple(Question(q.id, q.type, q.text, q.required, q.options, q.min, q.max, q.extra) for q in structure.questions),
+        structure.index
+    ))
+
+
+def _compile(structure: QuizStructure) -> BranchGraph:
+    try:
+        return BranchGraph(structure)
+    except BranchingError as e:
+        # Сохраненная до проверки логика: опрос проходится по порядку
+        logger.warning(f"Логика опроса не компилируется, переходы отключены: {e}")
+        return _linear(structure)
+
+
+def get_branching(structure: QuizStructure) -> BranchGraph:
+    """Граф переходов версии опроса (собирается один раз)"""
+    return structure.derive("branching", _compile)
+
+
+def check_branching(structure: QuizStructure):
+    """Проверка логики перед сохранением опроса; BranchingError со списком ошибок"""
+    BranchGraph(structure)
@@ -0,0 +1,149 @@
+"""
+Аналитика опроса по колонкам NumPy
+
+Колонки ответов опроса загружает и кэширует column_store.
+
+Статистика считается векторно и сохраняет формат aggregate_answers
+(question, type, total_answers, distribution, co_occurrence, average,
+sample_answers); для шкалы добавляются median, std, min, max, percentiles, ci95 и для
+шкалы 0-10 - группы NPS.
+"""
+import math
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from services.answer_columns import AnswerColumns, Column
+from services.quiz_structure import Question, QuizStructure
+
+PERCENTILES = (10, 25, 75, 90)
+
+# z для 95% доверительного интервала среднего (нормальное приближение)
+Z_95 = 1.96
+
+# Границы групп NPS на шкале 0-10
+NPS_SCALE = (0, 10)
+NPS_PROMOTER = 9
+NPS_PASSIVE = 7
+
+SAMPLE_ANSWERS = 5
+
+# Строк checkbox на одно умножение матриц совместного выбора
+CO_OCCURRENCE_CHUNK = 65536
+
+
+def _number(value: float) -> Any:
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+def _choice_statistics(question: Question, column: Column) -> Dict[str, Any]:
+    codes = column.codes[column.present]
+    counts = np.bincount(codes, minlength=len(column.labels))
+    return {
+        "question": question.text,
+        "type": question.type,
+        "total_answers": int(codes.size),
+        "distribution": {column.labels[code]: int(count) for code, count in enumerate(counts) if count}
+    }
+
+
+def _multi_statistics(question: Question, column: Column) -> Dict[str, Any]:
+    """Варианты checkbox по отдельности и матрица совместного выбора M.T @ M"""
+    rows = column.matrix[column.present]
+    pairs = np.zeros((rows.shape[1], rows.shape[1]), dtype=np.int64)
+    # Умножение через BLAS в float32 по блокам строк: счетчик блока точен
+    # (меньше 2**24), а копия не больше блока, а не всей матрицы N x k
+    for start in range(0, rows.shape[0], CO_OCCURRENCE_CHUNK):
+        chunk = rows[start:start + CO_OCCURRENCE_CHUNK].astype(np.float32)
+        pairs += (chunk.T @ chunk).astype(np.int64)
+    counts = np.diagonal(pairs).copy()
+    np.fill_diagonal(pairs, 0)
+    labels = column.labels
+    return {
+        "question": question.text,
+        "type": question.type,
+        "total_answers": int(rows.shape[0]),
+        "distribution": {labels[code]: int(count) for code, count in enumerate(counts) if count},
+        "co_occurrence": {
+            labels[code]: {labels[other]: int(pairs[code, other]) for other in np.flatnonzero(pairs[code])}
+            for code in np.flatnonzero(pairs.any(axis=1))
+        }
+    }
+
+
+def scale_statistics(question: Question, values: np.ndarray) -> Optional[Dict[str, Any]]:
+    """
+    Статистика шкалы по ответам без пропусков
+
+    Returns:
+        None, если ответов нет
+    """
+    total = int(values.size)
+    if not total:
+        return None
+
+    average = float(values.mean())
+    std = float(values.std(ddof=1)) if total > 1 else 0.0
+    margin = Z_95 * std / math.sqrt(total)
+    distinct, counts = np.unique(values, return_counts=True)
+
+    statistics = {
+        "question": question.text,
+        "type": question.type,
+        "total_answers": total,
+        "average": round(average, 2),
+        "median": _number(np.median(values)),
+        "std": round(std, 2),
+        "min": _number(values.min()),
+        "max": _number(values.max()),
+        "percentiles": {
+            f"p{percentile}": _number(value)
+            for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))
+        },
+        "ci95": [round(average - margin, 2), round(average + margin, 2)],
+        "distribution": {_number(value): int(count) for value, count in zip(distinct, counts)}
+    }
+
+    if (question.min, question.max) == NPS_SCALE:
+        promoters = int(np.count_nonzero(values >= NPS_PROMOTER))
+        detractors = int(np.count_nonzero(values < NPS_PASSIVE))
+        statistics["nps"] = {
+            "promoters": promoters,
+            "passives": total - promoters - detractors,
+            "detractors": detractors,
+            "score": round((promoters - detractors) * 100 / total, 1)
+        }
+
+    return statistics
+
+
+def _text_statistics(question: Question, column: Column) -> Dict[str, Any]:
+    rows = np.flatnonzero(column.present)
+    return {
+        "question": question.text,
+        "type": question.type,
+        "total_answers": int(rows.size),
+        "sample_answers": [column.labels[column.codes[row]] for row in rows[:SAMPLE_ANSWERS]]
+    }
+
+
+def analyze(structure: QuizStructure, columns: AnswerColumns) -> Dict[str, Any]:
+    """Аналитика по вопросам в формате aggregate_answers"""
+    questions_analytics = {}
+
+    for question in structure.questions:
+        column = columns.columns[question.id]
+        if question.type == "radio":
+            questions_analytics[question.id] = _choice_statistics(question, column)
+        elif question.type == "checkbox":
+            questions_analytics[question.id] = _multi_statistics(question, column)
+        elif question.type == "scale":
+            statistics = scale_statistics(question, column.values[column.present])
+            if statistics is not None:
+                questions_analytics[question.id] = statistics
+        elif question.type == "text":
+            questions_analytics[question.id] = _text_statistics(question, column)
+
+    return questions_analytics
+
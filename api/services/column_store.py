@@ -0,0 +1,145 @@
+"""
+Колонки ответов опроса для аналитики и сегментов
+
+Ответы опроса одним запросом загружаются в колонки answer_columns и
+кэшируются по опросу. Снимок колонок верен, пока не изменились вопросы
+и счетчики ответов опроса (response_count, last_response_at ведет
+триггер БД): новые ответы дочитываются по id и дописываются к колонкам,
+удаление ответов приводит к полной перезагрузке.
+
+numpy (answer_columns) импортируется лениво: модуль импортируется при
+старте воркера, чтобы настроить кэш.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from threading import Lock
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from common import invalidation
+from common.metrics import REGISTRY
+from config import Settings
+from database.models import Response
+from services.quiz_structure import Question, QuizStructure
+
+if TYPE_CHECKING:
+    from services.answer_columns import AnswerColumns
+
+COLUMN_LOADS = REGISTRY.counter(
+    "api_analytics_columns",
+    "Получение колонок ответов аналитики (memory | append | build)",
+    ("source",)
+)
+
+
+@dataclass(frozen=True)
+class ColumnSnapshot:
+    """Колонки ответов и счетчики опроса, которым они соответствуют"""
+    questions: Tuple[Question, ...]
+    response_count: int
+    last_response_at: Optional[datetime]
+    # Максимальный id загруженного ответа: новые дочитываются после него
+    max_id: int
+    columns: "AnswerColumns"
+
+
+class ColumnCache:
+    """LRU снимков колонок по опросу"""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, ColumnSnapshot]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, quiz_id: int) -> Optional[ColumnSnapshot]:
+        with self._lock:
+            snapshot = self._entries.get(quiz_id)
+            if snapshot is not None:
+                self._entries.move_to_end(quiz_id)
+            return snapshot
+
+    def put(self, quiz_id: int, snapshot: ColumnSnapshot):
+        with self._lock:
+            self._entries[quiz_id] = snapshot
+            self._entries.move_to_end(quiz_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, quiz_id: Optional[int] = None):
+        with self._lock:
+            if quiz_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(quiz_id, None)
+
+
+column_cache = ColumnCache()
+
+
+def configure(app_settings: Settings):
+    """Размер кэша по настройкам приложения (при старте воркера)"""
+    column_cache.max_entries = app_settings.ANALYTICS_CACHE_SIZE
+    column_cache.invalidate()
+
+
+def _fetch(db: Session, quiz_id: int, after_id: int = 0):
+    return db.query(Response.id, Response.answers).filter(
+        Response.quiz_id == quiz_id, Response.id > after_id
+    ).order_by(Response.id).all()
+
+
+def load_snapshot(db: Session, quiz, structure: QuizStructure) -> ColumnSnapshot:
+    """
+    Колонки ответов опроса (из кэша, с дочитыванием новых ответов или заново)
+
+    quiz - ORM объект с response_count и last_response_at (structure можно отложить).
+    """
+    from services.answer_columns import build_columns, extend_columns
+
+    snapshot = column_cache.get(quiz.id)
+    if snapshot is not None and snapshot.questions == structure.questions:
+        if (snapshot.response_count, snapshot.last_response_at) == (quiz.response_count, quiz.last_response_at):
+            COLUMN_LOADS.inc("memory")
+            return snapshot
+        if quiz.response_count > snapshot.response_count:
+            rows = _fetch(db, quiz.id, snapshot.max_id)
+            # Если между загрузками ответы удалялись, счетчик не сойдется
+            if snapshot.response_count + len(rows) == quiz.response_count:
+                snapshot = ColumnSnapshot(
+                    structure.questions, quiz.response_count, quiz.last_response_at,
+                    rows[-1].id if rows else snapshot.max_id,
+                    extend_columns(structure, snapshot.columns, [row.answers for row in rows])
+                )
+                column_cache.put(quiz.id, snapshot)
+                COLUMN_LOADS.inc("append")
+                return snapshot
+
+    rows = _fetch(db, quiz.id)
+    snapshot = ColumnSnapshot(
+        structure.questions, len(rows), quiz.last_response_at,
+        rows[-1].id if rows else 0,
+        build_columns(structure, [row.answers for row in rows])
+    )
+    column_cache.put(quiz.id, snapshot)
+    COLUMN_LOADS.inc("build")
+    return snapshot
+
+
+def load_columns(db: Session, quiz, structure: QuizStructure) -> "AnswerColumns":
+    """Колонки ответов опроса (см. load_snapshot)"""
+    return load_snapshot(db, quiz, structure).columns
+
+
+def _on_quiz_change(event: invalidation.ChangeEvent):
+    # Изменения отсекают вопросы и счетчики; удаленные опросы освобождают память
+    if event.op != "delete":
+        return
+    if not event.ids:
+        column_cache.invalidate()
+    for quiz_id in event.ids:
+        column_cache.invalidate(quiz_id)
+
+
+invalidation.bus.subscribe("quiz", _on_quiz_change)
@@ -0,0 +1,64 @@
+"""
+Кэш прохождения опросов для API
+"""
+from typing import Optional
+from sqlalchemy.orm import Session
+
+from config import Settings
+from common import invalidation
+from common.completion_cache import CompletionCache
+from common.metrics import REGISTRY, completion_cache_collector
+from database.models import Response
+
+completion_cache = CompletionCache()
+REGISTRY.add_collector(completion_cache_collector(completion_cache, "api"))
+
+
+def _on_quiz_change(event: invalidation.ChangeEvent):
+    # Удаление опроса удаляет и его ответы
+    if event.op != "delete":
+        return
+    if not event.ids:
+        completion_cache.invalidate()
+    for quiz_id in event.ids:
+        completion_cache.invalidate(quiz_id)
+
+
+def _on_response(event: invalidation.ChangeEvent):
+    # Ответ, принятый другим воркером или ботом
+    if event.op == "insert" and event.data:
+        completion_cache.add(event.data["quiz_id"], event.data["user_id"])
+
+
+invalidation.bus.subscribe("quiz", _on_quiz_change)
+invalidation.bus.subscribe("response", _on_response)
+invalidation.bus.on_flush(completion_cache.invalidate)
+
+
+def configure(app_settings: Settings):
+    """TTL кэша по настройкам приложения (при старте воркера)"""
+    completion_cache.ttl = app_settings.COMPLETION_CACHE_TTL
+    completion_cache.invalidate()
+
+
+def known_completion(db: Session, quiz_id: int, user_id: int) -> Optional[bool]:
+    """
+    Проверить прохождение опроса через кэш
+
+    При необходимости загружает список ответивших одним запросом
+    (index-only scan по uq_responses_quiz_user). "Не проходил" берется
+    из кэша, только пока шина инвалидации подключена и доносит ответы,
+    принятые другими воркерами и ботом.
+
+    Returns:
+        False - точно не проходил, True - точно проходил,
+        None - нужна точная проверка в БД
+    """
+    trusted = invalidation.bus.connected
+    known = completion_cache.check(quiz_id, user_id, trust_negative=trusted)
+    if known is not None or not trusted or not completion_cache.needs_load(quiz_id):
+        return known
+
+    user_ids = db.query(Response.user_id).filter(Response.quiz_id == quiz_id).all()
+    completion_cache.load(quiz_id, (row.user_id for row in user_ids))
+    return completion_cache.check(quiz_id, user_id)
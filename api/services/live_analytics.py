@@ -0,0 +1,278 @@
+"""
+Аналитика опроса в реальном времени
+
+submit_response в своей транзакции отправляет pg_notify в канал
+quiz_responses (id опроса, id ответа и ответы, если помещаются в payload).
+Каждый воркер слушает канал одним подключением (common.pg_notify) и
+раздает изменения подписчикам SSE этого воркера:
+
+- изменение от ответа считается один раз на воркер (answer_delta),
+  а не на каждого подписчика
+- у подписчика одно накопленное изменение: пока клиент не забрал
+  предыдущее событие, новые ответы складываются в него (merge_delta),
+  поэтому медленный клиент получает меньше событий, а не очередь
+- после переподключения LISTEN подписчики получают новый снимок
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import db
+from common.metrics import REGISTRY
+from common.pg_notify import PgListener, encode_payload
+from database.models import Response
+from services.analytics import aggregate_answers, answer_delta, merge_delta
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "quiz_responses"
+
+# Ответы с id не больше max_id - SNAPSHOT_WINDOW считаются вошедшими в снимок;
+# внутри окна проверяется точный набор id (ответ с меньшим id может
+# закоммититься позже снимка)
+SNAPSHOT_WINDOW = 10000
+
+LIVE_SUBSCRIBERS = REGISTRY.gauge(
+    "api_live_analytics_subscribers",
+    "Подписчики аналитики в реальном времени"
+)
+LIVE_EVENTS = REGISTRY.counter(
+    "api_live_analytics_events",
+    "События аналитики, отправленные подписчикам",
+    ("type",)
+)
+LIVE_COALESCED = REGISTRY.counter(
+    "api_live_analytics_coalesced",
+    "Ответы, объединенные с еще не отправленным изменением"
+)
+
+
+def publish_response(session: Session, response: Response):
+    """
+    pg_notify о новом ответе в транзакции session
+
+    Уведомление доставляется только после COMMIT; при откате его нет.
+    """
+    payload = encode_payload(
+        {"quiz_id": response.quiz_id, "response_id": response.id, "answers": response.answers},
+        optional=("answers",)
+    )
+    session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+
+
+class Subscriber:
+    """Подписчик SSE: накопленное изменение и флаг нового снимка"""
+
+    def __init__(self, quiz_id: int, questions: List[Dict[str, Any]]):
+        self.quiz_id = quiz_id
+        self.questions = questions
+        self.delta: Dict[str, Any] = {}
+        self.responses = 0
+        self.resync = False
+        self.closed = False
+        self.ready = asyncio.Event()
+        # До снимка изменения копятся с id ответов, чтобы отбросить вошедшие в снимок
+        self._early: Optional[List[Tuple[int, Dict[str, Any]]]] = []
+        self._max_id = 0
+        self._recent: Set[int] = set()
+
+    def set_snapshot(self, max_id: int, recent_ids: Set[int]):
+        early, self._early = self._early, None
+        self._max_id = max_id
+        self._recent = recent_ids
+        for response_id, delta in early:
+            self.offer(response_id, delta)
+
+    def _in_snapshot(self, response_id: int) -> bool:
+        if response_id > self._max_id:
+            return False
+        return response_id <= self._max_id - SNAPSHOT_WINDOW or response_id in self._recent
+
+    def offer(self, response_id: int, delta: Dict[str, Any]):
+        if self._early is not None:
+            self._early.append((response_id, delta))
+            return
+        if self._in_snapshot(response_id):
+            return
+        if self.responses:
+            LIVE_COALESCED.inc()
+        merge_delta(self.delta, delta)
+        self.responses += 1
+        self.ready.set()
+
+    def request_resync(self):
+        self.resync = True
+        self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    def restart(self):
+        """Перед новым снимком изменения снова копятся до его получения"""
+        self.take()
+        self.resync = False
+        self._early = []
+
+    def take(self) -> Tuple[int, Dict[str, Any]]:
+        """Забирает накопленное изменение"""
+        responses, delta = self.responses, self.delta
+        self.responses, self.delta = 0, {}
+        self.ready.clear()
+        return responses, delta
+
+
+class AnalyticsHub:
+    """Подписчики воркера по опросам и обработка уведомлений"""
+
+    def __init__(self):
+        self.subscribers: Dict[int, Set[Subscriber]] = {}
+        # Вопросы опроса от последнего подписчика: изменение считается по ним один раз
+        self.questions: Dict[int, List[Dict[str, Any]]] = {}
+        self.listener: Optional[PgListener] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def count(self) -> int:
+        return sum(len(subscribers) for subscribers in self.subscribers.values())
+
+    def attach(self, listener: PgListener):
+        """Получать уведомления через LISTEN воркера (вызывается в event loop)"""
+        self._loop = asyncio.get_running_loop()
+        self.listener = listener
+        listener.subscribe(CHANNEL, self.on_notify)
+        listener.on_reconnect(self.on_reconnect)
+
+    def close_all(self):
+        """Завершает все потоки (клиент EventSource переподключится к другому воркеру)"""
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.close()
+
+    def close_all_threadsafe(self):
+        """close_all из обработчика сигнала или другого потока"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.close_all)
+
+    def subscribe(self, quiz_id: int, questions: List[Dict[str, Any]]) -> Subscriber:
+        self.questions[quiz_id] = questions
+        subscriber = Subscriber(quiz_id, questions)
+        self.subscribers.setdefault(quiz_id, set()).add(subscriber)
+        LIVE_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self.subscribers.get(subscriber.quiz_id)
+        if subscribers is not None and subscriber in subscribers:
+            subscribers.discard(subscriber)
+            LIVE_SUBSCRIBERS.dec()
+            if not subscribers:
+                del self.subscribers[subscriber.quiz_id]
+                del self.questions[subscriber.quiz_id]
+
+    def on_notify(self, payload: str):
+        event = json.loads(payload)
+        subscribers = self.subscribers.get(event["quiz_id"])
+        if not subscribers:
+            return None
+        if "answers" not in event:
+            # Ответы не поместились в payload: догружаем из primary
+            return self._dispatch_loaded(event)
+        self._dispatch(event, subscribers)
+        return None
+
+    async def _dispatch_loaded(self, event: Dict[str, Any]):
+        event["answers"] = await run_in_threadpool(load_answers, event["response_id"])
+        subscribers = self.subscribers.get(event["quiz_id"])
+        if subscribers and event["answers"] is not None:
+            self._dispatch(event, subscribers)
+
+    def _dispatch(self, event: Dict[str, Any], subscribers: Set[Subscriber]):
+        delta = answer_delta(self.questions[event["quiz_id"]], event["answers"])
+        for subscriber in list(subscribers):
+            subscriber.offer(event["response_id"], delta)
+
+    def on_reconnect(self):
+        # Пока соединения не было, ответы могли прийти без уведомлений
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.request_resync()
+
+
+hub = AnalyticsHub()
+
+
+def load_answers(response_id: int) -> Optional[Dict[str, Any]]:
+    session = db.SessionLocal()
+    try:
+        row = session.query(Response.answers).filter(Response.id == response_id).first()
+        return row.answers if row else None
+    finally:
+        session.close()
+
+
+def load_snapshot(quiz_id: int, questions: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], int, Set[int]]:
+    """
+    Снимок аналитики из primary в формате aggregate_answers (поля, которые
+    складываются с answer_delta)
+
+    Returns:
+        (аналитика, максимальный id ответа, id ответов в окне SNAPSHOT_WINDOW)
+    """
+    session = db.SessionLocal()
+    try:
+        rows = session.query(Response.id, Response.answers).filter(Response.quiz_id == quiz_id).all()
+    finally:
+        session.close()
+
+    max_id = max((row.id for row in rows), default=0)
+    recent = {row.id for row in rows if row.id > max_id - SNAPSHOT_WINDOW}
+    snapshot = {
+        "quiz_id": quiz_id,
+        "total_responses": len(rows),
+        "questions_analytics": aggregate_answers(questions, [row.answers for row in rows]),
+    }
+    return snapshot, max_id, recent
+
+
+def sse_event(event: str, data: Any) -> str:
+    LIVE_EVENTS.inc(event)
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def stream(subscriber: Subscriber, heartbeat: float):
+    """
+    Поток SSE: snapshot, затем delta по мере новых ответов
+
+    delta: {"responses": число ответов, "questions_analytics": изменения}.
+    Новый snapshot приходит после потери уведомлений (переподключение LISTEN).
+    """
+    try:
+        # Через сколько переподключаться EventSource после закрытия потока
+        yield "retry: 3000\n\n"
+        while not subscriber.closed:
+            snapshot, max_id, recent = await run_in_threadpool(load_snapshot, subscriber.quiz_id, subscriber.questions)
+            subscriber.set_snapshot(max_id, recent)
+            yield sse_event("snapshot", snapshot)
+
+            while not (subscriber.resync or subscriber.closed):
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE: держит соединение через прокси
+                    yield ": ping\n\n"
+                    continue
+                if subscriber.resync or subscriber.closed:
+                    break
+                responses, delta = subscriber.take()
+                if responses:
+                    yield sse_event("delta", {"responses": responses, "questions_analytics": delta})
+
+            subscriber.restart()
+    finally:
+        hub.unsubscribe(subscriber)
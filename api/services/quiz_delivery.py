@@ -0,0 +1,320 @@
+"""
+Опубликованный опрос для респондентов
+
+Для активного опроса один раз на версию собирается артефакт: только то,
+что нужно для прохождения (вопросы из quiz_structure без полей редактора,
+варианты уже разрешены), сериализованный orjson и заранее сжатый gzip и,
+если установлен пакет brotli, br. Артефакт хранится:
+
+- в памяти воркера (LRU): повторная выдача - отдать готовые байты
+- на диске (PUBLISHED_CACHE_DIR): после перезапуска воркера артефакт
+  текущей версии читается с диска без загрузки structure из БД
+
+Запись в памяти сбрасывается событием шины инвалидации (изменение или
+удаление опроса). Пока LISTEN не подключен, версия сверяется с БД
+легким запросом (id, status, updated_at) на каждую выдачу.
+"""
+import gzip
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+from starlette.responses import Response as HTTPResponse
+
+import db
+from common import invalidation
+from common.metrics import REGISTRY
+from config import Settings
+from database.models import Quiz
+from services.branching import get_branching
+from services.quiz_structure import get_structure, quiz_version
+
+logger = logging.getLogger(__name__)
+
+# Меняется при изменении формата артефакта: старые файлы на диске не используются
+ARTIFACT_FORMAT = 2
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+PUBLISHED_REQUESTS = REGISTRY.counter(
+    "api_published_quiz_requests",
+    "Выдачи опубликованного опроса по источнику (memory | disk | build | not_modified)",
+    ("source",)
+)
+
+
+def _brotli():
+    """Модуль brotli, если установлен (опциональная зависимость)"""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+@dataclass(frozen=True)
+class PublishedQuiz:
+    """Готовые к отдаче байты опубликованного опроса"""
+    quiz_id: int
+    version: str
+    body: bytes
+    gzip: bytes
+    brotli: Optional[bytes] = None
+
+    @property
+    def etag(self) -> str:
+        # Слабый ETag: одно значение для всех Content-Encoding
+        return f'W/"{self.quiz_id}-{self.version}-{ARTIFACT_FORMAT}"'
+
+
+def build_payload(quiz) -> Dict[str, Any]:
+    """
+    Артефакт опроса в формате выдачи респонденту
+
+    Переходы вопросов - в компактной форме графа (logic: [[op, value,
+    индекс вопроса]], next: индекс; индекс = числу вопросов - конец),
+    чтобы клиент проходил опрос без запросов к API.
+    """
+    structure = get_structure(quiz)
+    graph = get_branching(structure)
+    return {
+        "format": ARTIFACT_FORMAT,
+        "id": quiz.id,
+        "version": quiz_version(quiz.updated_at),
+        "title": quiz.title,
+        "description": quiz.description,
+        "settings": quiz.settings or {},
+        "questions": [
+            {**question.to_published(), **graph.to_published(index)}
+            for index, question in enumerate(structure.questions)
+        ],
+    }
+
+
+def publish(quiz) -> PublishedQuiz:
+    """Сериализует и сжимает артефакт опроса"""
+    body = orjson.dumps(build_payload(quiz))
+    brotli = _brotli()
+    return PublishedQuiz(
+        quiz_id=quiz.id,
+        version=quiz_version(quiz.updated_at),
+        body=body,
+        gzip=gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+        brotli=brotli.compress(body, quality=BROTLI_QUALITY) if brotli else None
+    )
+
+
+class PublishedCache:
+    """
+    Артефакты в памяти (LRU) и на диске
+
+    Поколение опроса растет при каждом сбросе: артефакт, собранный по
+    данным, прочитанным до сброса, в память не попадает.
+    """
+
+    SUFFIXES = {"body": ".json", "gzip": ".json.gz", "brotli": ".json.br"}
+
+    def __init__(self, max_entries: int = 256, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.directory = Path(directory) if directory else None
+        self._entries: "OrderedDict[int, PublishedQuiz]" = OrderedDict()
+        self._generations: Dict[int, int] = {}
+        self._epoch = 0
+        self._lock = Lock()
+
+    def token(self, quiz_id: int) -> Tuple[int, int]:
+        with self._lock:
+            return self._epoch, self._generations.get(quiz_id, 0)
+
+    def get(self, quiz_id: int) -> Optional[PublishedQuiz]:
+        with self._lock:
+            published = self._entries.get(quiz_id)
+            if published is not None:
+                self._entries.move_to_end(quiz_id)
+            return published
+
+    def put(self, published: PublishedQuiz, token: Tuple[int, int]):
+        with self._lock:
+            if token != (self._epoch, self._generations.get(published.quiz_id, 0)):
+                return
+            self._entries[published.quiz_id] = published
+            self._entries.move_to_end(published.quiz_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, quiz_id: Optional[int] = None):
+        with self._lock:
+            if quiz_id is None:
+                self._epoch += 1
+                self._entries.clear()
+            else:
+                self._generations[quiz_id] = self._generations.get(quiz_id, 0) + 1
+                self._entries.pop(quiz_id, None)
+
+    # ---- диск ----
+
+    def _path(self, quiz_id: int, version: str, kind: str) -> Path:
+        return self.directory / f"{quiz_id}-{version}-v{ARTIFACT_FORMAT}{self.SUFFIXES[kind]}"
+
+    def load(self, quiz_id: int, version: str) -> Optional[PublishedQuiz]:
+        if self.directory is None:
+            return None
+        try:
+            body = self._path(quiz_id, version, "body").read_bytes()
+            compressed = self._path(quiz_id, version, "gzip").read_bytes()
+        except FileNotFoundError:
+            return None
+        brotli_path = self._path(quiz_id, version, "brotli")
+        return PublishedQuiz(
+            quiz_id=quiz_id,
+            version=version,
+            body=body,
+            gzip=compressed,
+            brotli=brotli_path.read_bytes() if brotli_path.exists() else None
+        )
+
+    def save(self, published: PublishedQuiz):
+        if self.directory is None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.remove(published.quiz_id)
+            # Сжатые файлы пишутся раньше тела: тело - признак полной записи
+            for kind in ("brotli", "gzip", "body"):
+                data = getattr(published, kind)
+                if data is None:
+                    continue
+                path = self._path(published.quiz_id, published.version, kind)
+                tmp = path.with_name(f".{path.name}.{os.getpid()}")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить опубликованный опрос {published.quiz_id}: {e}")
+
+    def remove(self, quiz_id: int):
+        """Удаляет файлы всех версий опроса"""
+        if self.directory is None or not self.directory.exists():
+            return
+        for path in self.directory.glob(f"{quiz_id}-*"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+cache = PublishedCache()
+
+
+def configure(app_settings: Settings):
+    """Размер и каталог кэша по настройкам приложения (при старте воркера)"""
+    cache.max_entries = app_settings.PUBLISHED_CACHE_SIZE
+    cache.directory = Path(app_settings.PUBLISHED_CACHE_DIR) if app_settings.PUBLISHED_CACHE_DIR else None
+    cache.invalidate()
+
+
+def load_published(quiz_id: int) -> Optional[PublishedQuiz]:
+    """
+    Артефакт текущей версии активного опроса (блокирующий, для threadpool)
+
+    Returns:
+        None, если опроса нет или он не активен
+    """
+    token = cache.token(quiz_id)
+    session = db.SessionLocal()
+    try:
+        row = session.query(Quiz.status, Quiz.updated_at).filter(Quiz.id == quiz_id).first()
+        if row is None or row.status != "active":
+            return None
+        version = quiz_version(row.updated_at)
+
+        published = cache.get(quiz_id)
+        if published is not None and published.version == version:
+            PUBLISHED_REQUESTS.inc("memory")
+            return published
+
+        published = cache.load(quiz_id, version)
+        if published is not None:
+            PUBLISHED_REQUESTS.inc("disk")
+        else:
+            quiz = session.query(Quiz).filter(Quiz.id == quiz_id).first()
+            if quiz is None or quiz.status != "active":
+                return None
+            published = publish(quiz)
+            cache.save(published)
+            PUBLISHED_REQUESTS.inc("build")
+    finally:
+        session.close()
+
+    cache.put(published, token)
+    return published
+
+
+def cached_published(quiz_id: int) -> Optional[PublishedQuiz]:
+    """Артефакт из памяти, если шина инвалидации гарантирует его актуальность"""
+    if not invalidation.bus.connected:
+        return None
+    published = cache.get(quiz_id)
+    if published is not None:
+        PUBLISHED_REQUESTS.inc("memory")
+    return published
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def published_response(published: PublishedQuiz, accept_encoding: str, if_none_match: Optional[str]) -> HTTPResponse:
+    """Готовые байты с ETag и Content-Encoding по Accept-Encoding"""
+    headers = {
+        "ETag": published.etag,
+        "Vary": "Accept-Encoding",
+        # Клиент хранит копию, но перепроверяет ее по ETag
+        "Cache-Control": "no-cache",
+    }
+
+    if if_none_match:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        if "*" in tags or published.etag in tags or published.etag[2:] in tags:
+            PUBLISHED_REQUESTS.inc("not_modified")
+            return HTTPResponse(status_code=304, headers=headers)
+
+    accepted = _accepted_encodings(accept_encoding or "")
+    if published.brotli is not None and "br" in accepted:
+        body, headers["Content-Encoding"] = published.brotli, "br"
+    elif "gzip" in accepted:
+        body, headers["Content-Encoding"] = published.gzip, "gzip"
+    else:
+        body = published.body
+    return HTTPResponse(content=body, media_type="application/json", headers=headers)
+
+
+def _on_quiz_change(event: invalidation.ChangeEvent):
+    if not event.ids:
+        cache.invalidate()
+        return
+    for quiz_id in event.ids:
+        cache.invalidate(quiz_id)
+        if event.op == "delete":
+            cache.remove(quiz_id)
+
+
+invalidation.bus.subscribe("quiz", _on_quiz_change)
+invalidation.bus.on_flush(cache.invalidate)
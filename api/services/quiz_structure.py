@@ -0,0 +1,247 @@
+"""
+Скомпилированная структура опроса
+
+quiz.structure - JSON редактора: вопросы могут ссылаться на общие
+списки вариантов (option_lists), варианты бывают строками или объектами,
+рядом с вопросами лежат служебные поля редактора. compile_structure
+один раз приводит его к неизменяемому QuizStructure, которым пользуются
+выдача опроса респондентам, проверка ответов и аналитика.
+
+Условная логика вопроса (проверяется и компилируется в services/branching):
+    "logic": [{"when": {"op": "eq", "value": "Да"}, "goto": "q5"}, ...],
+    "next": "q7"    # переход по умолчанию; "end" - завершить опрос
+
+Версия опроса - его updated_at: триггер БД и ORM меняют его при любом
+изменении structure/settings/status, поэтому скомпилированная структура
+кэшируется по (quiz_id, версия) и не требует явного сброса.
+"""
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from common import invalidation
+
+
+QUESTION_TYPES = ("radio", "checkbox", "scale", "text")
+
+# Поля вопроса, которые видит респондент (помимо id/type/text/required/options/min/max)
+RESPONDENT_FIELDS = ("description", "placeholder", "min_label", "max_label")
+
+# Шкала без границ в редакторе
+DEFAULT_SCALE = (1, 10)
+
+# Целое в строке ответа: только ASCII-цифры и ограниченная длина (int() принимает и "²", и "１")
+INTEGER_PATTERN = re.compile(r"-?[0-9]{1,9}")
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Question:
+    """Вопрос с разрешенными вариантами"""
+    id: str
+    type: str
+    text: str
+    required: bool = False
+    options: Tuple[str, ...] = ()
+    min: Optional[int] = None
+    max: Optional[int] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+    # Правила перехода (op, value, goto) в порядке проверки и переход по умолчанию
+    rules: Tuple[Tuple[str, Any, str], ...] = ()
+    next: Optional[str] = None
+
+    def to_published(self) -> Dict[str, Any]:
+        """Вопрос в формате выдачи респонденту (без пустых полей)"""
+        published: Dict[str, Any] = {"id": self.id, "type": self.type, "text": self.text}
+        if self.required:
+            published["required"] = True
+        if self.options:
+            published["options"] = list(self.options)
+        if self.type == "scale":
+            published["min"] = self.min
+            published["max"] = self.max
+        published.update(self.extra)
+        return published
+
+
+@dataclass(frozen=True)
+class QuizStructure:
+    """Вопросы опроса в порядке показа"""
+    questions: Tuple[Question, ...]
+    index: Dict[str, int]
+    # Производные объекты (валидатор ответов и т.п.) живут столько же, сколько версия
+    _derived: Dict[str, Any] = field(default_factory=dict, compare=False, repr=False)
+
+    def question(self, question_id: str) -> Optional[Question]:
+        position = self.index.get(question_id)
+        return None if position is None else self.questions[position]
+
+    def derive(self, name: str, factory: Callable[["QuizStructure"], T]) -> T:
+        """Объект, собранный из структуры один раз на версию опроса"""
+        value = self._derived.get(name)
+        if value is None:
+            value = self._derived.setdefault(name, factory(self))
+        return value
+
+
+def quiz_version(updated_at: Optional[datetime]) -> str:
+    """Версия опроса для ключей кэшей и ETag"""
+    return updated_at.strftime("%Y%m%d%H%M%S%f") if updated_at else "0"
+
+
+def parse_int(text: str) -> Optional[int]:
+    """Целое из строки ответа ("7", " -3 "); None - строка не целое число"""
+    text = text.strip()
+    return int(text) if INTEGER_PATTERN.fullmatch(text) else None
+
+
+def _option_text(option: Any) -> str:
+    if isinstance(option, dict):
+        for key in ("text", "label", "value"):
+            if option.get(key) is not None:
+                return str(option[key])
+        return ""
+    return str(option)
+
+
+def _resolve_options(raw: Dict[str, Any], option_lists: Dict[str, Any]) -> Tuple[str, ...]:
+    options = raw.get("options")
+    ref = raw.get("options_ref")
+    if options is None and ref is not None:
+        options = option_lists.get(ref)
+    if not isinstance(options, list):
+        return ()
+    # Пустые и повторяющиеся варианты редактора не показываются
+    return tuple(dict.fromkeys(text for text in map(_option_text, options) if text))
+
+
+def _scale_bound(value: Any, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _rules(raw: Dict[str, Any]) -> Tuple[Tuple[str, Any, str], ...]:
+    rules = []
+    for rule in raw.get("logic") or ():
+        if not isinstance(rule, dict):
+            rules.append(("", None, ""))
+            continue
+        when = rule.get("when") if isinstance(rule.get("when"), dict) else {}
+        rules.append((str(when.get("op") or ""), when.get("value"), str(rule.get("goto") or "")))
+    return tuple(rules)
+
+
+def compile_question(raw: Dict[str, Any], option_lists: Dict[str, Any]) -> Optional[Question]:
+    """Вопрос редактора -> Question; None для вопроса без id"""
+    if not isinstance(raw, dict) or raw.get("id") in (None, ""):
+        return None
+
+    question_type = str(raw.get("type") or "text")
+    options: Tuple[str, ...] = ()
+    low = high = None
+    if question_type in ("radio", "checkbox"):
+        options = _resolve_options(raw, option_lists)
+    elif question_type == "scale":
+        low = _scale_bound(raw.get("min"), DEFAULT_SCALE[0])
+        high = _scale_bound(raw.get("max"), DEFAULT_SCALE[1])
+        if low > high:
+            low, high = high, low
+
+    return Question(
+        id=str(raw["id"]),
+        type=question_type,
+        text=str(raw.get("text") or ""),
+        required=bool(raw.get("required", False)),
+        options=options,
+        min=low,
+        max=high,
+        extra={key: raw[key] for key in RESPONDENT_FIELDS if raw.get(key) not in (None, "")},
+        rules=_rules(raw),
+        next=str(raw["next"]) if raw.get("next") not in (None, "") else None
+    )
+
+
+def compile_structure(structure: Optional[Dict[str, Any]]) -> QuizStructure:
+    """quiz.structure -> QuizStructure (вопросы с повторным id отбрасываются)"""
+    structure = structure or {}
+    option_lists = structure.get("option_lists") or {}
+    questions: List[Question] = []
+    index: Dict[str, int] = {}
+
+    for raw in structure.get("questions") or ():
+        question = compile_question(raw, option_lists)
+        if question is None or question.id in index:
+            continue
+        index[question.id] = len(questions)
+        questions.append(question)
+
+    return QuizStructure(tuple(questions), index)
+
+
+class StructureCache:
+    """LRU скомпилированных структур по опросу; запись верна для своей версии"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[str, QuizStructure]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(
+        self,
+        quiz_id: int,
+        updated_at: Optional[datetime],
+        load: Callable[[], Optional[Dict[str, Any]]]
+    ) -> QuizStructure:
+        """load вызывается только при промахе (например, отложенная колонка structure)"""
+        version = quiz_version(updated_at)
+        with self._lock:
+            entry = self._entries.get(quiz_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(quiz_id)
+                return entry[1]
+
+        compiled = compile_structure(load())
+        with self._lock:
+            self._entries[quiz_id] = (version, compiled)
+            self._entries.move_to_end(quiz_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def invalidate(self, quiz_id: Optional[int] = None):
+        with self._lock:
+            if quiz_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(quiz_id, None)
+
+
+structure_cache = StructureCache()
+
+
+def get_structure(quiz) -> QuizStructure:
+    """
+    Скомпилированная структура опроса (ORM объект или строка с id, updated_at, structure)
+
+    У ORM объекта structure можно отложить (defer): колонка загрузится только при промахе кэша.
+    """
+    return structure_cache.get(quiz.id, quiz.updated_at, lambda: quiz.structure)
+
+
+def _on_quiz_change(event: invalidation.ChangeEvent):
+    # Изменения отсекает версия; удаленные опросы освобождают память
+    if event.op != "delete":
+        return
+    if not event.ids:
+        structure_cache.invalidate()
+    for quiz_id in event.ids:
+        structure_cache.invalidate(quiz_id)
+
+
+invalidation.bus.subscribe("quiz", _on_quiz_change)
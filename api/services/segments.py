@@ -0,0 +1,419 @@
+"""
+Сегменты и перекрестные таблицы по битовым индексам ответов
+
+Для опроса строится BitmapIndex: у каждого ответа порядковый номер
+(строка), у каждого значения вопроса - битовая карта строк, выбравших
+его (массив uint64, бит на ответ). Значения: варианты radio и checkbox,
+баллы шкалы; текстовые вопросы не индексируются.
+
+Фильтр сегмента - ИЛИ карт значений одного вопроса и И между вопросами,
+перекрестная таблица - число единиц (popcount) в пересечениях карт
+строки и колонки. Все операции - над словами по 64 ответа.
+
+Индекс хранится в памяти воркера и догоняет БД так же, как колонки
+аналитики (column_store): по счетчикам опроса response_count и
+last_response_at дочитываются ответы с большим id, при расхождении
+индекс строится заново. Воркер, принявший ответ, дописывает его в
+индекс сразу (record_response).
+
+numpy импортируется лениво: модуль нужен и при приеме ответов.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock, RLock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from common import invalidation
+from common.metrics import REGISTRY
+from config import Settings
+from services.quiz_structure import Question, QuizStructure
+
+WORD_BITS = 64
+
+# Вопросы без индекса (значения не повторяются)
+UNINDEXED_TYPES = ("text",)
+
+INDEX_UPDATES = REGISTRY.counter(
+    "api_segment_index_updates",
+    "Обновления битовых индексов ответов (memory | append | submit | build)",
+    ("source",)
+)
+
+
+class SegmentError(ValueError):
+    """Некорректный вопрос или фильтр сегмента"""
+
+
+def _words(bits: int) -> int:
+    return (bits + WORD_BITS - 1) // WORD_BITS
+
+
+def _index_value(question: Question, value: Any) -> Any:
+    """Значение ответа в ключе карты (как в answer_columns); None - не индексируется"""
+    if question.type == "scale":
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, str):
+            try:
+                value = float(value.strip())
+            except ValueError:
+                return None
+        if not isinstance(value, (int, float)):
+            return None
+        return int(value) if float(value).is_integer() else float(value)
+    return value if isinstance(value, str) else str(value)
+
+
+class BitmapIndex:
+    """Битовые карты значений по вопросам одного опроса"""
+
+    def __init__(self, structure: QuizStructure):
+        self.questions: Tuple[Question, ...] = structure.questions
+        self.indexed: Dict[str, Question] = {
+            question.id: question for question in structure.questions
+            if question.type not in UNINDEXED_TYPES
+        }
+        self.size = 0
+        self.capacity = 0  # в словах
+        self.answered: Dict[str, Any] = {}
+        # question_id -> {значение: карта}; порядок - варианты, затем встреченные значения
+        self.bitmaps: Dict[str, Dict[Any, Any]] = {}
+        # Счетчики опроса, которым соответствует индекс, и максимальный id ответа
+        self.response_count = 0
+        self.last_response_at: Optional[datetime] = None
+        self.max_id = 0
+        self.lock = RLock()
+
+        for question_id, question in self.indexed.items():
+            self.answered[question_id] = self._empty()
+            if question.type == "scale":
+                keys = range(question.min, question.max + 1)
+            else:
+                keys = question.options
+            self.bitmaps[question_id] = {key: self._empty() for key in keys}
+
+    def _empty(self):
+        import numpy as np
+
+        return np.zeros(self.capacity, dtype=np.uint64)
+
+    def _reserve(self, rows: int):
+        """Емкость под rows ответов (с запасом, чтобы дописывание было дешевым)"""
+        import numpy as np
+
+        needed = _words(rows)
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2, 16)
+
+        def grow(words):
+            grown = np.zeros(capacity, dtype=np.uint64)
+            grown[:words.size] = words
+            return grown
+
+        for question_id in self.indexed:
+            self.answered[question_id] = grow(self.answered[question_id])
+            bitmaps = self.bitmaps[question_id]
+            for key in bitmaps:
+                bitmaps[key] = grow(bitmaps[key])
+        self.capacity = capacity
+
+    def _bitmap(self, question_id: str, key: Any):
+        bitmaps = self.bitmaps[question_id]
+        bitmap = bitmaps.get(key)
+        if bitmap is None:
+            bitmap = bitmaps[key] = self._empty()
+        return bitmap
+
+    @staticmethod
+    def _set(words, positions):
+        import numpy as np
+
+        positions = np.asarray(positions, dtype=np.uint64)
+        np.bitwise_or.at(words, positions >> np.uint64(6), np.uint64(1) << (positions & np.uint64(63)))
+
+    def add(self, answers_list: Iterable[Dict[str, Any]]):
+        """Дописывает ответы в конец индекса"""
+        answers_list = [answers if isinstance(answers, dict) else {} for answers in answers_list]
+        if not answers_list:
+            return
+        self._reserve(self.size + len(answers_list))
+
+        for question_id, question in self.indexed.items():
+            answered: List[int] = []
+            positions: Dict[Any, List[int]] = {}
+            for row, answers in enumerate(answers_list, start=self.size):
+                value = answers.get(question_id)
+                if value is None:
+                    continue
+                items = value if question.type == "checkbox" and isinstance(value, list) else [value]
+                keys = [key for key in (_index_value(question, item) for item in items) if key is not None]
+                if not keys:
+                    continue
+                answered.append(row)
+                for key in keys:
+                    positions.setdefault(key, []).append(row)
+            if answered:
+                self._set(self.answered[question_id], answered)
+            for key, rows in positions.items():
+                self._set(self._bitmap(question_id, key), rows)
+
+        self.size += len(answers_list)
+
+    def add_columns(self, columns):
+        """Строит карты из колонок answer_columns (пустой индекс)"""
+        import numpy as np
+
+        self._reserve(columns.size)
+
+        def pack(mask):
+            packed = np.packbits(mask, bitorder="little")
+            words = np.zeros(self.capacity, dtype=np.uint64)
+            words.view(np.uint8)[:packed.size] = packed
+            return words
+
+        for question_id, question in self.indexed.items():
+            column = columns.columns[question_id]
+            self.answered[question_id] = pack(column.present)
+            bitmaps = self.bitmaps[question_id]
+            if column.kind == "multi":
+                for code, label in enumerate(column.labels):
+                    bitmaps[label] = pack(column.matrix[:, code])
+            elif column.kind == "numeric":
+                present = column.values[column.present]
+                for value in np.unique(present):
+                    key = int(value) if float(value).is_integer() else float(value)
+                    bitmaps[key] = pack(column.values == value)
+            else:
+                for code, label in enumerate(column.labels):
+                    bitmaps[label] = pack(column.codes == code)
+
+        self.size = columns.size
+
+    # ---- запросы ----
+
+    def question(self, question_id: str) -> Question:
+        question = self.indexed.get(question_id)
+        if question is None:
+            if any(q.id == question_id for q in self.questions):
+                raise SegmentError(f"Question {question_id} cannot be used for segmentation")
+            raise SegmentError(f"Unknown question {question_id}")
+        return question
+
+    def keys(self, question_id: str) -> List[Any]:
+        """Значения вопроса в порядке вывода (шкала - по возрастанию)"""
+        keys = list(self.bitmaps[question_id])
+        if self.indexed[question_id].type == "scale":
+            keys.sort()
+        return keys
+
+    def all_rows(self):
+        """Карта всех ответов"""
+        import numpy as np
+
+        words = np.zeros(self.capacity, dtype=np.uint64)
+        full, rest = divmod(self.size, WORD_BITS)
+        words[:full] = np.uint64(0xFFFFFFFFFFFFFFFF)
+        if rest:
+            words[full] = np.uint64((1 << rest) - 1)
+        return words
+
+    def segment(self, filters: Dict[str, List[str]]):
+        """Карта ответов сегмента: И по вопросам, ИЛИ по значениям одного вопроса"""
+        import numpy as np
+
+        segment = self.all_rows()
+        for question_id, values in filters.items():
+            question = self.question(question_id)
+            matched = np.zeros(self.capacity, dtype=np.uint64)
+            for value in values:
+                bitmap = self.bitmaps[question_id].get(_index_value(question, value))
+                if bitmap is not None:
+                    matched |= bitmap
+            segment &= matched
+        return segment
+
+    def crosstab(self, row: str, col: str, filters: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Перекрестная таблица row x col по ответам сегмента"""
+        import numpy as np
+
+        self.question(row)
+        self.question(col)
+        segment = self.segment(filters)
+        row_keys, col_keys = self.keys(row), self.keys(col)
+
+        col_matrix = np.stack([self.bitmaps[col][key] for key in col_keys]) if col_keys else \
+            np.zeros((0, self.capacity), dtype=np.uint64)
+        table = []
+        row_totals = []
+        for key in row_keys:
+            rows = segment & self.bitmaps[row][key]
+            row_totals.append(int(np.bitwise_count(rows).sum()))
+            table.append([int(count) for count in np.bitwise_count(col_matrix & rows).sum(axis=1)])
+
+        segment_col = col_matrix & segment
+        return {
+            "row": {"question": row, "values": row_keys},
+            "col": {"question": col, "values": col_keys},
+            "segment_size": int(np.bitwise_count(segment).sum()),
+            "table": table,
+            "row_totals": row_totals,
+            "col_totals": [int(count) for count in np.bitwise_count(segment_col).sum(axis=1)],
+            # Ответили на оба вопроса (для checkbox суммы таблицы могут быть больше)
+            "answered_both": int(np.bitwise_count(segment & self.answered[row] & self.answered[col]).sum()),
+        }
+
+
+class IndexCache:
+    """LRU битовых индексов по опросу"""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, BitmapIndex]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, quiz_id: int) -> Optional[BitmapIndex]:
+        with self._lock:
+            index = self._entries.get(quiz_id)
+            if index is not None:
+                self._entries.move_to_end(quiz_id)
+            return index
+
+    def put(self, quiz_id: int, index: BitmapIndex):
+        with self._lock:
+            self._entries[quiz_id] = index
+            self._entries.move_to_end(quiz_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, quiz_id: Optional[int] = None):
+        with self._lock:
+            if quiz_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(quiz_id, None)
+
+
+index_cache = IndexCache()
+
+
+def configure(app_settings: Settings):
+    """Размер кэша по настройкам приложения (при старте воркера)"""
+    index_cache.max_entries = app_settings.ANALYTICS_CACHE_SIZE
+    index_cache.invalidate()
+
+
+def _in_sync(index: BitmapIndex, response_count: int, last_response_at: Optional[datetime]) -> bool:
+    return (index.response_count, index.last_response_at) == (response_count, last_response_at)
+
+
+def load_index(db, quiz, structure: QuizStructure) -> BitmapIndex:
+    """
+    Битовый индекс ответов опроса, догнанный до счетчиков quiz
+
+    quiz - ORM объект с response_count и last_response_at (structure можно отложить).
+    """
+    from database.models import Response
+    from services.column_store import load_snapshot
+
+    index = index_cache.get(quiz.id)
+    if index is not None and index.questions == structure.questions:
+        with index.lock:
+            if _in_sync(index, quiz.response_count, quiz.last_response_at):
+                INDEX_UPDATES.inc("memory")
+                return index
+            if quiz.response_count > index.response_count:
+                rows = db.query(Response.id, Response.answers).filter(
+                    Response.quiz_id == quiz.id, Response.id > index.max_id
+                ).order_by(Response.id).all()
+                # Если между загрузками ответы удалялись, счетчик не сойдется
+                if index.response_count + len(rows) == quiz.response_count:
+                    index.add(row.answers for row in rows)
+                    index.response_count = quiz.response_count
+                    index.last_response_at = quiz.last_response_at
+                    index.max_id = rows[-1].id if rows else index.max_id
+                    INDEX_UPDATES.inc("append")
+                    return index
+
+    # Индекс строится из колонок аналитики, догнанных до тех же счетчиков
+    snapshot = load_snapshot(db, quiz, structure)
+    index = BitmapIndex(structure)
+    with index.lock:
+        index.add_columns(snapshot.columns)
+        index.response_count = snapshot.response_count
+        index.last_response_at = snapshot.last_response_at
+        index.max_id = snapshot.max_id
+    index_cache.put(quiz.id, index)
+    INDEX_UPDATES.inc("build")
+    return index
+
+
+def crosstab(db, quiz, structure: QuizStructure, row: str, col: str, filters: Dict[str, List[str]]) -> Dict[str, Any]:
+    """
+    Перекрестная таблица по индексу опроса
+
+    Raises:
+        SegmentError: неизвестный или неиндексируемый вопрос
+    """
+    index = load_index(db, quiz, structure)
+    with index.lock:
+        result = index.crosstab(row, col, filters)
+        result["total_responses"] = index.size
+    return result
+
+
+def record_response(
+    quiz_id: int,
+    before: Tuple[int, Optional[datetime]],
+    after: Tuple[int, Optional[datetime]],
+    response,
+    answers: Dict[str, Any]
+):
+    """
+    Дописывает принятый ответ в индекс воркера
+
+    before / after - (response_count, last_response_at) опроса до вставки
+    и после COMMIT, response - записанный Response, answers - его
+    нормализованные ответы. Ответ дописывается, только если индекс был
+    догнан до before и кроме этого ответа счетчики никто не менял.
+    """
+    index = index_cache.get(quiz_id)
+    if index is None:
+        return
+    expected_last = max(
+        (moment for moment in (before[1], response.completed_at) if moment is not None), default=None
+    )
+    with index.lock:
+        if (
+            not _in_sync(index, *before)
+            or response.id <= index.max_id
+            or after != (before[0] + 1, expected_last)
+        ):
+            return
+        index.add([answers])
+        index.response_count, index.last_response_at = after
+        index.max_id = response.id
+    INDEX_UPDATES.inc("submit")
+
+
+def parse_filters(filters: Iterable[str]) -> Dict[str, List[str]]:
+    """["q1:Да", "q1:Нет", "q4:9"] -> {"q1": ["Да", "Нет"], "q4": ["9"]}"""
+    parsed: Dict[str, List[str]] = {}
+    for item in filters:
+        question_id, separator, value = item.partition(":")
+        if not separator or not question_id:
+            raise SegmentError(f"Invalid filter '{item}', expected question:value")
+        parsed.setdefault(question_id, []).append(value)
+    return parsed
+
+
+def _on_quiz_change(event: invalidation.ChangeEvent):
+    if event.op != "delete":
+        return
+    if not event.ids:
+        index_cache.invalidate()
+    for quiz_id in event.ids:
+        index_cache.invalidate(quiz_id)
+
+
+invalidation.bus.subscribe("quiz", _on_quiz_change)
@@ -1,25 +1,23 @@
 """
 Утилиты для аутентификации и валидации Telegram WebApp initData
 """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
-
 import hmac
 import hashlib
+import logging
 from urllib.parse import parse_qsl
 from typing import Dict, Optional
 import json
 
-from config import settings
+logger = logging.getLogger(__name__)
 
 
-def validate_init_data(init_data: str) -> Optional[Dict]:
+def validate_init_data(init_data: str, bot_token: str) -> Optional[Dict]:
     """
     Валидация initData от Telegram WebApp
     
     Args:
         init_data: Строка initData от Telegram
+        bot_token: Токен бота, которым подписан initData (BOT_TOKEN)
         
     Returns:
         Dict с данными пользователя или None если валидация не прошла
@@ -40,7 +38,7 @@ def validate_init_data(init_data: str) -> Optional[Dict]:
         # Создаем secret_key
         secret_key = hmac.new(
             key=b"WebAppData",
-            msg=settings.BOT_TOKEN.encode(),
+            msg=bot_token.encode(),
             digestmod=hashlib.sha256
         ).digest()
         
@@ -76,7 +74,7 @@ def validate_init_data(init_data: str) -> Optional[Dict]:
         }
         
     except Exception as e:
-        print(f"Error validating init_data: {e}")
+        logger.warning(f"Error validating init_data: {e}")
         return None
 
 
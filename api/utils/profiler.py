@@ -0,0 +1,235 @@
+"""
+Семплирующий профилировщик и снимки памяти для работающего воркера
+
+SamplingProfiler в отдельном потоке с заданным интервалом читает стеки
+всех потоков (sys._current_frames) и считает одинаковые стеки. Код
+приложения не инструментируется, поэтому накладные расходы зависят
+только от частоты семплирования, а event loop продолжает обслуживать
+запросы, пока идет профилирование.
+
+Результат отдается в формате speedscope (https://speedscope.app) или
+в collapsed формате flamegraph.pl ("a;b;c 42").
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# (файл, функция, строка начала функции)
+Frame = Tuple[str, str, int]
+
+# Листовые кадры простаивающих потоков: ожидание событий loop и очередей
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("base_events.py", "run_forever"),
+    ("runners.py", "run"),
+    ("thread.py", "_worker"),
+}
+
+
+class ProfilerBusyError(RuntimeError):
+    """Профилировщик уже запущен в этом процессе"""
+
+
+class SamplingProfiler:
+    """Профилировщик по стекам потоков"""
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self, own_ident: int, thread_names: Dict[int, str]):
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+
+            stack: List[Frame] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+                frame = frame.f_back
+
+            if not stack:
+                continue
+            if not self.include_idle and (os.path.basename(stack[0][0]), stack[0][1]) in IDLE_FRAMES:
+                continue
+
+            stack.reverse()
+            thread = ("<thread>", thread_names.get(ident, str(ident)), 0)
+            self.stacks[(thread, *stack)] += 1
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.is_set():
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            self._sample(own_ident, thread_names)
+            self.samples += 1
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.time() - self.started_at
+
+    def to_collapsed(self) -> str:
+        """Collapsed стеки для flamegraph.pl / speedscope"""
+        lines = []
+        for stack, count in self.stacks.most_common():
+            names = ";".join(_frame_name(frame) for frame in stack)
+            lines.append(f"{names} {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name: str = "oprosy-api") -> dict:
+        """Профиль в формате speedscope (sampled, вес - число семплов)"""
+        frames: List[dict] = []
+        index: Dict[Frame, int] = {}
+        samples: List[List[int]] = []
+        weights: List[int] = []
+
+        for stack, count in self.stacks.most_common():
+            sample = []
+            for frame in stack:
+                position = index.get(frame)
+                if position is None:
+                    position = index[frame] = len(frames)
+                    filename, function, line = frame
+                    frames.append({"name": function, "file": filename, "line": line} if line else {"name": f"thread {function}"})
+                sample.append(position)
+            samples.append(sample)
+            weights.append(count)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{name} pid={os.getpid()}",
+                "unit": "none",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": name,
+            "exporter": "oprosy sampling profiler",
+        }
+
+
+def _frame_name(frame: Frame) -> str:
+    filename, function, line = frame
+    if not line:
+        return f"thread {function}"
+    return f"{function} ({_short_path(filename)}:{line})"
+
+
+def _short_path(filename: str) -> str:
+    """Путь относительно site-packages или проекта, чтобы стеки были читаемыми"""
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    cwd = os.getcwd() + os.sep
+    return filename[len(cwd):] if filename.startswith(cwd) else filename
+
+
+_profile_lock = threading.Lock()
+
+
+def acquire_profiler() -> None:
+    """В процессе одновременно работает один профилировщик"""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("Profiler is already running in this worker")
+
+
+def release_profiler() -> None:
+    _profile_lock.release()
+
+
+# ==================== TRACEMALLOC ====================
+
+_previous_snapshot: Optional[tracemalloc.Snapshot] = None
+
+# Служебные аллокации самого tracemalloc и импорта не интересны
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def start_memory_tracing(frames: int) -> bool:
+    """Включает tracemalloc; False если он уже включен"""
+    global _previous_snapshot
+    if tracemalloc.is_tracing():
+        return False
+    _previous_snapshot = None
+    tracemalloc.start(frames)
+    return True
+
+
+def stop_memory_tracing():
+    global _previous_snapshot
+    _previous_snapshot = None
+    tracemalloc.stop()
+
+
+def _stat_entry(stat) -> dict:
+    frame = stat.traceback[0]
+    entry = {
+        "file": _short_path(frame.filename),
+        "line": frame.lineno,
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        entry["count_diff"] = stat.count_diff
+    if len(stat.traceback) > 1:
+        entry["traceback"] = [f"{_short_path(f.filename)}:{f.lineno}" for f in stat.traceback]
+    return entry
+
+
+def memory_snapshot(top: int = 25, group_by: str = "lineno", compare: bool = False) -> dict:
+    """
+    Топ аллокаций по данным tracemalloc
+
+    compare=True показывает рост с предыдущего снимка (между вызовами);
+    если предыдущего снимка нет, возвращается обычный топ.
+    """
+    global _previous_snapshot
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    current, peak = tracemalloc.get_traced_memory()
+
+    if compare and _previous_snapshot is not None:
+        stats = snapshot.compare_to(_previous_snapshot, group_by)
+    else:
+        stats = snapshot.statistics(group_by)
+    _previous_snapshot = snapshot
+
+    return {
+        "pid": os.getpid(),
+        "traced_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "traceback_limit": tracemalloc.get_traceback_limit(),
+        "group_by": group_by,
+        "compared": compare,
+        "top": [_stat_entry(stat) for stat in stats[:top]],
+    }
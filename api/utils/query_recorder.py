@@ -0,0 +1,147 @@
+"""
+Учет SQL запросов в рамках HTTP запроса
+
+События before/after_cursor_execute движка SQLAlchemy пишут каждый запрос
+в QueryRecorder текущего HTTP запроса (contextvar). По итогам запроса
+видно число запросов и время в БД, повторяющиеся формы запросов
+помечаются как вероятный N+1, медленные запросы логируются с планом.
+"""
+import logging
+import re
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import Settings
+from common.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+SLOW_QUERIES = REGISTRY.counter(
+    "api_db_slow_queries",
+    "Запросы дольше SLOW_QUERY_MS"
+)
+
+# Параметры psycopg2 (%(name)s, %s) и списки параметров IN (...)
+_PARAM_RE = re.compile(r"%\(\w+\)s|%s")
+_PARAM_LIST_RE = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Форма запроса: текст без значений параметров и лишних пробелов"""
+    shape = _PARAM_RE.sub("?", statement)
+    shape = _PARAM_LIST_RE.sub("?", shape)
+    return _SPACES_RE.sub(" ", shape).strip()
+
+
+class QueryRecorder:
+    """Статистика SQL запросов одного HTTP запроса"""
+
+    __slots__ = ("count", "duration", "shapes", "slow")
+
+    def __init__(self):
+        self.count = 0
+        # Суммарное время в БД, секунд
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+        self.slow: List[Tuple[float, str]] = []
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Формы запросов, выполненные threshold раз и больше (вероятный N+1)"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing"""
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"'
+
+
+_recorder: ContextVar[Optional[QueryRecorder]] = ContextVar("query_recorder", default=None)
+
+
+def start_recording() -> Tuple[QueryRecorder, object]:
+    """Начинает учет запросов в текущем контексте"""
+    recorder = QueryRecorder()
+    return recorder, _recorder.set(recorder)
+
+
+def stop_recording(token):
+    _recorder.reset(token)
+
+
+def current_recorder() -> Optional[QueryRecorder]:
+    return _recorder.get()
+
+
+def _explain(cursor, statement: str, parameters) -> str:
+    """
+    План запроса на том же подключении
+
+    Выполняется прямо через DBAPI курсор, поэтому не проходит через события
+    SQLAlchemy и не учитывается повторно. Savepoint защищает транзакцию
+    запроса, если EXPLAIN завершится ошибкой.
+    """
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute("SAVEPOINT query_recorder_explain")
+        try:
+            explain_cursor.execute("EXPLAIN " + statement, parameters)
+            plan = "\n".join(row[0] for row in explain_cursor.fetchall())
+        except Exception as e:
+            explain_cursor.execute("ROLLBACK TO SAVEPOINT query_recorder_explain")
+            plan = f"EXPLAIN failed: {e}"
+        explain_cursor.execute("RELEASE SAVEPOINT query_recorder_explain")
+        return plan
+    finally:
+        explain_cursor.close()
+
+
+def install_query_recorder(engine: Engine, settings: Settings):
+    """Подключает учет запросов к движку (порог медленных запросов - из settings)"""
+
+    # Время старта хранится в контексте выполнения запроса: при ошибке
+    # запроса контекст просто отбрасывается, ничего не остается на подключении
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.query_start = perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = perf_counter() - context.query_start
+
+        recorder = _recorder.get()
+        if recorder is not None:
+            recorder.record(statement, duration)
+
+        if duration * 1000 < settings.SLOW_QUERY_MS:
+            return
+
+        SLOW_QUERIES.inc()
+        if recorder is not None:
+            recorder.slow.append((duration, statement))
+
+        plan = ""
+        if (
+            settings.SLOW_QUERY_EXPLAIN
+            and not executemany
+            and statement.lstrip()[:6].upper() in ("SELECT", "WITH")
+        ):
+            try:
+                plan = "\n" + _explain(cursor, statement, parameters)
+            except Exception as e:
+                plan = f"\nEXPLAIN failed: {e}"
+
+        logger.warning(
+            f"Медленный запрос {duration * 1000:.1f} ms: {statement_shape(statement)}{plan}"
+        )
@@ -0,0 +1,58 @@
+"""
+Трассировка SQL запросов SQLAlchemy
+
+Каждый запрос курсора становится CLIENT спаном внутри спана HTTP запроса.
+Спаны открываются в before_cursor_execute и закрываются в
+after_cursor_execute или handle_error (со статусом ошибки).
+"""
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils.query_recorder import statement_shape
+
+# Длинные запросы (IN со списками) обрезаются
+MAX_STATEMENT_LENGTH = 2000
+
+
+def instrument_engine(engine: Engine, name: str = "primary"):
+    """Подключает спаны SQL запросов к движку"""
+    tracer = trace.get_tracer("oprosy.api.db")
+    database = engine.url.database
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        shape = statement_shape(statement)
+        operation = shape.split(" ", 1)[0].upper()
+        span = tracer.start_span(
+            f"{operation} {database}",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": "postgresql",
+                "db.name": database,
+                "db.operation": operation,
+                "db.statement": shape[:MAX_STATEMENT_LENGTH],
+                "db.pool": name,
+            }
+        )
+        conn.info.setdefault("trace_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            span = spans.pop()
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                span.set_attribute("db.rowcount", cursor.rowcount)
+            span.end()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("trace_spans") if conn is not None else None
+        if spans:
+            span = spans.pop()
+            span.record_exception(exception_context.original_exception)
+            span.set_status(Status(StatusCode.ERROR, str(exception_context.original_exception)))
+            span.end()
@@ -0,0 +1,162 @@
+"""
+Микро-бенчмарк слоя БД бота (bot/utils/database.py)
+
+Сравнивает задержку горячих запросов в двух режимах:
+- legacy: JSON передается текстом через json.dumps/json.loads,
+  UPDATE собирается заново под каждый набор kwargs;
+- current: orjson-кодеки JSONB на подключении и фиксированные запросы
+  из STATEMENTS.
+
+Все изменения выполняются в транзакции и откатываются.
+
+Запуск (нужна БД из bot/.env или переменных окружения DB_*):
+    python benchmarks/bot_database.py --iterations 2000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bot"))
+
+import asyncpg
+
+from config import load_config
+from utils.database import Database, STATEMENTS, USER_UPDATE_FIELDS, _update_args
+
+
+STRUCTURE = {
+    "questions": [
+        {"id": f"q{i}", "type": "radio", "text": f"Вопрос {i}", "options": ["A", "B", "C", "D"]}
+        for i in range(20)
+    ]
+}
+ANSWERS = {f"q{i}": random.choice("ABCD") for i in range(20)}
+
+
+def _legacy_update_sql(kwargs: dict) -> str:
+    """Старое построение UPDATE: новый текст для каждой комбинации полей"""
+    fields = ", ".join([f"{key} = ${i+2}" for i, key in enumerate(kwargs.keys())])
+    return f"UPDATE users SET {fields} WHERE telegram_id = $1 RETURNING *"
+
+
+def _random_user_update() -> dict:
+    fields = random.sample(USER_UPDATE_FIELDS[:-1], k=random.randint(1, 4))
+    return {field: f"value_{random.randint(0, 999)}" for field in fields}
+
+
+async def _measure(iterations: int, func) -> dict:
+    """Прогоняет func iterations раз и возвращает статистику в микросекундах"""
+    # Прогрев: первые вызовы платят за PREPARE и холодный кэш
+    for _ in range(max(1, iterations // 10)):
+        await func()
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - start) * 1e6)
+
+    samples.sort()
+    return {
+        "mean_us": round(statistics.fmean(samples), 1),
+        "p50_us": round(samples[len(samples) // 2], 1),
+        "p95_us": round(samples[int(len(samples) * 0.95)], 1),
+    }
+
+
+async def run_mode(conn: asyncpg.Connection, mode: str, iterations: int) -> dict:
+    """Прогоняет набор горячих запросов в указанном режиме"""
+    telegram_id = -random.randint(10**9, 2 * 10**9)
+    user = await conn.fetchrow(STATEMENTS["user_create"], telegram_id, "bench", "Bench", None, None, None)
+
+    if mode == "legacy":
+        quiz = await conn.fetchrow(
+            "INSERT INTO quizzes (creator_id, title, structure, settings) VALUES ($1, $2, $3, $4) RETURNING id",
+            user["id"], "bench", json.dumps(STRUCTURE), json.dumps({})
+        )
+
+        async def quiz_by_id():
+            row = await conn.fetchrow("SELECT * FROM quizzes WHERE id = $1", quiz["id"])
+            json.loads(row["structure"])
+
+        async def update_user():
+            kwargs = _random_user_update()
+            await conn.fetchrow(_legacy_update_sql(kwargs), telegram_id, *kwargs.values())
+
+        async def create_response():
+            await conn.execute(
+                "INSERT INTO responses (quiz_id, user_id, answers) VALUES ($1, $2, $3)",
+                quiz["id"], user["id"], json.dumps(ANSWERS)
+            )
+            await conn.execute("DELETE FROM responses WHERE quiz_id = $1", quiz["id"])
+    else:
+        await Database.init_connection(conn)
+        quiz = await conn.fetchrow(
+            "INSERT INTO quizzes (creator_id, title, structure, settings) VALUES ($1, $2, $3, $4) RETURNING id",
+            user["id"], "bench", STRUCTURE, {}
+        )
+
+        async def quiz_by_id():
+            await conn.fetchrow(STATEMENTS["quiz_by_id"], quiz["id"])
+
+        async def update_user():
+            kwargs = _random_user_update()
+            await conn.fetchrow(STATEMENTS["user_update"], telegram_id, *_update_args(USER_UPDATE_FIELDS, kwargs))
+
+        async def create_response():
+            await conn.execute(STATEMENTS["response_create"], quiz["id"], user["id"], ANSWERS)
+            await conn.execute("DELETE FROM responses WHERE quiz_id = $1", quiz["id"])
+
+    async def user_by_telegram_id():
+        await conn.fetchrow(STATEMENTS["user_by_telegram_id"], telegram_id)
+
+    return {
+        "user_by_telegram_id": await _measure(iterations, user_by_telegram_id),
+        "quiz_by_id": await _measure(iterations, quiz_by_id),
+        "update_user": await _measure(iterations, update_user),
+        "create_response": await _measure(iterations, create_response),
+    }
+
+
+async def main(iterations: int, statement_cache_size: int) -> dict:
+    config = load_config()
+    results = {}
+
+    for mode in ("legacy", "current"):
+        conn = await asyncpg.connect(
+            dsn=config.db.url,
+            statement_cache_size=statement_cache_size
+        )
+        try:
+            tx = conn.transaction()
+            await tx.start()
+            try:
+                results[mode] = await run_mode(conn, mode, iterations)
+            finally:
+                await tx.rollback()
+        finally:
+            await conn.close()
+
+    results["speedup"] = {
+        query: round(results["legacy"][query]["mean_us"] / results["current"][query]["mean_us"], 2)
+        for query in results["current"]
+    }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument(
+        "--statement-cache-size", type=int, default=100,
+        help="Размер кэша statements asyncpg (по умолчанию как в asyncpg)"
+    )
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(main(args.iterations, args.statement_cache_size)), indent=2))
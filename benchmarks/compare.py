@@ -0,0 +1,59 @@
+"""
+Сравнение результатов бенчмарка с сохраненным baseline
+
+    python benchmarks/compare.py micro                  # results/micro.json vs baseline/micro.json
+    python benchmarks/compare.py load --metric p95_ms --tolerance 0.25
+    python benchmarks/compare.py micro --update-baseline
+
+Код возврата 1, если хотя бы одна метрика ухудшилась больше допустимого.
+"""
+import argparse
+import shutil
+import sys
+
+from harness import BASELINE_DIR, DEFAULT_TOLERANCE, RESULTS_DIR, compare, load_results, print_comparison
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("name", help="Имя бенчмарка (micro, load, ...)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--metric", action="append", help="Сравнивать только эти метрики (по умолчанию p50 и rps)")
+    parser.add_argument("--update-baseline", action="store_true", help="Сохранить текущие результаты как baseline")
+    args = parser.parse_args()
+
+    current_path = RESULTS_DIR / f"{args.name}.json"
+    baseline_path = BASELINE_DIR / f"{args.name}.json"
+
+    if not current_path.exists():
+        print(f"Нет результатов {current_path}, сначала запустите бенчмарк", file=sys.stderr)
+        return 2
+
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(current_path, baseline_path)
+        print(f"Baseline обновлен: {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"Нет baseline {baseline_path}, сохраните его через --update-baseline", file=sys.stderr)
+        return 2
+
+    current = load_results(current_path)
+    baseline = load_results(baseline_path)
+    if current["environment"] != baseline["environment"]:
+        print("Внимание: окружение отличается от baseline, сравнение приблизительное")
+
+    rows = compare(current, baseline, args.tolerance, args.metric or ["p50_us", "p50_ms", "rps"])
+    print_comparison(rows)
+
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"Регрессий: {len(regressions)} (допуск {args.tolerance:.0%})")
+        return 1
+    print("Регрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
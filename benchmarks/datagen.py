@@ -0,0 +1,179 @@
+"""
+Генератор синтетических данных для бенчмарков
+
+Создает пользователей, опросы с реалистичной структурой (radio / checkbox /
+scale / text), ссылки на опросы и ответы. Все таблицы заполняются через
+COPY (copy_records_to_table), поэтому миллионы ответов пишутся за минуты.
+
+Генерация детерминирована (--seed). Описание набора (admin, опросы, ссылки,
+пользователи без ответов для нагрузочного теста) сохраняется
+в benchmarks/results/dataset.json.
+
+Запуск (БД из bot/.env или переменных окружения DB_*):
+    python benchmarks/datagen.py --users 100000 --quizzes 20 --responses 1000000 --truncate
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bot"))
+
+import asyncpg
+
+from config import load_config
+from utils.database import Database
+from harness import RESULTS_DIR
+from synthetic import make_answers, make_structure
+
+
+# Диапазон telegram_id синтетических пользователей (не пересекается с реальными)
+TELEGRAM_ID_BASE = 7_000_000_000
+ADMIN_TELEGRAM_ID = TELEGRAM_ID_BASE - 1
+
+# Размер пачки для COPY
+COPY_BATCH = 50_000
+
+
+async def copy_in_batches(conn: asyncpg.Connection, table: str, columns: list, records):
+    """COPY пачками, чтобы не держать миллионы записей в памяти"""
+    batch = []
+    total = 0
+    for record in records:
+        batch.append(record)
+        if len(batch) >= COPY_BATCH:
+            await conn.copy_records_to_table(table, records=batch, columns=columns)
+            total += len(batch)
+            batch = []
+    if batch:
+        await conn.copy_records_to_table(table, records=batch, columns=columns)
+        total += len(batch)
+    return total
+
+
+async def generate(args) -> dict:
+    rng = random.Random(args.seed)
+    config = load_config()
+    conn = await asyncpg.connect(dsn=config.db.url)
+    await Database.init_connection(conn)
+
+    try:
+        if args.truncate:
+            await conn.execute(
+                "TRUNCATE responses, quiz_links, quizzes, users RESTART IDENTITY CASCADE"
+                if await conn.fetchval("SELECT to_regclass('quiz_links') IS NOT NULL")
+                else "TRUNCATE responses, quizzes, users RESTART IDENTITY CASCADE"
+            )
+
+        started = time.perf_counter()
+        now = datetime.utcnow()
+
+        # Пользователи: администратор + респонденты
+        admin_id = await conn.fetchval(
+            """
+            INSERT INTO users (telegram_id, username, first_name, is_admin)
+            VALUES ($1, 'bench_admin', 'Bench Admin', TRUE)
+            ON CONFLICT (telegram_id) DO UPDATE SET is_admin = TRUE
+            RETURNING id
+            """,
+            ADMIN_TELEGRAM_ID
+        )
+        first_user_id = (await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM users")) + 1
+        await copy_in_batches(
+            conn, "users", ["id", "telegram_id", "username", "first_name", "created_at"],
+            (
+                (first_user_id + i, TELEGRAM_ID_BASE + i, f"user{i}", f"User {i}", now - timedelta(days=rng.random() * 365))
+                for i in range(args.users)
+            )
+        )
+        await conn.execute("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT MAX(id) FROM users))")
+        user_ids = list(range(first_user_id, first_user_id + args.users))
+
+        # Опросы
+        structures = [make_structure(rng) for _ in range(args.quizzes)]
+        quiz_ids = []
+        for index, structure in enumerate(structures):
+            quiz_ids.append(await conn.fetchval(
+                """
+                INSERT INTO quizzes (creator_id, title, description, structure, settings, status)
+                VALUES ($1, $2, $3, $4, $5, 'active')
+                RETURNING id
+                """,
+                admin_id, f"Бенчмарк-опрос {index + 1}", "Синтетический опрос для бенчмарков",
+                structure, {"anonymous": False}
+            ))
+
+        # Ссылки на опросы
+        link_uuids = {}
+        if await conn.fetchval("SELECT to_regclass('quiz_links') IS NOT NULL"):
+            for quiz_id in quiz_ids:
+                link_uuid = f"bench-{args.seed}-{quiz_id}"
+                await conn.execute(
+                    """
+                    INSERT INTO quiz_links (quiz_id, link_uuid, is_active, created_by)
+                    VALUES ($1, $2, TRUE, $3)
+                    ON CONFLICT (link_uuid) DO NOTHING
+                    """,
+                    quiz_id, link_uuid, admin_id
+                )
+                link_uuids[quiz_id] = link_uuid
+
+        # Ответы: последние fresh_users пользователей не отвечают,
+        # их использует нагрузочный тест для новых ответов
+        responders = user_ids[:max(0, len(user_ids) - args.fresh_users)]
+        per_quiz = min(len(responders), args.responses // max(1, len(quiz_ids)))
+
+        def response_records():
+            for quiz_id, structure in zip(quiz_ids, structures):
+                for user_id in rng.sample(responders, per_quiz):
+                    yield (
+                        quiz_id,
+                        user_id,
+                        make_answers(rng, structure),
+                        now - timedelta(seconds=rng.random() * 30 * 86400)
+                    )
+
+        responses = await copy_in_batches(
+            conn, "responses", ["quiz_id", "user_id", "answers", "completed_at"], response_records()
+        )
+        await conn.execute("ANALYZE users; ANALYZE quizzes; ANALYZE responses")
+
+        dataset = {
+            "seed": args.seed,
+            "admin_telegram_id": ADMIN_TELEGRAM_ID,
+            "quiz_ids": quiz_ids,
+            "link_uuids": {str(k): v for k, v in link_uuids.items()},
+            "users": args.users,
+            "responses": responses,
+            "fresh_telegram_ids": [
+                TELEGRAM_ID_BASE + (user_id - first_user_id)
+                for user_id in user_ids[len(responders):]
+            ],
+            "elapsed_s": round(time.perf_counter() - started, 2),
+        }
+    finally:
+        await conn.close()
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    (RESULTS_DIR / "dataset.json").write_text(json.dumps(dataset, indent=2))
+    return dataset
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--quizzes", type=int, default=10)
+    parser.add_argument("--responses", type=int, default=100_000, help="Всего ответов (делятся между опросами)")
+    parser.add_argument("--fresh-users", type=int, default=1_000, help="Пользователи без ответов для нагрузочного теста")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--truncate", action="store_true", help="Очистить users, quizzes, responses перед генерацией")
+    args = parser.parse_args()
+
+    dataset = asyncio.run(generate(args))
+    summary = {k: v for k, v in dataset.items() if k != "fresh_telegram_ids"}
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
@@ -0,0 +1,164 @@
+"""
+Общие функции бенчмарков: замеры, сохранение результатов, сравнение с baseline
+
+Формат файла результатов:
+    {
+        "benchmark": "micro",
+        "created_at": "...",
+        "environment": {...},
+        "results": {"case": {"p50_us": ..., "p95_us": ..., ...}}
+    }
+
+Метрики с суффиксами _us / _ms - чем меньше, тем лучше;
+rps и *_per_sec - чем больше, тем лучше.
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCHMARKS_DIR.parent
+RESULTS_DIR = BENCHMARKS_DIR / "results"
+BASELINE_DIR = BENCHMARKS_DIR / "baseline"
+
+# Допустимое ухудшение относительно baseline
+DEFAULT_TOLERANCE = 0.15
+
+
+def summarize(samples: List[float], unit: str = "us") -> Dict[str, float]:
+    """Статистика по выборке длительностей (в секундах)"""
+    scale = 1e6 if unit == "us" else 1e3
+    values = sorted(sample * scale for sample in samples)
+    if not values:
+        return {}
+    return {
+        f"mean_{unit}": round(statistics.fmean(values), 2),
+        f"p50_{unit}": round(values[len(values) // 2], 2),
+        f"p95_{unit}": round(values[min(len(values) - 1, int(len(values) * 0.95))], 2),
+        f"p99_{unit}": round(values[min(len(values) - 1, int(len(values) * 0.99))], 2),
+        "samples": len(values),
+    }
+
+
+def measure(func: Callable[[], Any], iterations: int, warmup: Optional[int] = None) -> Dict[str, float]:
+    """Прогоняет func iterations раз (после прогрева) и возвращает статистику в мкс"""
+    for _ in range(warmup if warmup is not None else max(1, iterations // 10)):
+        func()
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+async def measure_async(func: Callable[[], Awaitable[Any]], iterations: int, warmup: Optional[int] = None) -> Dict[str, float]:
+    """Асинхронный вариант measure"""
+    for _ in range(warmup if warmup is not None else max(1, iterations // 10)):
+        await func()
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def environment() -> Dict[str, Any]:
+    """Описание окружения прогона (для сравнения с baseline)"""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_results(name: str, results: Dict[str, Any], path: Optional[Path] = None) -> Path:
+    """Сохраняет результаты в benchmarks/results/<name>.json"""
+    path = path or RESULTS_DIR / f"{name}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "benchmark": name,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": environment(),
+        "results": results,
+    }
+    path.write_text(json.dumps(payload, indent=2, ensure_ascii=False))
+    return path
+
+
+def load_results(path: Path) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text())
+
+
+def _higher_is_better(metric: str) -> bool:
+    return metric == "rps" or metric.endswith("_per_sec")
+
+
+def _comparable(metric: str) -> bool:
+    return metric.endswith(("_us", "_ms")) or _higher_is_better(metric)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE,
+            metrics: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Сравнивает результаты с baseline
+
+    Returns:
+        Список строк сравнения; regression=True, если метрика ухудшилась
+        больше чем на tolerance. Случаи, которых нет в одном из прогонов, -
+        строки с metric "-" и пояснением note
+    """
+    rows = []
+    for case, base_values in baseline.get("results", {}).items():
+        values = current.get("results", {}).get(case)
+        if values is None:
+            rows.append({"case": case, "metric": "-", "regression": False, "note": "нет в текущем прогоне"})
+            continue
+
+        for metric, base in base_values.items():
+            if not _comparable(metric) or (metrics and metric not in metrics):
+                continue
+            value = values.get(metric)
+            if value is None or not base:
+                continue
+
+            change = (value - base) / base
+            worse = -change if _higher_is_better(metric) else change
+            rows.append({
+                "case": case,
+                "metric": metric,
+                "baseline": base,
+                "current": value,
+                "change": round(change * 100, 1),
+                "regression": worse > tolerance,
+            })
+
+    # Новые случаи без baseline не сравниваются, но и не пропадают молча
+    for case in current.get("results", {}):
+        if case not in baseline.get("results", {}):
+            rows.append({"case": case, "metric": "-", "regression": False, "note": "нет в baseline (обновите --update-baseline)"})
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], stream=sys.stdout):
+    for row in rows:
+        if row["metric"] == "-":
+            print(f"  {row['case']}: {row['note']}", file=stream)
+            continue
+        mark = "REGRESSION" if row["regression"] else "ok"
+        print(
+            f"  {row['case']:<40} {row['metric']:<10} {row['baseline']:>12} -> {row['current']:>12} "
+            f"({row['change']:+.1f}%) {mark}",
+            file=stream
+        )
@@ -0,0 +1,165 @@
+"""
+Нагрузочный сценарий API
+
+Каждый виртуальный респондент проходит путь из WebApp:
+    GET  /api/links/resolve/{uuid}  ->  GET /api/quizzes/{id}  ->  POST /api/responses
+Параллельно виртуальный администратор периодически запрашивает
+GET /api/analytics/{id} и GET /api/analytics/{id}/export.
+
+Данные берутся из benchmarks/results/dataset.json (см. datagen.py): ответы
+отправляют пользователи, у которых еще нет ответов. initData подписывается
+тем же BOT_TOKEN, что у API.
+
+Запуск (API поднят локально, rate limit на время теста ослаблен):
+    RATE_LIMIT_REQUESTS=1000000 API_PORT=8000 python api/server.py
+    BOT_TOKEN=... python benchmarks/load.py --base-url http://127.0.0.1:8000 --concurrency 50 --duration 60
+    python benchmarks/compare.py load --metric p95_ms --metric rps
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import RESULTS_DIR, save_results, summarize
+from synthetic import make_answers, sign_init_data
+
+
+class Recorder:
+    """Длительности и коды ответов по шагам сценария"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    async def request(self, session: aiohttp.ClientSession, step: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                body = await response.read()
+                status = response.status
+        except aiohttp.ClientError as e:
+            self.statuses[step][type(e).__name__] += 1
+            return None, None
+        self.samples[step].append(time.perf_counter() - start)
+        self.statuses[step][str(status)] += 1
+        return status, body
+
+    def results(self, elapsed: float) -> dict:
+        results = {}
+        for step, samples in self.samples.items():
+            statuses = self.statuses[step]
+            errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+            results[step] = {
+                **summarize(samples, unit="ms"),
+                "rps": round(len(samples) / elapsed, 1),
+                "errors": errors,
+                "statuses": dict(statuses),
+            }
+        return results
+
+
+async def respondent(session, recorder: Recorder, args, work, deadline: float):
+    """Виртуальный респондент: берет пары (пользователь, опрос) из общей очереди"""
+    rng = random.Random()
+    structures = {}
+    while time.monotonic() < deadline:
+        try:
+            telegram_id, quiz_id, link_uuid = next(work)
+        except StopIteration:
+            return
+
+        headers = {
+            "Authorization": "Bearer " + sign_init_data(args.bot_token, telegram_id, int(time.time())),
+            "X-User-ID": str(telegram_id),
+        }
+
+        if link_uuid:
+            await recorder.request(session, "resolve_link", "GET", f"{args.base_url}/api/links/resolve/{link_uuid}")
+
+        status, body = await recorder.request(session, "get_quiz", "GET", f"{args.base_url}/api/quizzes/{quiz_id}", headers=headers)
+        if status == 200:
+            structures[quiz_id] = json.loads(body)["structure"]
+        structure = structures.get(quiz_id)
+        if structure is None:
+            continue
+
+        await recorder.request(
+            session, "submit_response", "POST", f"{args.base_url}/api/responses",
+            json={"quiz_id": quiz_id, "answers": make_answers(rng, structure)},
+            headers=headers
+        )
+
+
+async def admin(session, recorder: Recorder, args, quiz_ids: List[int], admin_telegram_id: int, deadline: float):
+    """Виртуальный администратор: аналитика и экспорт раз в admin_interval секунд"""
+    headers = {
+        "Authorization": "Bearer " + sign_init_data(args.bot_token, admin_telegram_id, int(time.time())),
+        "X-User-ID": str(admin_telegram_id),
+    }
+    for quiz_id in itertools.cycle(quiz_ids):
+        if time.monotonic() >= deadline:
+            return
+        await recorder.request(session, "analytics", "GET", f"{args.base_url}/api/analytics/{quiz_id}", headers=headers)
+        if args.export:
+            await recorder.request(session, "export", "GET", f"{args.base_url}/api/analytics/{quiz_id}/export", headers=headers)
+        await asyncio.sleep(args.admin_interval)
+
+
+async def main(args) -> dict:
+    dataset = json.loads(Path(args.dataset).read_text())
+    quiz_ids = dataset["quiz_ids"]
+    link_uuids = dataset.get("link_uuids", {})
+
+    # Каждая пара (пользователь, опрос) отправляется один раз
+    work = iter([
+        (telegram_id, quiz_id, link_uuids.get(str(quiz_id)))
+        for telegram_id in dataset["fresh_telegram_ids"]
+        for quiz_id in quiz_ids
+    ])
+
+    recorder = Recorder()
+    connector = aiohttp.TCPConnector(limit=args.concurrency + 4)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        deadline = time.monotonic() + args.duration
+        tasks = [respondent(session, recorder, args, work, deadline) for _ in range(args.concurrency)]
+        tasks.append(admin(session, recorder, args, quiz_ids, dataset["admin_telegram_id"], deadline))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    results = recorder.results(elapsed)
+    throttled = sum(step["statuses"].get("429", 0) for step in results.values())
+    if throttled:
+        print(f"Внимание: {throttled} ответов 429, увеличьте RATE_LIMIT_REQUESTS у API", file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--dataset", default=str(RESULTS_DIR / "dataset.json"))
+    parser.add_argument("--bot-token", default=os.getenv("BOT_TOKEN", ""))
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="Длительность, секунд")
+    parser.add_argument("--admin-interval", type=float, default=1.0, help="Пауза между запросами администратора")
+    parser.add_argument("--no-export", dest="export", action="store_false", help="Не запрашивать CSV экспорт")
+    args = parser.parse_args()
+
+    if not args.bot_token:
+        parser.error("нужен --bot-token или BOT_TOKEN (тот же, что у API)")
+
+    results = asyncio.run(main(args))
+    path = save_results("load", results)
+    print(json.dumps(results, indent=2))
+    print(f"Результаты: {path}")
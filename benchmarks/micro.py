@@ -0,0 +1,101 @@
+"""
+Микро-бенчмарки горячих функций API (без БД и HTTP)
+
+- validate_init_data: проверка подписи initData (валидная и поддельная)
+- aggregate_answers: аналитика опроса по ответам в памяти
+- build_columns / analyze: загрузка ответов в колонки NumPy и аналитика по ним
+- write_csv: кодирование строк CSV экспорта
+
+Запуск:
+    python benchmarks/micro.py --respondents 10000
+    python benchmarks/compare.py micro
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "api"))
+
+# Токен для подписи initData нужен до импорта настроек API
+os.environ.setdefault("BOT_TOKEN", "123456:bench-token")
+
+from config import settings
+from services.analytics import aggregate_answers, write_csv
+from services.answer_columns import build_columns
+from services.column_analytics import analyze
+from services.quiz_structure import compile_structure
+from utils.auth import validate_init_data
+
+from harness import measure, save_results
+from synthetic import make_dataset, sign_init_data
+
+
+def bench_init_data(iterations: int) -> dict:
+    valid = sign_init_data(settings.BOT_TOKEN, 7_000_000_001, int(time.time()), username="bench")
+    forged = valid.replace("bench", "admin", 1)
+    assert validate_init_data(valid, settings.BOT_TOKEN) is not None
+    assert validate_init_data(forged, settings.BOT_TOKEN) is None
+
+    return {
+        "validate_init_data.valid": measure(lambda: validate_init_data(valid, settings.BOT_TOKEN), iterations),
+        "validate_init_data.forged": measure(lambda: validate_init_data(forged, settings.BOT_TOKEN), iterations),
+    }
+
+
+def bench_analytics(respondents: int, iterations: int) -> dict:
+    structure, answers = make_dataset(seed=1, respondents=respondents)
+    questions = structure["questions"]
+    compiled = compile_structure(structure)
+    columns = build_columns(compiled, answers)
+    return {
+        f"aggregate_answers.{respondents}": measure(lambda: aggregate_answers(questions, answers), iterations),
+        f"build_columns.{respondents}": measure(lambda: build_columns(compiled, answers), iterations),
+        f"analyze.{respondents}": measure(lambda: analyze(compiled, columns), iterations),
+    }
+
+
+def bench_csv(respondents: int, iterations: int) -> dict:
+    structure, answers = make_dataset(seed=2, respondents=respondents)
+    questions = structure["questions"]
+    completed_at = datetime(2024, 1, 1, 12, 0, 0)
+    rows = [
+        (i, 7_000_000_000 + i, f"user{i}", f"User {i}", None, completed_at, answer)
+        for i, answer in enumerate(answers)
+    ]
+
+    def encode():
+        output = io.StringIO()
+        write_csv(output, questions, rows)
+        return output.getvalue()
+
+    return {
+        f"write_csv.{respondents}": measure(encode, iterations),
+    }
+
+
+def main(args) -> dict:
+    results = {}
+    results.update(bench_init_data(args.iterations))
+    results.update(bench_analytics(args.respondents, args.heavy_iterations))
+    results.update(bench_csv(args.respondents, args.heavy_iterations))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000, help="Итераций для быстрых функций")
+    parser.add_argument("--heavy-iterations", type=int, default=20, help="Итераций для агрегации и CSV")
+    parser.add_argument("--respondents", type=int, default=10000)
+    args = parser.parse_args()
+
+    results = main(args)
+    path = save_results("micro", results)
+    print(json.dumps(results, indent=2))
+    print(f"Результаты: {path}")
@@ -0,0 +1,132 @@
+"""
+Время холодного старта воркера API
+
+Каждый прогон - новый процесс интерпретатора (как при автомасштабировании
+или перезапуске упавшего воркера):
+- process: от запуска интерпретатора до готового приложения
+- import_main: import main (код приложения и зависимости)
+- create_app: сборка приложения фабрикой
+- lifespan_startup: трассировка, движок БД и прогрев пула (--with-db)
+
+Отчет -X importtime показывает, какие пакеты занимают время импорта
+(собственное время модулей, сгруппированное по пакету верхнего уровня).
+
+Запуск:
+    python benchmarks/startup.py --runs 10
+    python benchmarks/startup.py --with-db --budget-ms 1500
+    python benchmarks/compare.py startup --metric p50_ms
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import RESULTS_DIR, ROOT_DIR, save_results, summarize
+
+API_DIR = ROOT_DIR / "api"
+
+CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+sys.path[:0] = [{api_dir!r}, {root_dir!r}]
+import main
+imported = time.perf_counter()
+app = main.create_app(main.settings)
+created = time.perf_counter()
+result = {{"import_main": imported - started, "create_app": created - imported}}
+if {with_db!r}:
+    import asyncio
+    async def startup():
+        start = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            return time.perf_counter() - start
+    result["lifespan_startup"] = asyncio.run(startup())
+print("STARTUP " + json.dumps(result))
+"""
+
+
+def run_once(with_db: bool, importtime: bool) -> Tuple[Dict[str, float], str]:
+    """Один холодный старт; возвращает замеры и вывод -X importtime"""
+    code = CHILD.format(api_dir=str(API_DIR), root_dir=str(ROOT_DIR), with_db=with_db)
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", code]
+
+    env = dict(os.environ)
+    env.setdefault("BOT_TOKEN", "123456:bench-token")
+
+    started = time.perf_counter()
+    completed = subprocess.run(command, capture_output=True, text=True, env=env, cwd=str(API_DIR))
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"Старт приложения завершился ошибкой:\n{completed.stderr[-4000:]}")
+
+    line = next(l for l in completed.stdout.splitlines() if l.startswith("STARTUP "))
+    result = json.loads(line[len("STARTUP "):])
+    result["process"] = elapsed
+    return result, completed.stderr
+
+
+def import_breakdown(stderr: str, top: int) -> List[Tuple[str, float]]:
+    """Собственное время импорта модулей по пакетам верхнего уровня, мс"""
+    packages: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # import time: self [us] | cumulative | imported package
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1000
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+def main(args) -> dict:
+    samples: Dict[str, List[float]] = defaultdict(list)
+    # Первый прогон прогревает кэш .pyc и файловый кэш ОС и не учитывается
+    run_once(args.with_db, importtime=False)
+
+    for _ in range(args.runs):
+        result, _ = run_once(args.with_db, importtime=False)
+        for case, value in result.items():
+            samples[case].append(value)
+
+    # importtime замедляет импорт, поэтому снимается отдельным прогоном
+    _, stderr = run_once(args.with_db, importtime=True)
+    breakdown = import_breakdown(stderr, args.top)
+
+    results = {case: summarize(values, unit="ms") for case, values in samples.items()}
+
+    print(f"{'case':<20} {'p50_ms':>10} {'p95_ms':>10}")
+    for case, stats in results.items():
+        print(f"{case:<20} {stats['p50_ms']:>10} {stats['p95_ms']:>10}")
+    print("\nИмпорт по пакетам (собственное время модулей):")
+    for package, ms in breakdown:
+        print(f"  {package:<30} {ms:>8.1f} ms")
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    (RESULTS_DIR / "startup_imports.json").write_text(json.dumps(dict(breakdown), indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--with-db", action="store_true", help="Замерить lifespan (движок и прогрев пула), нужна БД")
+    parser.add_argument("--top", type=int, default=15, help="Сколько пакетов показать в отчете импорта")
+    parser.add_argument("--budget-ms", type=float, default=0, help="Код возврата 1, если p50 process больше")
+    args = parser.parse_args()
+
+    results = main(args)
+    path = save_results("startup", results)
+    print(f"Результаты: {path}")
+
+    if args.budget_ms and results["process"]["p50_ms"] > args.budget_ms:
+        print(f"Старт воркера {results['process']['p50_ms']} ms больше бюджета {args.budget_ms} ms", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,79 @@
+"""
+Синтетические структуры опросов и ответы
+
+Без зависимостей от API и бота: используется генератором данных
+и микро-бенчмарками.
+"""
+import hashlib
+import hmac
+import json
+import random
+from urllib.parse import urlencode
+
+
+WORDS = (
+    "качество сервис доставка цена удобство поддержка скорость интерфейс "
+    "приложение заказ оплата курьер меню выбор ассортимент упаковка отзыв "
+    "рекомендация опыт время ожидание персонал чистота атмосфера"
+).split()
+
+QUESTION_TYPES = ("radio", "radio", "checkbox", "scale", "scale", "text")
+
+
+def make_structure(rng: random.Random) -> dict:
+    """Структура опроса из 8-15 вопросов разных типов"""
+    questions = []
+    for index in range(rng.randint(8, 15)):
+        question_type = rng.choice(QUESTION_TYPES)
+        question = {
+            "id": f"q{index + 1}",
+            "type": question_type,
+            "text": f"Вопрос {index + 1}: {' '.join(rng.sample(WORDS, 4))}?",
+            "required": rng.random() < 0.7,
+        }
+        if question_type in ("radio", "checkbox"):
+            question["options"] = [f"Вариант {i + 1}" for i in range(rng.randint(3, 7))]
+        elif question_type == "scale":
+            question["min"], question["max"] = rng.choice(((1, 5), (1, 10), (0, 10)))
+        questions.append(question)
+    return {"questions": questions}
+
+
+def make_answers(rng: random.Random, structure: dict) -> dict:
+    """Ответы одного респондента (необязательные вопросы иногда пропускаются)"""
+    answers = {}
+    for question in structure["questions"]:
+        if not question["required"] and rng.random() < 0.3:
+            continue
+        question_type = question["type"]
+        if question_type == "radio":
+            # Неравномерное распределение, как в реальных опросах
+            options = question["options"]
+            weights = [len(options) - i for i in range(len(options))]
+            answers[question["id"]] = rng.choices(options, weights)[0]
+        elif question_type == "checkbox":
+            options = question["options"]
+            answers[question["id"]] = rng.sample(options, rng.randint(1, min(3, len(options))))
+        elif question_type == "scale":
+            low, high = question["min"], question["max"]
+            answers[question["id"]] = min(high, max(low, round(rng.gauss((low + high) * 0.65, (high - low) / 4))))
+        else:
+            answers[question["id"]] = " ".join(rng.choices(WORDS, k=rng.randint(2, 12)))
+    return answers
+
+
+def make_dataset(seed: int, respondents: int):
+    """Структура опроса и ответы respondents респондентов (в памяти)"""
+    rng = random.Random(seed)
+    structure = make_structure(rng)
+    return structure, [make_answers(rng, structure) for _ in range(respondents)]
+
+
+def sign_init_data(bot_token: str, telegram_id: int, auth_date: int, **user_fields) -> str:
+    """initData Telegram WebApp, подписанная токеном бота"""
+    user = json.dumps({"id": telegram_id, "first_name": f"User {telegram_id}", **user_fields}, separators=(",", ":"))
+    fields = {"auth_date": str(auth_date), "query_id": f"bench{telegram_id}", "user": user}
+    data_check_string = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
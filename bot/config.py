@@ -3,10 +3,13 @@
 """
 import os
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Tuple
 from urllib.parse import quote_plus
 from dotenv import load_dotenv
 
+from common.logs import parse_rate_limits
+
 # Загружаем .env из директории bot/
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
@@ -20,6 +23,10 @@ class DatabaseConfig:
     name: str
     user: str
     password: str
+    # Сколько секунд доверять кэшу прохождения опросов
+    completion_cache_ttl: float = 60
+    # Сбрасывать кэши по событиям API через LISTEN cache_invalidation
+    cache_invalidation: bool = True
 
     @property
     def url(self) -> str:
@@ -36,6 +43,109 @@ class DatabaseConfig:
         return f"postgresql+asyncpg://{self.user}:{password_encoded}@{self.host}:{self.port}/{self.name}"
 
 
+@dataclass
+class FSMStorageConfig:
+    """Конфигурация хранилища состояний FSM"""
+    # memory | postgres | redis
+    backend: str
+    # Время жизни незавершенного состояния в секундах (0 - без ограничения)
+    state_ttl: int
+    # Интервал пакетной записи в секундах
+    flush_interval: float
+    # Максимальный размер пачки записей
+    batch_size: int
+    # Интервал очистки просроченных состояний в секундах
+    cleanup_interval: int
+    # URL Redis (для backend=redis)
+    redis_url: str
+
+
+@dataclass
+class ThrottlingConfig:
+    """Конфигурация ограничения частоты запросов"""
+    enabled: bool
+    # memory | redis
+    backend: str
+    redis_url: str
+    # Общий лимит пользователя: запросов в секунду и размер всплеска
+    user_rate: float
+    user_burst: float
+    # Лимиты команд: {команда: (размер всплеска, запросов в секунду)}
+    command_limits: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+    # Как часто напоминать пользователю о лимите, секунд
+    notify_cooldown: float = 10.0
+    # Telegram ID без ограничений
+    exempt_ids: FrozenSet[int] = frozenset()
+
+
+def parse_command_limits(raw: str) -> Dict[str, Tuple[float, float]]:
+    """
+    Разбирает лимиты команд вида "stats=2/60,start=5/30"
+
+    2/60 - не больше 2 запросов за 60 секунд
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        command, _, limit = item.partition("=")
+        count, _, period = limit.partition("/")
+        capacity = float(count)
+        limits[command.strip().lstrip("/").lower()] = (capacity, capacity / float(period))
+    return limits
+
+
+@dataclass
+class BotAPIConfig:
+    """Конфигурация подключения к Telegram Bot API"""
+    # URL собственного сервера Bot API (пусто - публичный api.telegram.org)
+    server_url: str = ""
+    # Сервер запущен с --local: файлы без ограничений размера, пути вместо загрузки
+    is_local: bool = False
+    # Каталог файлов на сервере Bot API и тот же каталог, смонтированный у бота
+    files_server_path: str = ""
+    files_local_path: str = ""
+    # Пул соединений aiohttp
+    connection_limit: int = 100
+    connection_limit_per_host: int = 0
+    keepalive_timeout: float = 60.0
+    dns_cache_ttl: int = 3600
+    # Таймаут запроса к Bot API в секундах
+    request_timeout: float = 60.0
+
+
+@dataclass
+class MetricsConfig:
+    """Конфигурация HTTP сервера метрик"""
+    enabled: bool = True
+    host: str = "0.0.0.0"
+    port: int = 9101
+
+
+@dataclass
+class TracingConfig:
+    """Конфигурация трассировки (OpenTelemetry)"""
+    enabled: bool = False
+    # none | memory | file | console | otlp
+    exporter: str = "file"
+    # Доля новых трасс (решение родителя из traceparent сохраняется)
+    sample_ratio: float = 0.1
+    file_path: str = "./traces/bot.jsonl"
+    otlp_endpoint: str = ""
+
+
+@dataclass
+class LoggingConfig:
+    """Конфигурация логирования (common.logs)"""
+    level: str = "INFO"
+    # json | text
+    format: str = "json"
+    queue_size: int = 10000
+    # Записей в секунду и размер всплеска из одного места вызова
+    rate: float = 10.0
+    burst: float = 20.0
+    # Лимиты логгеров: {логгер: (размер всплеска, записей в секунду)}
+    limits: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+
+
 @dataclass
 class Config:
     """Конфигурация приложения"""
@@ -49,6 +159,24 @@ class Config:
     # WebApp
     webapp_url: str
 
+    # FSM
+    fsm: FSMStorageConfig
+
+    # Throttling
+    throttling: ThrottlingConfig
+
+    # Bot API
+    bot_api: BotAPIConfig = field(default_factory=BotAPIConfig)
+
+    # Metrics
+    metrics: MetricsConfig = field(default_factory=MetricsConfig)
+
+    # Tracing
+    tracing: TracingConfig = field(default_factory=TracingConfig)
+
+    # Logging
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+
 
 def load_config() -> Config:
     """Загружает конфигурацию из переменных окружения"""
@@ -60,9 +188,64 @@ def load_config() -> Config:
             port=int(os.getenv("DB_PORT", "5432")),
             name=os.getenv("DB_NAME", "oprosy_db"),
             user=os.getenv("DB_USER", "oprosy_user"),
-            password=os.getenv("DB_PASSWORD", "")
+            password=os.getenv("DB_PASSWORD", ""),
+            completion_cache_ttl=float(os.getenv("COMPLETION_CACHE_TTL", "60")),
+            cache_invalidation=os.getenv("CACHE_INVALIDATION_ENABLED", "true").lower() == "true"
+        ),
+        webapp_url=os.getenv("WEBAPP_URL", "http://localhost:3000"),
+        fsm=FSMStorageConfig(
+            backend=os.getenv("FSM_STORAGE", "postgres").lower(),
+            state_ttl=int(os.getenv("FSM_STATE_TTL", "86400")),
+            flush_interval=float(os.getenv("FSM_FLUSH_INTERVAL", "0.05")),
+            batch_size=int(os.getenv("FSM_BATCH_SIZE", "100")),
+            cleanup_interval=int(os.getenv("FSM_CLEANUP_INTERVAL", "600")),
+            redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        ),
+        throttling=ThrottlingConfig(
+            enabled=os.getenv("THROTTLE_ENABLED", "true").lower() == "true",
+            backend=os.getenv("THROTTLE_BACKEND", "memory").lower(),
+            redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            user_rate=float(os.getenv("THROTTLE_USER_RATE", "1")),
+            user_burst=float(os.getenv("THROTTLE_USER_BURST", "5")),
+            command_limits=parse_command_limits(
+                os.getenv("THROTTLE_COMMAND_LIMITS", "stats=2/60,start=5/30")
+            ),
+            notify_cooldown=float(os.getenv("THROTTLE_NOTIFY_COOLDOWN", "10")),
+            exempt_ids=frozenset(
+                int(x) for x in os.getenv("THROTTLE_EXEMPT_IDS", "").split(",") if x.strip()
+            )
+        ),
+        bot_api=BotAPIConfig(
+            server_url=os.getenv("TELEGRAM_API_URL", ""),
+            is_local=os.getenv("TELEGRAM_API_LOCAL", "false").lower() == "true",
+            files_server_path=os.getenv("TELEGRAM_API_FILES_SERVER_PATH", ""),
+            files_local_path=os.getenv("TELEGRAM_API_FILES_LOCAL_PATH", ""),
+            connection_limit=int(os.getenv("TELEGRAM_CONNECTION_LIMIT", "100")),
+            connection_limit_per_host=int(os.getenv("TELEGRAM_CONNECTION_LIMIT_PER_HOST", "0")),
+            keepalive_timeout=float(os.getenv("TELEGRAM_KEEPALIVE_TIMEOUT", "60")),
+            dns_cache_ttl=int(os.getenv("TELEGRAM_DNS_CACHE_TTL", "3600")),
+            request_timeout=float(os.getenv("TELEGRAM_REQUEST_TIMEOUT", "60"))
+        ),
+        metrics=MetricsConfig(
+            enabled=os.getenv("METRICS_ENABLED", "true").lower() == "true",
+            host=os.getenv("METRICS_HOST", "0.0.0.0"),
+            port=int(os.getenv("METRICS_PORT", "9101"))
+        ),
+        tracing=TracingConfig(
+            enabled=os.getenv("TRACING_ENABLED", "false").lower() == "true",
+            exporter=os.getenv("TRACING_EXPORTER", "file").lower(),
+            sample_ratio=float(os.getenv("TRACING_SAMPLE_RATIO", "0.1")),
+            file_path=os.getenv("TRACING_FILE", "./traces/bot.jsonl"),
+            otlp_endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
         ),
-        webapp_url=os.getenv("WEBAPP_URL", "http://localhost:3000")
+        logging=LoggingConfig(
+            level=os.getenv("LOG_LEVEL", "INFO").upper(),
+            format=os.getenv("LOG_FORMAT", "json").lower(),
+            queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+            rate=float(os.getenv("LOG_RATE_LIMIT", "10")),
+            burst=float(os.getenv("LOG_RATE_BURST", "20")),
+            limits=parse_rate_limits(os.getenv("LOG_RATE_LIMITS", ""))
+        )
     )
 
 
@@ -76,11 +76,8 @@ async def cmd_stats(message: Message, db: Database, config: Config):
     draft_quizzes = len([q for q in quizzes if q['status'] == 'draft'])
     archived_quizzes = len([q for q in quizzes if q['status'] == 'archived'])
     
-    # Подсчитываем общее количество ответов
-    total_responses = 0
-    for quiz in quizzes:
-        responses = await db.get_responses_by_quiz(quiz['id'])
-        total_responses += len(responses)
+    # Счетчики ответов ведет триггер БД
+    total_responses = sum(quiz['response_count'] for quiz in quizzes)
     
     await message.answer(
         f"📊 <b>Статистика</b>\n\n"
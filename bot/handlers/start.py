@@ -10,6 +10,7 @@ from aiogram.fsm.state import State, StatesGroup
 from utils.database import Database
 from keyboards.reply import get_main_menu_keyboard, get_onboarding_keyboard, get_cancel_keyboard
 from config import Config
+from common.tracing import with_traceparent
 
 router = Router()
 
@@ -44,7 +45,8 @@ async def cmd_start(message: Message, state: FSMContext, db: Database, config: C
         
         # Если есть quiz_id - СРАЗУ открываем WebApp
         if quiz_id:
-            webapp_url = f"{config.webapp_url}/quiz/{quiz_id}"
+            # traceparent связывает открытие опроса в WebApp с этим апдейтом
+            webapp_url = with_traceparent(f"{config.webapp_url}/quiz/{quiz_id}")
             
             from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
             keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -79,7 +81,8 @@ async def cmd_start(message: Message, state: FSMContext, db: Database, config: C
         
         # Если есть quiz_id - СРАЗУ открываем WebApp
         if quiz_id:
-            webapp_url = f"{config.webapp_url}/quiz/{quiz_id}"
+            # traceparent связывает открытие опроса в WebApp с этим апдейтом
+            webapp_url = with_traceparent(f"{config.webapp_url}/quiz/{quiz_id}")
             
             from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
             keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -3,19 +3,29 @@
 """
 import asyncio
 import logging
+import sys
+from pathlib import Path
+
+# Корень проекта нужен для общего пакета common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
 from config import load_config
 from utils.database import Database
+from utils.fsm_storage import create_fsm_storage
+from utils.session import create_bot_session
+from utils.metrics import register_bot_collectors, setup_handler_metrics, start_metrics_server
+from common import invalidation
+from common.logs import setup_logging, shutdown_logging
+from common.pg_notify import PgListener
+from common.tracing import shutdown_tracing
+from middlewares.log_context import LogContextMiddleware
+from middlewares.throttling import ThrottlingMiddleware, create_throttle_store, setup_throttling
 from handlers import start, admin, webapp
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 
@@ -24,6 +34,17 @@ async def main():
     
     # Загружаем конфигурацию
     config = load_config()
+
+    # Логи через очередь и фоновый поток: запись не блокирует event loop
+    setup_logging(
+        "oprosy-bot",
+        level=config.logging.level,
+        fmt=config.logging.format,
+        queue_size=config.logging.queue_size,
+        rate=config.logging.rate,
+        burst=config.logging.burst,
+        limits=config.logging.limits
+    )
     
     # Проверяем обязательные параметры
     if not config.token:
@@ -34,29 +55,67 @@ async def main():
         logger.error("SUPERADMIN_ID не установлен в переменных окружения!")
         return
     
-    # Инициализируем бота
+    # Инициализируем бота (Bot API и пул соединений из конфигурации)
     bot = Bot(
         token=config.token,
+        session=create_bot_session(config.bot_api),
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
     
-    # Инициализируем диспетчер
-    dp = Dispatcher()
-    
     # Подключаемся к базе данных
     db = Database(config.db)
     await db.connect()
     logger.info("✅ Подключение к базе данных установлено")
+
+    # События изменений от API сбрасывают кэши бота
+    listener = None
+    if config.db.cache_invalidation:
+        invalidation.bus.subscribe("quiz", db.on_quiz_change)
+        invalidation.bus.subscribe("response", db.on_response)
+        invalidation.bus.on_flush(db.completions.invalidate)
+        listener = PgListener(config.db.url)
+        invalidation.bus.attach(listener)
+        await listener.start()
+    
+    # Инициализируем диспетчер с общим хранилищем состояний FSM
+    storage = await create_fsm_storage(config.fsm, db.pool)
+    dp = Dispatcher(storage=storage)
+    logger.info(f"💾 FSM хранилище: {config.fsm.backend}")
+
+    # request_id апдейта для всех записей лога при его обработке
+    dp.update.outer_middleware(LogContextMiddleware())
+    
+    # Трассировка апдейтов (спан на апдейт, запросы к БД, traceparent в WebApp)
+    if config.tracing.enabled:
+        from utils.tracing import setup_bot_tracing
+        setup_bot_tracing(dp, config.tracing)
+    
+    # Ограничиваем частоту запросов до FSM и хендлеров
+    throttling = None
+    if config.throttling.enabled:
+        throttling = ThrottlingMiddleware(
+            config.throttling,
+            create_throttle_store(config.throttling)
+        )
+        setup_throttling(dp, throttling)
     
     # Регистрируем роутеры
     dp.include_router(start.router)
     dp.include_router(admin.router)
     dp.include_router(webapp.router)
+
+    # Метрики: длительность хендлеров, пул asyncpg, throttling
+    setup_handler_metrics(dp)
+    register_bot_collectors(db, throttling)
+    metrics_runner = None
+    if config.metrics.enabled:
+        metrics_runner = await start_metrics_server(config.metrics.host, config.metrics.port)
     
     # Добавляем данные в контекст для всех хендлеров
     dp.workflow_data.update({
         "db": db,
-        "config": config
+        "config": config,
+        "throttling": throttling
     })
     
     # Запускаем бота
@@ -66,9 +125,19 @@ async def main():
     try:
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        if throttling:
+            logger.info(f"Throttling: {throttling.stats()}")
+            await throttling.store.close()
+        await storage.close()
+        if listener:
+            await listener.stop()
         await db.disconnect()
         await bot.session.close()
+        shutdown_tracing()
         logger.info("👋 Бот остановлен")
+        shutdown_logging()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,29 @@
+"""
+Контекст логов апдейта
+
+Outer middleware проставляет request_id вида "upd-<update_id>": все записи
+лога, сделанные при обработке апдейта (хендлеры, запросы к БД, throttling),
+можно собрать по одному идентификатору.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from common.logs import request_id_var
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Outer middleware: request_id на время обработки апдейта"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        token = request_id_var.set(f"upd-{event.update_id}")
+        try:
+            return await handler(event, data)
+        finally:
+            request_id_var.reset(token)
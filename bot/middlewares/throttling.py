@@ -0,0 +1,231 @@
+"""
+Ограничение частоты запросов к боту (throttling)
+
+Leaky bucket на пользователя и отдельно на тяжелые команды.
+Лишние апдейты отбрасываются до FSM и хендлеров, поэтому не занимают
+подключения пула asyncpg.
+"""
+import logging
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import TelegramObject, Update, User
+
+from config import ThrottlingConfig
+
+logger = logging.getLogger(__name__)
+
+
+class ThrottleStore:
+    """Базовое хранилище ведер"""
+
+    async def hit(self, key: str, capacity: float, leak_rate: float) -> bool:
+        """
+        Добавляет каплю в ведро
+
+        Returns:
+            True если запрос разрешен, False если ведро переполнено
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """Освобождает ресурсы хранилища"""
+
+
+class MemoryThrottleStore(ThrottleStore):
+    """Хранилище ведер в памяти процесса"""
+
+    # Как часто удалять опустевшие ведра, секунд
+    PRUNE_INTERVAL = 60
+
+    def __init__(self):
+        # {key: (уровень, время последнего обновления, скорость вытекания)}
+        self.buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._last_prune = time.monotonic()
+
+    async def hit(self, key: str, capacity: float, leak_rate: float) -> bool:
+        now = time.monotonic()
+        level, updated_at, _ = self.buckets.get(key, (0.0, now, leak_rate))
+        level = max(0.0, level - (now - updated_at) * leak_rate)
+
+        allowed = level + 1 <= capacity
+        if allowed:
+            level += 1
+        self.buckets[key] = (level, now, leak_rate)
+
+        if now - self._last_prune > self.PRUNE_INTERVAL:
+            self._prune(now)
+        return allowed
+
+    def _prune(self, now: float):
+        """Удаляет ведра, которые уже успели полностью вытечь"""
+        self._last_prune = now
+        self.buckets = {
+            key: bucket
+            for key, bucket in self.buckets.items()
+            if bucket[0] - (now - bucket[1]) * bucket[2] > 0
+        }
+
+
+class RedisThrottleStore(ThrottleStore):
+    """Общее хранилище ведер в Redis для нескольких реплик бота"""
+
+    # Атомарное обновление ведра: KEYS[1], ARGV = capacity, leak_rate, now
+    LUA_HIT = """
+    local bucket = redis.call('HMGET', KEYS[1], 'level', 'ts')
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local level = tonumber(bucket[1]) or 0
+    local ts = tonumber(bucket[2]) or now
+    level = math.max(0, level - (now - ts) * rate)
+    local allowed = 0
+    if level + 1 <= capacity then
+        level = level + 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'level', level, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return allowed
+    """
+
+    def __init__(self, url: str):
+        # Требует установленный пакет redis
+        from redis.asyncio import Redis
+
+        self.redis = Redis.from_url(url)
+        self._script = self.redis.register_script(self.LUA_HIT)
+
+    async def hit(self, key: str, capacity: float, leak_rate: float) -> bool:
+        allowed = await self._script(
+            keys=[f"throttle:{key}"],
+            args=[capacity, leak_rate, time.time()]
+        )
+        return bool(allowed)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Outer middleware для апдейтов
+
+    Проверяет общий лимит пользователя и лимит команды. Первый отброшенный
+    апдейт в окне notify_cooldown получает короткий ответ, остальные
+    отбрасываются молча.
+    """
+
+    def __init__(self, config: ThrottlingConfig, store: Optional[ThrottleStore] = None):
+        self.config = config
+        self.store = store or MemoryThrottleStore()
+        # Счетчики для метрик: {(причина, команда): количество}
+        self.throttled: Counter = Counter()
+        self.passed = 0
+        self._notified_at: Dict[int, float] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        if user is None or user.id in self.config.exempt_ids:
+            return await handler(event, data)
+
+        command = self._extract_command(event)
+
+        if not await self.store.hit(f"user:{user.id}", self.config.user_burst, self.config.user_rate):
+            return await self._reject(event, user, "user", command)
+
+        limit = self.config.command_limits.get(command) if command else None
+        if limit:
+            capacity, leak_rate = limit
+            if not await self.store.hit(f"cmd:{command}:{user.id}", capacity, leak_rate):
+                return await self._reject(event, user, "command", command)
+
+        self.passed += 1
+        return await handler(event, data)
+
+    async def _reject(self, event: TelegramObject, user: User, reason: str, command: Optional[str]):
+        """Отбрасывает апдейт и при необходимости уведомляет пользователя"""
+        self.throttled[(reason, command or "")] += 1
+
+        now = time.monotonic()
+        if now - self._notified_at.get(user.id, 0) < self.config.notify_cooldown:
+            return None
+        self._notified_at[user.id] = now
+
+        if len(self._notified_at) > 10000:
+            self._notified_at = {
+                uid: ts for uid, ts in self._notified_at.items()
+                if now - ts < self.config.notify_cooldown
+            }
+
+        try:
+            if isinstance(event, Update) and event.message:
+                await event.message.answer("⏳ Слишком много запросов. Попробуйте чуть позже.")
+            elif isinstance(event, Update) and event.callback_query:
+                await event.callback_query.answer("⏳ Слишком много запросов", show_alert=False)
+        except Exception as e:
+            logger.debug(f"Не удалось уведомить о throttling: {e}")
+
+        return None
+
+    @staticmethod
+    def _extract_command(event: TelegramObject) -> Optional[str]:
+        """Возвращает имя команды (/stats -> stats) или None"""
+        if not isinstance(event, Update) or not event.message or not event.message.text:
+            return None
+
+        text = event.message.text
+        if not text.startswith("/"):
+            return None
+
+        # /stats@bot_name args -> stats
+        parts = text[1:].split(maxsplit=1)
+        if not parts:
+            return None
+        return parts[0].split("@", 1)[0].lower()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики пропущенных и отброшенных апдейтов"""
+        return {
+            "passed": self.passed,
+            "throttled": {
+                f"{reason}:{command}" if command else reason: count
+                for (reason, command), count in self.throttled.items()
+            }
+        }
+
+
+def create_throttle_store(config: ThrottlingConfig) -> ThrottleStore:
+    """Создает хранилище ведер по конфигурации"""
+    if config.backend == "redis":
+        return RedisThrottleStore(config.redis_url)
+    return MemoryThrottleStore()
+
+
+def setup_throttling(dp: Dispatcher, middleware: ThrottlingMiddleware):
+    """
+    Регистрирует middleware сразу после UserContextMiddleware
+
+    Так лимит проверяется до FSM middleware, которое читает состояние из БД.
+    """
+    outer = dp.update.outer_middleware
+    middlewares = list(outer)
+    position = next(
+        (i + 1 for i, m in enumerate(middlewares) if isinstance(m, UserContextMiddleware)),
+        len(middlewares)
+    )
+
+    for m in middlewares:
+        outer.unregister(m)
+    middlewares.insert(position, middleware)
+    for m in middlewares:
+        outer.register(m)
@@ -1,9 +1,92 @@
 """
 Утилиты для работы с базой данных
 """
+import logging
+
 import asyncpg
+import orjson
 from typing import Optional, Dict, Any, List
 from config import DatabaseConfig
+from common.completion_cache import CompletionCache
+from common import invalidation, tracing
+
+logger = logging.getLogger(__name__)
+
+
+# Поля, которые можно обновлять через update_user / update_quiz
+USER_UPDATE_FIELDS = ("username", "first_name", "last_name", "email", "phone", "is_admin")
+QUIZ_UPDATE_FIELDS = ("title", "description", "structure", "settings", "status")
+
+
+def _build_update_sql(table: str, key: str, fields: tuple) -> str:
+    """
+    Строит одну фиксированную команду UPDATE для любого набора полей
+
+    Для каждого поля передается пара параметров (флаг, значение):
+    поле обновляется только если флаг true. Благодаря этому
+    для всех комбинаций kwargs используется один prepared statement.
+    """
+    assignments = ", ".join(
+        f"{field} = CASE WHEN ${i * 2 + 2} THEN ${i * 2 + 3} ELSE {field} END"
+        for i, field in enumerate(fields)
+    )
+    return f"UPDATE {table} SET {assignments} WHERE {key} = $1 RETURNING *"
+
+
+def _update_args(fields: tuple, values: Dict[str, Any]) -> list:
+    """Раскладывает kwargs в пары (флаг, значение) для _build_update_sql"""
+    unknown = set(values) - set(fields)
+    if unknown:
+        raise ValueError(f"Недопустимые поля для обновления: {', '.join(sorted(unknown))}")
+
+    args = []
+    for field in fields:
+        args.append(field in values)
+        args.append(values.get(field))
+    return args
+
+
+# Горячие запросы с фиксированным текстом. asyncpg готовит каждый из них
+# один раз на подключение и дальше берет из кэша prepared statements,
+# поэтому текст запросов не должен зависеть от аргументов.
+STATEMENTS = {
+    "user_by_telegram_id": "SELECT * FROM users WHERE telegram_id = $1",
+    "user_is_admin": "SELECT is_admin FROM users WHERE telegram_id = $1",
+    "user_create": """
+        INSERT INTO users (telegram_id, username, first_name, last_name, email, phone)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING *
+    """,
+    "user_update": _build_update_sql("users", "telegram_id", USER_UPDATE_FIELDS),
+    "quiz_by_id": "SELECT * FROM quizzes WHERE id = $1",
+    "quizzes_by_creator": "SELECT * FROM quizzes WHERE creator_id = $1 ORDER BY created_at DESC",
+    "quiz_update": _build_update_sql("quizzes", "id", QUIZ_UPDATE_FIELDS),
+    "response_create": """
+        INSERT INTO responses (quiz_id, user_id, answers)
+        VALUES ($1, $2, $3)
+        RETURNING *
+    """,
+    "response_exists": "SELECT EXISTS(SELECT 1 FROM responses WHERE quiz_id = $1 AND user_id = $2)",
+    "response_user_ids": "SELECT user_id FROM responses WHERE quiz_id = $1",
+}
+
+
+# Запас под STATEMENTS и редкие ad-hoc запросы
+STATEMENT_CACHE_SIZE = 256
+
+
+def _encode_jsonb(value: Any) -> bytes:
+    """Кодирует значение в бинарный формат JSONB (версия 1 + JSON)"""
+    return b"\x01" + orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _decode_jsonb(data: bytes) -> Any:
+    """Декодирует бинарный формат JSONB"""
+    return orjson.loads(data[1:])
+
+
+def _encode_json(value: Any) -> str:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
 
 
 class Database:
@@ -12,6 +95,7 @@ class Database:
     def __init__(self, config: DatabaseConfig):
         self.config = config
         self.pool: Optional[asyncpg.Pool] = None
+        self.completions = CompletionCache(ttl=config.completion_cache_ttl)
 
     async def connect(self):
         """Создает пул подключений к базе данных"""
@@ -22,7 +106,32 @@ class Database:
             user=self.config.user,
             password=self.config.password,
             min_size=5,
-            max_size=20
+            max_size=20,
+            statement_cache_size=STATEMENT_CACHE_SIZE,
+            init=self.init_connection
+        )
+
+    @staticmethod
+    async def init_connection(conn: asyncpg.Connection):
+        """
+        Инициализация нового подключения пула
+
+        Регистрирует orjson-кодеки для JSON/JSONB: словари передаются
+        в запросы как есть, а JSONB возвращается уже разобранным.
+        """
+        await conn.set_type_codec(
+            "jsonb",
+            encoder=_encode_jsonb,
+            decoder=_decode_jsonb,
+            schema="pg_catalog",
+            format="binary"
+        )
+        await conn.set_type_codec(
+            "json",
+            encoder=_encode_json,
+            decoder=orjson.loads,
+            schema="pg_catalog",
+            format="text"
         )
 
     async def disconnect(self):
@@ -30,16 +139,58 @@ class Database:
         if self.pool:
             await self.pool.close()
 
+    async def _run(self, method: str, name: str, *args):
+        """Выполняет именованный запрос из STATEMENTS на подключении из пула"""
+        if not tracing.is_enabled():
+            async with self.pool.acquire() as conn:
+                return await getattr(conn, method)(STATEMENTS[name], *args)
+
+        with tracing.span(f"db {name}", {"db.system": "postgresql", "db.operation": name}, kind="client"):
+            async with self.pool.acquire() as conn:
+                return await getattr(conn, method)(STATEMENTS[name], *args)
+
+    async def _publish(self, entity: str, op: str, *ids: int):
+        """
+        Событие инвалидации для кэшей API и бота
+
+        Запись уже зафиксирована, поэтому ошибка отправки только логируется:
+        кэши устареют не дольше своего TTL. События опросов отправляет
+        триггер БД notify_quiz_change.
+        """
+        if not self.config.cache_invalidation:
+            return
+        try:
+            await invalidation.publish_async(self.pool, entity, op, ids)
+        except (asyncpg.PostgresError, OSError) as e:
+            logger.warning(f"Не удалось отправить событие {entity}/{op}: {e}")
+
+    def on_quiz_change(self, event: invalidation.ChangeEvent):
+        """Обработчик шины: удаленный опрос уносит с собой ответы"""
+        if event.op != "delete":
+            return
+        if not event.ids:
+            self.completions.invalidate()
+        for quiz_id in event.ids:
+            self.completions.invalidate(quiz_id)
+
+    def on_response(self, event: invalidation.ChangeEvent):
+        """Обработчик шины: ответ, принятый API или другой репликой бота"""
+        if event.op == "insert" and event.data:
+            self.completions.add(event.data["quiz_id"], event.data["user_id"])
+
+    async def _fetchrow(self, name: str, *args) -> Optional[Dict[str, Any]]:
+        row = await self._run("fetchrow", name, *args)
+        return dict(row) if row else None
+
+    async def _fetch(self, name: str, *args) -> List[Dict[str, Any]]:
+        rows = await self._run("fetch", name, *args)
+        return [dict(row) for row in rows]
+
     # ==================== USERS ====================
 
     async def get_user_by_telegram_id(self, telegram_id: int) -> Optional[Dict[str, Any]]:
         """Получить пользователя по Telegram ID"""
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT * FROM users WHERE telegram_id = $1",
-                telegram_id
-            )
-            return dict(row) if row else None
+        return await self._fetchrow("user_by_telegram_id", telegram_id)
 
     async def create_user(
         self,
@@ -51,16 +202,12 @@ class Database:
         phone: Optional[str] = None
     ) -> Dict[str, Any]:
         """Создать нового пользователя"""
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                """
-                INSERT INTO users (telegram_id, username, first_name, last_name, email, phone)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                RETURNING *
-                """,
-                telegram_id, username, first_name, last_name, email, phone
-            )
-            return dict(row)
+        user = await self._fetchrow(
+            "user_create",
+            telegram_id, username, first_name, last_name, email, phone
+        )
+        await self._publish("user", "insert", user["id"])
+        return user
 
     async def update_user(
         self,
@@ -71,24 +218,18 @@ class Database:
         if not kwargs:
             return None
 
-        fields = ", ".join([f"{key} = ${i+2}" for i, key in enumerate(kwargs.keys())])
-        values = [telegram_id] + list(kwargs.values())
-
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                f"UPDATE users SET {fields} WHERE telegram_id = $1 RETURNING *",
-                *values
-            )
-            return dict(row) if row else None
+        user = await self._fetchrow(
+            "user_update",
+            telegram_id, *_update_args(USER_UPDATE_FIELDS, kwargs)
+        )
+        if user:
+            await self._publish("user", "update", user["id"])
+        return user
 
     async def is_admin(self, telegram_id: int) -> bool:
         """Проверить, является ли пользователь администратором"""
-        async with self.pool.acquire() as conn:
-            result = await conn.fetchval(
-                "SELECT is_admin FROM users WHERE telegram_id = $1",
-                telegram_id
-            )
-            return result or False
+        result = await self._run("fetchval", "user_is_admin", telegram_id)
+        return result or False
 
     async def get_all_users(self) -> List[Dict[str, Any]]:
         """Получить всех пользователей"""
@@ -103,27 +244,20 @@ class Database:
                 "UPDATE users SET is_admin = $1 WHERE id = $2",
                 is_admin, user_id
             )
-            return result == "UPDATE 1"
+        if result != "UPDATE 1":
+            return False
+        await self._publish("user", "update", user_id)
+        return True
 
     # ==================== QUIZZES ====================
 
     async def get_quiz_by_id(self, quiz_id: int) -> Optional[Dict[str, Any]]:
         """Получить опрос по ID"""
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT * FROM quizzes WHERE id = $1",
-                quiz_id
-            )
-            return dict(row) if row else None
+        return await self._fetchrow("quiz_by_id", quiz_id)
 
     async def get_quizzes_by_creator(self, creator_id: int) -> List[Dict[str, Any]]:
         """Получить все опросы созданные пользователем"""
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch(
-                "SELECT * FROM quizzes WHERE creator_id = $1 ORDER BY created_at DESC",
-                creator_id
-            )
-            return [dict(row) for row in rows]
+        return await self._fetch("quizzes_by_creator", creator_id)
 
     async def create_quiz(
         self,
@@ -144,22 +278,17 @@ class Database:
                 """,
                 creator_id, title, description, structure or {}, settings or {}, status
             )
-            return dict(row)
+        return dict(row)
 
     async def update_quiz(self, quiz_id: int, **kwargs) -> Optional[Dict[str, Any]]:
         """Обновить опрос"""
         if not kwargs:
             return None
 
-        fields = ", ".join([f"{key} = ${i+2}" for i, key in enumerate(kwargs.keys())])
-        values = [quiz_id] + list(kwargs.values())
-
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                f"UPDATE quizzes SET {fields} WHERE id = $1 RETURNING *",
-                *values
-            )
-            return dict(row) if row else None
+        return await self._fetchrow(
+            "quiz_update",
+            quiz_id, *_update_args(QUIZ_UPDATE_FIELDS, kwargs)
+        )
 
     async def delete_quiz(self, quiz_id: int) -> bool:
         """Удалить опрос"""
@@ -168,7 +297,7 @@ class Database:
                 "DELETE FROM quizzes WHERE id = $1",
                 quiz_id
             )
-            return result == "DELETE 1"
+        return result == "DELETE 1"
 
     # ==================== RESPONSES ====================
 
@@ -179,20 +308,15 @@ class Database:
         answers: Dict
     ) -> Optional[Dict[str, Any]]:
         """Сохранить ответы пользователя"""
-        async with self.pool.acquire() as conn:
-            try:
-                row = await conn.fetchrow(
-                    """
-                    INSERT INTO responses (quiz_id, user_id, answers)
-                    VALUES ($1, $2, $3)
-                    RETURNING *
-                    """,
-                    quiz_id, user_id, answers
-                )
-                return dict(row) if row else None
-            except asyncpg.UniqueViolationError:
-                # Пользователь уже проходил этот опрос
-                return None
+        try:
+            row = await self._fetchrow("response_create", quiz_id, user_id, answers)
+        except asyncpg.UniqueViolationError:
+            # Пользователь уже проходил этот опрос
+            self.completions.confirm(quiz_id, user_id)
+            return None
+
+        self.completions.add(quiz_id, user_id)
+        return row
 
     async def get_responses_by_quiz(self, quiz_id: int) -> List[Dict[str, Any]]:
         """Получить все ответы по опросу"""
@@ -210,13 +334,30 @@ class Database:
             return [dict(row) for row in rows]
 
     async def has_user_completed_quiz(self, quiz_id: int, user_id: int) -> bool:
-        """Проверить, проходил ли пользователь опрос"""
-        async with self.pool.acquire() as conn:
-            result = await conn.fetchval(
-                "SELECT EXISTS(SELECT 1 FROM responses WHERE quiz_id = $1 AND user_id = $2)",
-                quiz_id, user_id
-            )
-            return result
+        """
+        Проверить, проходил ли пользователь опрос
+
+        Отрицательный ответ обычно берется из CompletionCache без запроса к БД,
+        пока шина инвалидации подключена и доносит чужие ответы
+        """
+        trusted = invalidation.bus.connected
+        known = self.completions.check(quiz_id, user_id, trust_negative=trusted)
+        if known is not None:
+            return known
+
+        if trusted and self.completions.needs_load(quiz_id):
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(STATEMENTS["response_user_ids"], quiz_id)
+            self.completions.load(quiz_id, (row["user_id"] for row in rows))
+
+            known = self.completions.check(quiz_id, user_id)
+            if known is not None:
+                return known
+
+        result = await self._run("fetchval", "response_exists", quiz_id, user_id)
+        if result:
+            self.completions.confirm(quiz_id, user_id)
+        return result
 
     # ==================== FILES ====================
 
@@ -0,0 +1,283 @@
+"""
+Хранилища состояний FSM для aiogram
+
+PostgresStorage хранит состояния в таблице fsm_states через общий пул asyncpg,
+поэтому онбординг переживает перезапуск и работает при нескольких репликах бота.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+import orjson
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import FSMStorageConfig
+
+logger = logging.getLogger(__name__)
+
+
+# Одна фиксированная команда для любых частичных обновлений:
+# флаги $2/$4 говорят, какие поля переданы в этой записи
+UPSERT_SQL = """
+    INSERT INTO fsm_states (key, state, data, expires_at, updated_at)
+    VALUES (
+        $1,
+        $3,
+        $5,
+        CASE WHEN $6::int > 0 THEN now() + make_interval(secs => $6::int) END,
+        now()
+    )
+    ON CONFLICT (key) DO UPDATE SET
+        state = CASE WHEN $2 THEN EXCLUDED.state ELSE fsm_states.state END,
+        data = CASE WHEN $4 THEN EXCLUDED.data ELSE fsm_states.data END,
+        expires_at = EXCLUDED.expires_at,
+        updated_at = EXCLUDED.updated_at
+"""
+
+SELECT_SQL = """
+    SELECT state, data FROM fsm_states
+    WHERE key = $1 AND (expires_at IS NULL OR expires_at > now())
+"""
+
+CLEANUP_SQL = """
+    DELETE FROM fsm_states
+    WHERE expires_at <= now() OR (state IS NULL AND data IS NULL)
+"""
+
+
+def _dumps(data: Dict[str, Any]) -> Optional[bytes]:
+    """Компактная сериализация данных FSM (пустые данные не храним)"""
+    if not data:
+        return None
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _loads(raw: Optional[bytes]) -> Dict[str, Any]:
+    """Десериализация данных FSM"""
+    if not raw:
+        return {}
+    return orjson.loads(raw)
+
+
+@dataclass
+class _PendingWrite:
+    """Несохраненное изменение одной записи"""
+    has_state: bool = False
+    state: Optional[str] = None
+    has_data: bool = False
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM хранилище в PostgreSQL
+
+    Записи копятся в памяти и сбрасываются пачкой раз в flush_interval
+    (или сразу при достижении batch_size). Чтение сначала смотрит
+    в несохраненные изменения, затем в БД.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, config: FSMStorageConfig):
+        self.pool = pool
+        self.config = config
+        self.key_builder = DefaultKeyBuilder(
+            with_bot_id=True,
+            with_business_connection_id=True,
+            with_destiny=True
+        )
+        self._pending: Dict[str, _PendingWrite] = {}
+        # Пачка, которая прямо сейчас пишется в БД
+        self._inflight: Dict[str, _PendingWrite] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._closed = False
+
+    async def start(self):
+        """Запускает фоновые задачи пакетной записи и очистки"""
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._cleanup_loop())
+        ]
+
+    # ==================== BaseStorage ====================
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        pending = self._pending_for(key)
+        pending.has_state = True
+        pending.state = state.state if isinstance(state, State) else state
+        self._schedule_flush()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        pending = self._lookup(key, "has_state")
+        if pending:
+            return pending.state
+        state, _ = await self._fetch(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        pending = self._pending_for(key)
+        pending.has_data = True
+        pending.data = data.copy()
+        self._schedule_flush()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        pending = self._lookup(key, "has_data")
+        if pending:
+            return pending.data.copy()
+        _, data = await self._fetch(key)
+        return data
+
+    async def close(self) -> None:
+        """Останавливает фоновые задачи и сбрасывает оставшиеся записи"""
+        if self._closed:
+            return
+        self._closed = True
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        await self.flush()
+
+    # ==================== Пакетная запись ====================
+
+    async def flush(self):
+        """Записывает все накопленные изменения одной пачкой"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+            records = [
+                (
+                    key,
+                    item.has_state,
+                    item.state,
+                    item.has_data,
+                    _dumps(item.data),
+                    self.config.state_ttl
+                )
+                for key, item in batch.items()
+            ]
+
+            try:
+                async with self.pool.acquire() as conn:
+                    await conn.executemany(UPSERT_SQL, records)
+            except Exception:
+                # Возвращаем записи в очередь; поля, измененные с тех пор, не трогаем
+                for key, item in batch.items():
+                    newer = self._pending.get(key)
+                    if newer is None:
+                        self._pending[key] = item
+                        continue
+                    if item.has_state and not newer.has_state:
+                        newer.has_state = True
+                        newer.state = item.state
+                    if item.has_data and not newer.has_data:
+                        newer.has_data = True
+                        newer.data = item.data
+                raise
+            finally:
+                self._inflight = {}
+
+    async def _flush_loop(self):
+        """Фоновый сброс изменений"""
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._flush_requested.wait(),
+                    timeout=self.config.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка записи состояний FSM: {e}")
+
+    async def _cleanup_loop(self):
+        """Фоновая очистка просроченных и пустых состояний"""
+        while True:
+            await asyncio.sleep(self.config.cleanup_interval)
+            try:
+                async with self.pool.acquire() as conn:
+                    result = await conn.execute(CLEANUP_SQL)
+                logger.debug(f"Очистка состояний FSM: {result}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка очистки состояний FSM: {e}")
+
+    def _schedule_flush(self):
+        if len(self._pending) >= self.config.batch_size:
+            self._flush_requested.set()
+
+    # ==================== Вспомогательные ====================
+
+    def _build_key(self, key: StorageKey) -> str:
+        return self.key_builder.build(key)
+
+    def _lookup(self, key: StorageKey, flag: str) -> Optional[_PendingWrite]:
+        """Ищет несохраненное значение поля в очереди и в записываемой пачке"""
+        built_key = self._build_key(key)
+        for source in (self._pending, self._inflight):
+            item = source.get(built_key)
+            if item and getattr(item, flag):
+                return item
+        return None
+
+    def _pending_for(self, key: StorageKey) -> _PendingWrite:
+        return self._pending.setdefault(self._build_key(key), _PendingWrite())
+
+    async def _fetch(self, key: StorageKey):
+        """Читает состояние и данные из БД"""
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(SELECT_SQL, self._build_key(key))
+
+        if not row:
+            return None, {}
+        return row['state'], _loads(row['data'])
+
+
+async def create_fsm_storage(config: FSMStorageConfig, pool: asyncpg.Pool) -> BaseStorage:
+    """
+    Создает хранилище FSM по конфигурации
+
+    Args:
+        config: Конфигурация FSM
+        pool: Пул подключений к PostgreSQL
+    """
+    if config.backend == "memory":
+        return MemoryStorage()
+
+    if config.backend == "redis":
+        # Требует установленный пакет redis
+        from aiogram.fsm.storage.redis import RedisStorage, DefaultKeyBuilder as RedisKeyBuilder
+
+        ttl = config.state_ttl or None
+        return RedisStorage.from_url(
+            config.redis_url,
+            key_builder=RedisKeyBuilder(with_bot_id=True, with_destiny=True),
+            state_ttl=ttl,
+            data_ttl=ttl,
+            json_loads=orjson.loads,
+            json_dumps=lambda data: orjson.dumps(data).decode()
+        )
+
+    if config.backend == "postgres":
+        storage = PostgresStorage(pool, config)
+        await storage.start()
+        return storage
+
+    raise ValueError(f"Неизвестный FSM_STORAGE: {config.backend}")
@@ -0,0 +1,123 @@
+"""
+Метрики бота
+
+Длительность хендлеров aiogram, занятость пула asyncpg, счетчики
+throttling и кэша прохождения опросов. Метрики отдаются отдельным
+небольшим aiohttp сервером на /metrics.
+"""
+import logging
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiohttp import web
+from aiogram import Dispatcher
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from common.metrics import CONTENT_TYPE, REGISTRY, completion_cache_collector, counter_samples, gauge_samples
+from utils.database import Database
+from middlewares.throttling import ThrottlingMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+HANDLER_DURATION = REGISTRY.histogram(
+    "bot_handler_duration_seconds",
+    "Время выполнения хендлера aiogram",
+    ("event", "handler")
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "bot_handler_errors",
+    "Исключения в хендлерах aiogram",
+    ("event", "handler")
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: замеряет время выбранного хендлера"""
+
+    def __init__(self, event_type: str):
+        self.event_type = event_type
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+
+        start = perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(self.event_type, name)
+            raise
+        finally:
+            HANDLER_DURATION.observe(perf_counter() - start, self.event_type, name)
+
+
+def setup_handler_metrics(dp: Dispatcher):
+    """Регистрирует замер хендлеров для всех используемых типов апдейтов"""
+    for event_type in dp.resolve_used_update_types():
+        observer = dp.observers.get(event_type)
+        if observer is not None:
+            observer.middleware(HandlerMetricsMiddleware(event_type))
+
+
+def register_bot_collectors(db: Database, throttling: Optional[ThrottlingMiddleware] = None):
+    """Метрики, которые считаются при чтении: пул asyncpg, throttling, кэш"""
+
+    def collect_pool():
+        pool = db.pool
+        if pool is None:
+            return
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        yield gauge_samples(
+            "bot_db_pool_connections",
+            "Подключения пула asyncpg",
+            {
+                ("in_use",): size - idle,
+                ("idle",): idle,
+                ("size",): size,
+                ("max",): pool.get_max_size(),
+            },
+            ("state",)
+        )
+
+    REGISTRY.add_collector(collect_pool)
+    REGISTRY.add_collector(completion_cache_collector(db.completions, "bot"))
+
+    if throttling is not None:
+        def collect_throttling():
+            yield counter_samples(
+                "bot_throttled_updates",
+                "Апдейты, отброшенные throttling",
+                {(reason, command): count for (reason, command), count in throttling.throttled.items()},
+                ("reason", "command")
+            )
+            yield counter_samples(
+                "bot_throttling_passed_updates",
+                "Апдейты, прошедшие throttling",
+                {(): throttling.passed}
+            )
+
+        REGISTRY.add_collector(collect_throttling)
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Запускает HTTP сервер с /metrics"""
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(body=REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"📈 Метрики: http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,248 @@
+"""
+Локальный mock-сервер Telegram Bot API для тестов и нагрузочных прогонов
+
+Принимает запросы в формате Bot API (/bot{token}/{method} и /file/bot{token}/{path}),
+отвечает правдоподобными объектами и запоминает все вызовы. Апдейты для
+getUpdates подкладываются через служебные ручки:
+
+    POST /_mock/updates   - добавить апдейт (JSON объекта Update без update_id)
+    GET  /_mock/calls     - список вызовов (?method=sendMessage для фильтра)
+    GET  /_mock/stats     - количество вызовов по методам
+    POST /_mock/reset     - очистить вызовы и очередь апдейтов
+
+Запуск:
+    python bot/utils/mock_api_server.py --port 8081 --latency 0.02
+
+и в bot/.env:
+    TELEGRAM_API_URL=http://localhost:8081
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+
+BOT_USER = {
+    "id": 1000000001,
+    "is_bot": True,
+    "first_name": "Mock Bot",
+    "username": "mock_oprosy_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+# Методы отправки, которые возвращают Message
+SEND_METHODS = {
+    "sendmessage", "sendphoto", "senddocument", "sendvideo", "sendaudio",
+    "sendvoice", "sendanimation", "sendsticker", "sendlocation", "sendcontact",
+    "sendpoll", "senddice", "forwardmessage", "editmessagetext",
+    "editmessagereplymarkup", "editmessagecaption",
+}
+
+# Поля с файлами и тип объекта в ответе
+FILE_FIELDS = {
+    "photo": "photo", "document": "document", "video": "video",
+    "audio": "audio", "voice": "voice", "animation": "animation", "sticker": "sticker",
+}
+
+
+class MockBotAPI:
+    """Состояние mock-сервера"""
+
+    def __init__(self, latency: float = 0.0, max_calls: int = 100000):
+        self.latency = latency
+        self.max_calls = max_calls
+        self.calls: List[Dict[str, Any]] = []
+        self.stats: Counter = Counter()
+        self.files: Dict[str, bytes] = {}
+        self._updates: List[Dict[str, Any]] = []
+        self._update_id = 0
+        self._message_id = 0
+        self._new_updates = asyncio.Event()
+
+    # ==================== Служебные ручки ====================
+
+    def add_update(self, update: Dict[str, Any]) -> Dict[str, Any]:
+        self._update_id += 1
+        update = {**update, "update_id": self._update_id}
+        self._updates.append(update)
+        self._new_updates.set()
+        return update
+
+    def reset(self):
+        self.calls.clear()
+        self.stats.clear()
+        self.files.clear()
+        self._updates.clear()
+
+    # ==================== Bot API ====================
+
+    async def call(self, method: str, params: Dict[str, Any]) -> Any:
+        """Обрабатывает вызов метода Bot API и возвращает поле result"""
+        name = method.lower()
+        self.stats[method] += 1
+        if len(self.calls) < self.max_calls:
+            self.calls.append({"method": method, "params": params, "ts": time.time()})
+
+        if name == "getupdates":
+            return await self._get_updates(params)
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if name == "getme":
+            return BOT_USER
+        if name == "getfile":
+            file_id = params.get("file_id", "")
+            return {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(self.files.get(file_id, b"")),
+                "file_path": f"documents/{file_id}",
+            }
+        if name in SEND_METHODS:
+            return self._message(params)
+        # deleteWebhook, answerCallbackQuery, setMyCommands и прочие методы с bool
+        return True
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        if offset:
+            # Подтвержденные апдейты больше не отдаем
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+
+        if not self._updates:
+            self._new_updates.clear()
+            timeout = min(float(params.get("timeout") or 0), 30.0)
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        limit = int(params.get("limit") or 100)
+        return self._updates[:limit]
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        self._message_id += 1
+        chat_id = params.get("chat_id") or 0
+        message = {
+            "message_id": params.get("message_id") or self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0, "type": "private"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if "caption" in params:
+            message["caption"] = params["caption"]
+
+        for field, kind in FILE_FIELDS.items():
+            file_id = params.get(field)
+            if file_id is None:
+                continue
+            size = len(self.files.get(file_id, b""))
+            obj = {"file_id": file_id, "file_unique_id": file_id, "file_size": size}
+            if kind == "photo":
+                message["photo"] = [{**obj, "width": 1, "height": 1}]
+            elif kind == "sticker":
+                message["sticker"] = {**obj, "type": "regular", "width": 1, "height": 1,
+                                      "is_animated": False, "is_video": False}
+            else:
+                message[kind] = obj
+        return message
+
+
+async def _read_params(request: web.Request, api: MockBotAPI) -> Dict[str, Any]:
+    """Разбирает параметры вызова: JSON, urlencoded или multipart с файлами"""
+    if request.content_type == "application/json":
+        return await request.json()
+
+    params: Dict[str, Any] = {}
+    if request.content_type == "multipart/form-data":
+        reader = await request.multipart()
+        async for part in reader:
+            if part.filename:
+                # Файл читаем потоком, в ответе вернется его идентификатор
+                data = bytearray()
+                while chunk := await part.read_chunk(1 << 20):
+                    data.extend(chunk)
+                file_id = f"mock-{len(api.files) + 1}"
+                api.files[file_id] = bytes(data)
+                params[part.name] = file_id
+            else:
+                params[part.name] = _decode(await part.text())
+    else:
+        form = await request.post()
+        params = {key: _decode(value) for key, value in form.items()}
+
+    # Ссылка attach://name указывает на файл из отдельного поля
+    for key, value in list(params.items()):
+        if isinstance(value, str) and value.startswith("attach://"):
+            params[key] = params.get(value[len("attach://"):], value)
+    return params
+
+
+def _decode(value: Any) -> Any:
+    """aiogram передает вложенные объекты JSON-строками"""
+    if isinstance(value, str) and value[:1] in "[{":
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def create_app(api: Optional[MockBotAPI] = None) -> web.Application:
+    """Создает aiohttp приложение mock-сервера"""
+    api = api or MockBotAPI()
+    app = web.Application(client_max_size=0)
+    app["api"] = api
+
+    async def handle_method(request: web.Request) -> web.Response:
+        params = await _read_params(request, api)
+        result = await api.call(request.match_info["method"], params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(request: web.Request) -> web.Response:
+        file_id = request.match_info["path"].rsplit("/", 1)[-1]
+        if file_id not in api.files:
+            return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+        return web.Response(body=api.files[file_id], content_type="application/octet-stream")
+
+    async def push_update(request: web.Request) -> web.Response:
+        return web.json_response(api.add_update(await request.json()))
+
+    async def list_calls(request: web.Request) -> web.Response:
+        method = request.query.get("method")
+        calls = [c for c in api.calls if not method or c["method"].lower() == method.lower()]
+        return web.json_response(calls)
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(dict(api.stats))
+
+    async def reset(request: web.Request) -> web.Response:
+        api.reset()
+        return web.json_response({"ok": True})
+
+    app.router.add_post("/_mock/updates", push_update)
+    app.router.add_get("/_mock/calls", list_calls)
+    app.router.add_get("/_mock/stats", stats)
+    app.router.add_post("/_mock/reset", reset)
+    app.router.add_route("*", "/bot{token}/{method}", handle_method)
+    app.router.add_get("/file/bot{token}/{path:.+}", handle_file)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Искусственная задержка ответа, секунд")
+    args = parser.parse_args()
+
+    web.run_app(create_app(MockBotAPI(latency=args.latency)), host=args.host, port=args.port)
@@ -0,0 +1,79 @@
+"""
+HTTP-сессия бота для Telegram Bot API
+
+Позволяет направить бота на собственный сервер Bot API (telegram-bot-api
+в режиме --local снимает ограничения на размер файлов и частоту отправки)
+и настроить пул соединений aiohttp.
+"""
+import logging
+from pathlib import Path
+from typing import Any
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, SimpleFilesPathWrapper, TelegramAPIServer
+
+from config import BotAPIConfig
+
+logger = logging.getLogger(__name__)
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """
+    AiohttpSession с настраиваемым пулом соединений
+
+    Стандартная сессия aiogram задает только общий лимит соединений.
+    Здесь дополнительно задаются лимит на хост, время жизни keep-alive
+    соединений и кэш DNS.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 60.0,
+        dns_cache_ttl: int = 3600,
+        **kwargs: Any
+    ):
+        super().__init__(limit=limit, **kwargs)
+        self._connector_init.update({
+            "limit_per_host": limit_per_host,
+            "keepalive_timeout": keepalive_timeout,
+            "ttl_dns_cache": dns_cache_ttl,
+            "enable_cleanup_closed": True,
+        })
+
+
+def build_api_server(config: BotAPIConfig) -> TelegramAPIServer:
+    """Описание сервера Bot API по конфигурации"""
+    if not config.server_url:
+        return PRODUCTION
+
+    kwargs = {"is_local": config.is_local}
+    if config.files_server_path and config.files_local_path:
+        # Сервер отдает абсолютные пути из своего --dir, у бота тот же каталог смонтирован иначе
+        kwargs["wrap_local_file"] = SimpleFilesPathWrapper(
+            server_path=Path(config.files_server_path),
+            local_path=Path(config.files_local_path)
+        )
+    return TelegramAPIServer.from_base(config.server_url, **kwargs)
+
+
+def create_bot_session(config: BotAPIConfig) -> TunedAiohttpSession:
+    """
+    Создает HTTP-сессию бота
+
+    Args:
+        config: Конфигурация подключения к Bot API
+    """
+    api = build_api_server(config)
+    if api is not PRODUCTION:
+        logger.info(f"🛰 Bot API сервер: {config.server_url} (local={config.is_local})")
+
+    return TunedAiohttpSession(
+        api=api,
+        limit=config.connection_limit,
+        limit_per_host=config.connection_limit_per_host,
+        keepalive_timeout=config.keepalive_timeout,
+        dns_cache_ttl=config.dns_cache_ttl,
+        timeout=config.request_timeout
+    )
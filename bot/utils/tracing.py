@@ -0,0 +1,80 @@
+"""
+Трассировка бота
+
+Outer middleware на апдейтах создает CONSUMER спан на каждый апдейт
+Telegram. Внутри него идут спаны запросов к БД (Database._run), а ссылки
+WebApp получают traceparent (common.tracing.with_traceparent), поэтому
+запросы WebApp к API продолжают трассу апдейта.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind
+
+from config import TracingConfig
+from common.tracing import setup_tracing
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Outer middleware: спан на обработку апдейта"""
+
+    def __init__(self):
+        self.tracer = trace.get_tracer("oprosy.bot")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        event_type = event.event_type
+        attributes = {
+            "telegram.update_id": event.update_id,
+            "telegram.update_type": event_type,
+        }
+        if event.message is not None and event.message.text and event.message.text.startswith("/"):
+            attributes["telegram.command"] = event.message.text.split(maxsplit=1)[0]
+
+        with self.tracer.start_as_current_span(
+            f"update {event_type}",
+            kind=SpanKind.CONSUMER,
+            attributes=attributes,
+            record_exception=True,
+            set_status_on_exception=True
+        ) as span:
+            try:
+                result = await handler(event, data)
+            finally:
+                # Пользователя определяет UserContextMiddleware, он идет после нас
+                user = data.get("event_from_user")
+                if user is not None:
+                    span.set_attribute("telegram.user_id", user.id)
+            span.set_attribute("telegram.handled", result is not UNHANDLED)
+            return result
+
+
+def setup_bot_tracing(dp: Dispatcher, config: TracingConfig) -> bool:
+    """Настраивает трассировку и регистрирует middleware апдейтов"""
+    if not config.enabled:
+        return False
+    if not setup_tracing(
+        "oprosy-bot",
+        exporter=config.exporter,
+        sample_ratio=config.sample_ratio,
+        file_path=config.file_path,
+        otlp_endpoint=config.otlp_endpoint or None
+    ):
+        return False
+
+    # Первым в цепочке, чтобы спан охватывал throttling и загрузку FSM
+    outer = dp.update.outer_middleware
+    middlewares = list(outer)
+    for m in middlewares:
+        outer.unregister(m)
+    for m in [TracingMiddleware(), *middlewares]:
+        outer.register(m)
+    return True
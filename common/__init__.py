@@ -0,0 +1,3 @@
+"""
+Общий код для API и бота
+"""
@@ -0,0 +1,213 @@
+"""
+Кэш прохождения опросов: "отвечал ли пользователь на опрос?"
+
+Для каждого опроса в памяти держится множество user_id всех ответивших:
+битовая карта по users.id (id плотные, карта точная и строится быстро)
+или Bloom-фильтр, если id слишком разрежены. Обе структуры не ошибаются
+в отрицательную сторону, поэтому "не проходил" отдается без запроса к БД.
+"Возможно проходил" проверяется точным запросом, подтвержденные ответы
+запоминаются.
+
+Хранилище не зависит от драйвера БД: загрузку и точную проверку выполняет
+вызывающий код (asyncpg в боте, SQLAlchemy в API).
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Set
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value: int) -> int:
+    """splitmix64: быстрое перемешивание целого числа"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class BloomFilter:
+    """Bloom-фильтр для целых чисел"""
+
+    __slots__ = ("size", "hashes", "bits", "count", "capacity")
+
+    # Возможны ложноположительные ответы
+    exact = False
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 64)
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def add(self, item: int):
+        # Двойное хеширование: h1 + i * h2
+        h1 = _mix64(item)
+        h2 = _mix64(h1) | 1
+        bits, size = self.bits, self.size
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % size
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: int) -> bool:
+        h1 = _mix64(item)
+        h2 = _mix64(h1) | 1
+        bits, size = self.bits, self.size
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    @property
+    def saturated(self) -> bool:
+        """Фильтр переполнен и дает слишком много ложных срабатываний"""
+        return self.count > self.capacity
+
+
+class IdBitmap:
+    """Точная битовая карта неотрицательных целых id"""
+
+    __slots__ = ("bits",)
+
+    exact = True
+    saturated = False
+
+    def __init__(self, max_id: int = 0):
+        self.bits = bytearray(max_id // 8 + 1)
+
+    def add(self, item: int):
+        index = item >> 3
+        if index >= len(self.bits):
+            self.bits.extend(bytes(index - len(self.bits) + 1))
+        self.bits[index] |= 1 << (item & 7)
+
+    def __contains__(self, item: int) -> bool:
+        index = item >> 3
+        return 0 <= index < len(self.bits) and bool(self.bits[index] & (1 << (item & 7)))
+
+
+class _QuizCompletions:
+    """Состояние кэша одного опроса"""
+
+    __slots__ = ("members", "confirmed", "loaded_at")
+
+    def __init__(self, members):
+        self.members = members
+        self.confirmed: Set[int] = set()
+        self.loaded_at = time.monotonic()
+
+
+class CompletionCache:
+    """
+    Кэш прохождения опросов на процесс
+
+    check() возвращает:
+        False - пользователь точно не проходил опрос
+        True  - прохождение подтверждено ранее
+        None  - ответа нет, нужен запрос к БД (и, возможно, load())
+
+    Ответы, принятые другими процессами, приходят через шину инвалидации
+    (entity response) и добавляются через add(). Пока шина не подключена,
+    о чужих ответах процесс не знает, и отрицательному ответу кэша верить
+    нельзя: вызывающий код передает trust_negative=False.
+    """
+
+    # Максимум подтвержденных user_id на опрос
+    MAX_CONFIRMED = 10000
+    # Битовая карта используется, пока на один id приходится не больше
+    # стольких байт (иначе id слишком разрежены и выгоднее Bloom-фильтр)
+    BITMAP_BYTES_PER_ID = 16
+    BITMAP_MIN_BYTES = 64 * 1024
+
+    def __init__(self, ttl: float = 60, error_rate: float = 0.01, max_quizzes: int = 1000):
+        self.ttl = ttl
+        self.error_rate = error_rate
+        self.max_quizzes = max_quizzes
+        self._quizzes: "OrderedDict[int, _QuizCompletions]" = OrderedDict()
+        # Счетчики для метрик
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, quiz_id: int) -> Optional[_QuizCompletions]:
+        entry = self._quizzes.get(quiz_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.loaded_at > self.ttl or entry.members.saturated:
+            del self._quizzes[quiz_id]
+            return None
+        self._quizzes.move_to_end(quiz_id)
+        return entry
+
+    def check(self, quiz_id: int, user_id: int, trust_negative: bool = True) -> Optional[bool]:
+        """Быстрая проверка без обращения к БД"""
+        entry = self._get(quiz_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if user_id in entry.confirmed:
+            self.hits += 1
+            return True
+        if user_id not in entry.members:
+            if not trust_negative:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return False
+        if entry.members.exact:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return None
+
+    def needs_load(self, quiz_id: int) -> bool:
+        """Нужно ли загрузить список ответивших для опроса"""
+        return self._get(quiz_id) is None
+
+    def load(self, quiz_id: int, user_ids: Iterable[int]):
+        """Строит множество по полному списку ответивших на опрос"""
+        user_ids = list(user_ids)
+        max_id = max(user_ids, default=0)
+
+        if max_id // 8 <= len(user_ids) * self.BITMAP_BYTES_PER_ID + self.BITMAP_MIN_BYTES:
+            members = IdBitmap(max_id)
+        else:
+            # Запас под новые ответы до следующей перезагрузки
+            members = BloomFilter(capacity=len(user_ids) * 2 + 1024, error_rate=self.error_rate)
+
+        for user_id in user_ids:
+            members.add(user_id)
+
+        self._quizzes[quiz_id] = _QuizCompletions(members)
+        self._quizzes.move_to_end(quiz_id)
+        while len(self._quizzes) > self.max_quizzes:
+            self._quizzes.popitem(last=False)
+
+    def add(self, quiz_id: int, user_id: int):
+        """Отмечает принятый ответ (своего процесса или из шины)"""
+        entry = self._get(quiz_id)
+        if entry is None or user_id in entry.confirmed:
+            return
+        entry.members.add(user_id)
+        self.confirm(quiz_id, user_id)
+
+    def confirm(self, quiz_id: int, user_id: int):
+        """Запоминает прохождение, подтвержденное точным запросом"""
+        entry = self._get(quiz_id)
+        if entry is None or len(entry.confirmed) >= self.MAX_CONFIRMED:
+            return
+        entry.confirmed.add(user_id)
+
+    def invalidate(self, quiz_id: Optional[int] = None):
+        """Сбрасывает кэш опроса (или весь кэш)"""
+        if quiz_id is None:
+            self._quizzes.clear()
+        else:
+            self._quizzes.pop(quiz_id, None)
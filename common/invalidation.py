@@ -0,0 +1,159 @@
+"""
+Шина инвалидации кэшей между процессами
+
+Код, меняющий опросы, ссылки, пользователей или настройки, публикует
+типизированное событие ChangeEvent через pg_notify (канал
+cache_invalidation). Воркеры API и бот получают его через свое
+подключение LISTEN (common.pg_notify.PgListener) и вызывают обработчики
+подписанных кэшей.
+
+- SQLAlchemy (publish): уведомление в транзакции изменения, уходит с COMMIT
+- asyncpg (publish_async): отдельный запрос после записи в autocommit
+- ids пустой - изменились все объекты сущности
+- после потери соединения LISTEN события могли пропасть, поэтому
+  вызываются обработчики полного сброса (on_flush)
+
+События опросов отправляет триггер БД notify_quiz_change (миграция
+008): уведомление уходит в транзакции любого писателя, и потерять его
+при сбое после COMMIT нельзя. Код публикует только остальные сущности.
+Новые ответы (entity response, data: quiz_id и user_id) так же
+отправляет триггер notify_response_insert (миграция 009) - по ним
+кэши прохождения опросов всех процессов узнают о чужих ответах.
+"""
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from common.metrics import REGISTRY
+from common.pg_notify import MAX_PAYLOAD_BYTES, NOTIFY_SQL, PgListener
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+
+ENTITIES = frozenset({"quiz", "link", "user", "settings", "response"})
+OPS = frozenset({"insert", "update", "delete"})
+
+# Больше id в событии - сбрасывается вся сущность
+MAX_IDS = 500
+
+INVALIDATION_EVENTS = REGISTRY.counter(
+    "cache_invalidation_events",
+    "Полученные события инвалидации",
+    ("entity", "op")
+)
+INVALIDATION_FLUSHES = REGISTRY.counter(
+    "cache_invalidation_flushes",
+    "Полные сбросы кэшей после потери событий"
+)
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """Изменение сущности"""
+    entity: str
+    op: str
+    # Пусто - изменились все объекты сущности
+    ids: Tuple[int, ...] = ()
+    # Новое значение для небольших сущностей (настройки)
+    data: Optional[Dict[str, Any]] = None
+
+    def to_payload(self) -> str:
+        payload: Dict[str, Any] = {"entity": self.entity, "op": self.op, "ids": list(self.ids)}
+        if self.data is not None:
+            payload["data"] = self.data
+        encoded = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+        if len(encoded.encode()) > MAX_PAYLOAD_BYTES:
+            raise ValueError(f"Событие {self.entity} больше {MAX_PAYLOAD_BYTES} байт")
+        return encoded
+
+    @classmethod
+    def from_payload(cls, payload: str) -> "ChangeEvent":
+        raw = json.loads(payload)
+        return change_event(raw["entity"], raw["op"], raw.get("ids") or (), raw.get("data"))
+
+
+def change_event(entity: str, op: str, ids: Iterable[int] = (), data: Optional[Dict[str, Any]] = None) -> ChangeEvent:
+    if entity not in ENTITIES:
+        raise ValueError(f"Неизвестная сущность {entity}")
+    if op not in OPS:
+        raise ValueError(f"Неизвестная операция {op}")
+    ids = tuple(int(value) for value in ids)
+    if len(ids) > MAX_IDS:
+        ids = ()
+    return ChangeEvent(entity, op, ids, data)
+
+
+class InvalidationBus:
+    """Обработчики событий по сущностям и полного сброса"""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[ChangeEvent], Any]]] = {}
+        self._flush_handlers: List[Callable[[], Any]] = []
+        self.listener: Optional[PgListener] = None
+
+    @property
+    def connected(self) -> bool:
+        """Пока False, события не доходят и кэшам не стоит доверять"""
+        return self.listener is not None and self.listener.connected
+
+    def subscribe(self, entity: str, handler: Callable[[ChangeEvent], Any]):
+        if entity not in ENTITIES:
+            raise ValueError(f"Неизвестная сущность {entity}")
+        self._handlers.setdefault(entity, []).append(handler)
+
+    def on_flush(self, handler: Callable[[], Any]):
+        self._flush_handlers.append(handler)
+
+    def attach(self, listener: PgListener):
+        """Получать события через LISTEN процесса"""
+        self.listener = listener
+        listener.subscribe(CHANNEL, self._on_payload)
+        listener.on_reconnect(self.flush_all)
+
+    def dispatch(self, event: ChangeEvent):
+        INVALIDATION_EVENTS.inc(event.entity, event.op)
+        for handler in self._handlers.get(event.entity, ()):
+            try:
+                handler(event)
+            except Exception:
+                logger.exception(f"Ошибка обработчика инвалидации {event.entity}")
+
+    def flush_all(self):
+        INVALIDATION_FLUSHES.inc()
+        for handler in self._flush_handlers:
+            try:
+                handler()
+            except Exception:
+                logger.exception("Ошибка полного сброса кэша")
+
+    def _on_payload(self, payload: str):
+        try:
+            event = ChangeEvent.from_payload(payload)
+        except (ValueError, KeyError, TypeError):
+            # Непонятное событие могло касаться любого кэша
+            logger.warning(f"Некорректное событие инвалидации: {payload[:200]}")
+            self.flush_all()
+            return
+        self.dispatch(event)
+
+
+bus = InvalidationBus()
+
+
+def publish(session, entity: str, op: str, ids: Iterable[int] = (), data: Optional[Dict[str, Any]] = None):
+    """Событие в транзакции сессии SQLAlchemy (доставляется после COMMIT)"""
+    from sqlalchemy import text
+
+    event = change_event(entity, op, ids, data)
+    session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": CHANNEL, "payload": event.to_payload()}
+    )
+
+
+async def publish_async(connection, entity: str, op: str, ids: Iterable[int] = (), data: Optional[Dict[str, Any]] = None):
+    """Событие через подключение или пул asyncpg"""
+    event = change_event(entity, op, ids, data)
+    await connection.execute(NOTIFY_SQL, CHANNEL, event.to_payload())
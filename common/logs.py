@@ -0,0 +1,269 @@
+"""
+Неблокирующее логирование для API и бота
+
+Корневой логгер пишет только в QueueHandler: на горячем пути запись
+проходит ограничение частоты, получает request_id и кладется в очередь
+без ожидания. Форматирование (JSON, трейсбеки) и запись в stdout делает
+фоновый поток QueueListener, поэтому всплеск ошибок не блокирует
+event loop записью в поток вывода.
+
+Ограничение частоты - token bucket на место вызова (логгер, уровень,
+файл, строка): одинаковые ошибки из одного места не забивают очередь,
+а число подавленных записей попадает в поле suppressed следующей
+пропущенной записи. Переполненная очередь отбрасывает записи
+(счетчик log_records_dropped), а не останавливает запрос.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+from common.metrics import REGISTRY
+from common import tracing
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "log_records_dropped",
+    "Записи лога, отброшенные до вывода",
+    ("reason",)
+)
+
+# Идентификатор запроса (HTTP запроса API или апдейта бота)
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+# Стандартные атрибуты LogRecord, остальные считаются extra-полями
+# (color_message - дубль сообщения с ANSI цветами от uvicorn)
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "color_message"}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def parse_rate_limits(raw: str) -> Dict[str, Tuple[float, float]]:
+    """
+    Лимиты логгеров вида "utils.auth=5/60,uvicorn.error=0"
+
+    5/60 - не больше 5 записей из одного места за 60 секунд,
+    0 - без ограничения. Возвращает {логгер: (размер всплеска, записей в секунду)}.
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        name, _, limit = item.partition("=")
+        count, _, period = limit.partition("/")
+        capacity = float(count)
+        limits[name.strip()] = (capacity, capacity / float(period or 1))
+    return limits
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket на место вызова с настройкой по префиксу имени логгера"""
+
+    def __init__(self, rate: float, burst: float, limits: Optional[Dict[str, Tuple[float, float]]] = None):
+        super().__init__()
+        self.default = (burst, rate)
+        self.limits = limits or {}
+        self._logger_limits: Dict[str, Tuple[float, float]] = {}
+        # {место вызова: [токены, время обновления, подавлено]}
+        self._buckets: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def _limit_for(self, name: str) -> Tuple[float, float]:
+        limit = self._logger_limits.get(name)
+        if limit is None:
+            # Самый длинный совпавший префикс: "uvicorn" покрывает "uvicorn.error"
+            limit = self.default
+            best = -1
+            for prefix, value in self.limits.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                    limit, best = value, len(prefix)
+            self._logger_limits[name] = limit
+        return limit
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        burst, rate = self._limit_for(record.name)
+        if burst <= 0:
+            return True
+
+        key = (record.name, record.levelno, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now, 0]
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            if bucket[0] < 1:
+                bucket[2] += 1
+                LOG_RECORDS_DROPPED.inc("rate_limited")
+                return False
+
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler с дешевой подготовкой записи
+
+    Стандартный prepare форматирует запись (включая трейсбек) в потоке
+    вызова. Здесь собирается только текст сообщения, а exc_info уходит
+    в очередь как есть и форматируется слушателем.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение собирается сразу: аргументы могут измениться после возврата
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_id = request_id_var.get()
+        if tracing.is_enabled():
+            record.trace_id = tracing.current_trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc("queue_full")
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+        self.pid = os.getpid()
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "service": self.service,
+            "pid": record.process or self.pid,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Текстовый формат для разработки"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", None)
+        return f"{text} (+{suppressed} подавлено)" if suppressed else text
+
+
+class _Pipeline:
+    """Очередь, обработчик на корневом логгере и фоновый слушатель"""
+
+    def __init__(self, queue_size: int, output: logging.Handler, rate_filter: RateLimitFilter):
+        self.queue_size = queue_size
+        self.output = output
+        self.handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+        self.handler.addFilter(rate_filter)
+        self.listener = QueueListener(self.handler.queue, output, respect_handler_level=True)
+
+    def start(self):
+        self.listener.start()
+
+    def restart_after_fork(self):
+        """Поток слушателя не переживает fork: новая очередь и слушатель"""
+        self.handler.queue = queue.Queue(self.queue_size)
+        self.listener = QueueListener(self.handler.queue, self.output, respect_handler_level=True)
+        self.listener.start()
+
+
+_pipeline: Optional[_Pipeline] = None
+
+
+def setup_logging(
+    service: str,
+    level: str = "INFO",
+    fmt: str = "json",
+    queue_size: int = 10000,
+    rate: float = 10.0,
+    burst: float = 20.0,
+    limits: Optional[Dict[str, Tuple[float, float]]] = None
+):
+    """
+    Настраивает корневой логгер процесса (повторный вызов ничего не меняет)
+
+    Args:
+        fmt: json | text
+        rate, burst: лимит записей из одного места вызова по умолчанию
+        limits: лимиты по логгерам, см. parse_rate_limits
+    """
+    global _pipeline
+    if _pipeline is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter(service) if fmt == "json" else TextFormatter(TEXT_FORMAT))
+
+    _pipeline = _Pipeline(queue_size, output, RateLimitFilter(rate, burst, limits))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_pipeline.handler)
+    root.setLevel(level.upper())
+
+    _pipeline.start()
+
+
+def shutdown_logging():
+    """
+    Дописывает очередь и переключает логирование на прямой вывод
+
+    Вызывается при остановке процесса: записи после этого (сообщения
+    сервера о завершении) выводятся синхронно, а не теряются в очереди.
+    """
+    global _pipeline
+    if _pipeline is None:
+        return
+
+    pipeline, _pipeline = _pipeline, None
+    pipeline.listener.stop()
+
+    root = logging.getLogger()
+    root.removeHandler(pipeline.handler)
+    root.addHandler(pipeline.output)
+
+
+def _after_fork_in_child():
+    if _pipeline is not None:
+        _pipeline.restart_after_fork()
+
+
+# Поток слушателя - демон: без этого хвост очереди теряется при выходе
+atexit.register(shutdown_logging)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
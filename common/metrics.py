@@ -0,0 +1,372 @@
+"""
+Метрики в текстовом формате Prometheus
+
+Небольшой реестр без внешних зависимостей. На горячем пути метрика -
+это словарь {значения меток: число}, обновление стоит одного поиска
+в словаре. Значения, которые дешевле посчитать при чтении (размер пула,
+счетчики кэшей), отдаются через collectors и вычисляются только при
+запросе /metrics.
+
+В pre-fork сервере у каждого воркера свой реестр; MultiprocessMetrics
+собирает их в один ответ /metrics через снимки в общем каталоге.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Границы по умолчанию для задержек в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Семпл для вывода: (суффикс имени, метки, значение)
+Sample = Tuple[str, Dict[str, str], float]
+
+# Семейство для вывода: (имя, тип, описание, семплы)
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Базовая метрика с метками"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Tuple) -> Tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получено {labels}")
+        return tuple(str(value) for value in labels)
+
+    def _labels(self, key: Tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        values = self._values
+        if labels in values:
+            values[labels] += amount
+        else:
+            key = self._key(labels)
+            values[key] = values.get(key, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[Sample]:
+        for key, value in list(self._values.items()):
+            yield "_total", self._labels(key), value
+
+
+class Gauge(_Metric):
+    """Значение, которое может расти и уменьшаться"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, *labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, *labels, amount: float = 1.0):
+        values = self._values
+        if labels in values:
+            values[labels] += amount
+        else:
+            key = self._key(labels)
+            values[key] = values.get(key, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[Sample]:
+        for key, value in list(self._values.items()):
+            yield "", self._labels(key), value
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма с фиксированными границами
+
+    observe() увеличивает один счетчик корзины; накопительные значения
+    bucket{le=...} считаются только при выводе.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {метки: [счетчики корзин..., +Inf, сумма]}
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels):
+        counts = self._values.get(labels)
+        if counts is None:
+            key = self._key(labels)
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def count(self, *labels) -> int:
+        counts = self._values.get(self._key(labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def samples(self) -> Iterable[Sample]:
+        for key, counts in list(self._values.items()):
+            labels = self._labels(key)
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                total += count
+                yield "_bucket", {**labels, "le": _format_value(bound)}, total
+            yield "_count", labels, total
+            yield "_sum", labels, counts[-1]
+
+
+class Registry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[_Metric, Iterable[Sample]]]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Метрика {metric.name} уже зарегистрирована с другим типом")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[_Metric, Iterable[Sample]]]]):
+        """
+        Добавляет функцию, которая при каждом чтении метрик возвращает
+        пары (описание метрики, семплы)
+        """
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def collect(self) -> List[Family]:
+        """Текущие семплы всех метрик и collectors"""
+        pairs = [(metric, metric.samples()) for metric in list(self._metrics.values())]
+        for collector in list(self._collectors):
+            pairs.extend(collector())
+        return [(metric.name, metric.type, metric.documentation, list(samples)) for metric, samples in pairs]
+
+    def render(self) -> bytes:
+        """Все метрики в текстовом формате Prometheus"""
+        return render_families(self.collect())
+
+
+def render_families(families: Iterable[Family]) -> bytes:
+    """Семейства в текстовом формате Prometheus"""
+    lines: List[str] = []
+    for name, metric_type, documentation, samples in families:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+
+    lines.append("")
+    return "\n".join(lines).encode()
+
+
+def gauge_samples(
+    name: str,
+    documentation: str,
+    values: Dict[Tuple, float],
+    labelnames: Sequence[str] = ()
+) -> Tuple[_Metric, List[Sample]]:
+    """Семейство gauge для collector: {значения меток: число}"""
+    metric = Gauge(name, documentation, labelnames)
+    return metric, [("", dict(zip(labelnames, key)), value) for key, value in values.items()]
+
+
+def counter_samples(
+    name: str,
+    documentation: str,
+    values: Dict[Tuple, float],
+    labelnames: Sequence[str] = ()
+) -> Tuple[_Metric, List[Sample]]:
+    """Семейство counter для collector: {значения меток: число}"""
+    metric = Counter(name, documentation, labelnames)
+    return metric, [("_total", dict(zip(labelnames, key)), value) for key, value in values.items()]
+
+
+# Реестр по умолчанию
+REGISTRY = Registry()
+
+
+class MultiprocessMetrics:
+    """
+    Метрики всех воркеров pre-fork сервера в одном ответе /metrics
+
+    Запрос /metrics попадает в случайный воркер, а у каждого воркера свой
+    реестр. Поэтому воркер раз в interval секунд пишет снимок своих
+    семплов в directory/<worker>.json, а /metrics любого воркера отдает
+    свои текущие семплы и последние снимки остальных. Все семплы получают
+    метку worker; сумма по воркерам - в запросе Prometheus
+    (sum without (worker) ...). Номер воркера сохраняется при перезапуске,
+    поэтому снимок упавшего воркера заменяется новым, а не копится.
+    """
+
+    def __init__(self, registry: Registry, directory: str, worker: str, interval: float = 5.0):
+        self.registry = registry
+        self.directory = Path(directory)
+        self.worker = worker
+        self.interval = interval
+
+    @property
+    def path(self) -> Path:
+        return self.directory / f"{self.worker}.json"
+
+    def write_snapshot(self):
+        """Атомарная запись снимка: читатели видят старый или новый файл целиком"""
+        temporary = self.directory / f".{self.worker}.{os.getpid()}.tmp"
+        temporary.write_text(json.dumps(self.registry.collect(), ensure_ascii=False))
+        os.replace(temporary, self.path)
+
+    def remove_snapshot(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def render(self) -> bytes:
+        """Свои текущие метрики и снимки остальных воркеров"""
+        merged: Dict[str, Family] = {}
+
+        def add(families: Iterable[Family], worker: str):
+            for name, metric_type, documentation, samples in families:
+                family = merged.setdefault(name, (name, metric_type, documentation, []))
+                family[3].extend((suffix, {**labels, "worker": worker}, value) for suffix, labels, value in samples)
+
+        add(self.registry.collect(), self.worker)
+        for path in sorted(self.directory.glob("*.json")):
+            if path.stem == self.worker:
+                continue
+            try:
+                families = json.loads(path.read_text())
+            except (OSError, ValueError):
+                # Воркер мог как раз завершиться и удалить снимок
+                continue
+            add(families, path.stem)
+
+        return render_families(merged.values())
+
+    async def run(self):
+        """Периодическая запись снимка до отмены задачи"""
+        while True:
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                logger.error(f"Не удалось записать снимок метрик: {e}")
+            await asyncio.sleep(self.interval)
+
+
+# Сборщик метрик воркеров; None - один процесс, /metrics отдает REGISTRY
+multiprocess: Optional[MultiprocessMetrics] = None
+
+
+def enable_multiprocess(directory: str, worker: str, interval: float = 5.0) -> MultiprocessMetrics:
+    """Включает общий /metrics воркеров для процесса (вызывается после fork)"""
+    global multiprocess
+    multiprocess = MultiprocessMetrics(REGISTRY, directory, worker, interval)
+    return multiprocess
+
+
+def render_metrics() -> bytes:
+    """Ответ /metrics процесса: все воркеры или только REGISTRY"""
+    if multiprocess is not None:
+        return multiprocess.render()
+    return REGISTRY.render()
+
+
+def completion_cache_collector(cache, prefix: str) -> Callable:
+    """Collector счетчиков кэша прохождения опросов"""
+
+    def collect():
+        yield counter_samples(
+            f"{prefix}_completion_cache_lookups",
+            "Проверки кэша прохождения опросов",
+            {("hit",): cache.hits, ("miss",): cache.misses},
+            ("result",)
+        )
+
+    return collect
@@ -0,0 +1,170 @@
+"""
+LISTEN/NOTIFY PostgreSQL для рассылки событий между процессами
+
+Каждый процесс (воркер API, бот) держит одно подключение asyncpg с LISTEN
+на нужные каналы; событие, отправленное pg_notify в транзакции, доходит до
+всех процессов только после COMMIT. Обработчики вызываются в event loop
+процесса и должны быть быстрыми (тяжелую работу - в свои задачи).
+
+Уведомления, отправленные пока подключение потеряно, не доставляются:
+после переподключения вызываются on_reconnect обработчики, чтобы
+подписчики могли сбросить производное состояние целиком.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Union
+
+import asyncpg
+
+from common.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PG_NOTIFY_RECEIVED = REGISTRY.counter(
+    "pg_notify_received",
+    "Полученные уведомления LISTEN",
+    ("channel",)
+)
+PG_LISTENER_RECONNECTS = REGISTRY.counter(
+    "pg_listener_reconnects",
+    "Переподключения LISTEN после потери соединения"
+)
+
+# Ограничение PostgreSQL на payload - 8000 байт
+MAX_PAYLOAD_BYTES = 7900
+
+NOTIFY_SQL = "SELECT pg_notify($1, $2)"
+
+Handler = Callable[[str], Union[None, Awaitable[None]]]
+
+
+def encode_payload(payload: Dict[str, Any], optional: Iterable[str] = ()) -> str:
+    """
+    JSON payload для pg_notify
+
+    Если payload не помещается в лимит, ключи optional убираются:
+    получатель должен уметь догрузить их сам.
+    """
+    encoded = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+    if len(encoded.encode()) <= MAX_PAYLOAD_BYTES:
+        return encoded
+
+    payload = {key: value for key, value in payload.items() if key not in set(optional)}
+    encoded = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+    if len(encoded.encode()) > MAX_PAYLOAD_BYTES:
+        raise ValueError(f"pg_notify payload больше {MAX_PAYLOAD_BYTES} байт")
+    return encoded
+
+
+class PgListener:
+    """Подключение LISTEN с переподключением и проверкой живости"""
+
+    def __init__(
+        self,
+        dsn: str,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+        ping_interval: float = 30.0
+    ):
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.ping_interval = ping_interval
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._reconnect_handlers: List[Callable[[], Any]] = []
+        self._connection: Optional[asyncpg.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lost: Optional[asyncio.Event] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None and not self._connection.is_closed()
+
+    def subscribe(self, channel: str, handler: Handler):
+        """Обработчик payload канала (до или после start)"""
+        self._handlers.setdefault(channel, []).append(handler)
+        if self.connected:
+            asyncio.ensure_future(self._connection.add_listener(channel, self._dispatch))
+
+    def on_reconnect(self, handler: Callable[[], Any]):
+        """Вызывается после восстановления соединения (уведомления могли потеряться)"""
+        self._reconnect_handlers.append(handler)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="pg-listener")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close()
+
+    def _dispatch(self, connection, pid: int, channel: str, payload: str):
+        PG_NOTIFY_RECEIVED.inc(channel)
+        for handler in self._handlers.get(channel, ()):
+            try:
+                result = handler(payload)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+            except Exception:
+                logger.exception(f"Ошибка обработчика уведомления {channel}")
+
+    async def _connect(self):
+        self._lost = asyncio.Event()
+        connection = await asyncpg.connect(self.dsn)
+        connection.add_termination_listener(lambda _: self._lost.set())
+        for channel in self._handlers:
+            await connection.add_listener(channel, self._dispatch)
+        self._connection = connection
+
+    async def _close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None and not connection.is_closed():
+            try:
+                await asyncio.wait_for(connection.close(), timeout=5)
+            except Exception:
+                connection.terminate()
+
+    async def _run(self):
+        delay = self.reconnect_delay
+        first = True
+        while True:
+            try:
+                await self._connect()
+            except (OSError, asyncpg.PostgresError, asyncio.TimeoutError) as e:
+                logger.warning(f"LISTEN: не удалось подключиться ({e}), повтор через {delay:.0f} с")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+
+            delay = self.reconnect_delay
+            if not first:
+                PG_LISTENER_RECONNECTS.inc()
+                logger.info("LISTEN: соединение восстановлено")
+                for handler in self._reconnect_handlers:
+                    try:
+                        result = handler()
+                        if asyncio.iscoroutine(result):
+                            await result
+                    except Exception:
+                        logger.exception("Ошибка обработчика переподключения LISTEN")
+            first = False
+
+            # Без активности TCP разрыв может не обнаружиться: периодический ping
+            while not self._lost.is_set():
+                try:
+                    await asyncio.wait_for(self._lost.wait(), timeout=self.ping_interval)
+                except asyncio.TimeoutError:
+                    try:
+                        await asyncio.wait_for(self._connection.fetchval("SELECT 1"), timeout=10)
+                    except Exception:
+                        break
+
+            logger.warning("LISTEN: соединение потеряно, переподключение")
+            await self._close()
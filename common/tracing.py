@@ -0,0 +1,248 @@
+"""
+Распределенная трассировка (OpenTelemetry)
+
+Общая настройка для API и бота: семплирование, экспортеры и помощники
+для спанов и передачи контекста (W3C traceparent).
+
+Экспортеры:
+    none   - спаны создаются только для передачи контекста, никуда не пишутся
+    memory - в памяти процесса (тесты, get_memory_exporter())
+    file   - JSON lines в файл, работает без сети
+    console- в stdout
+    otlp   - OTLP/HTTP коллектор (требует пакет opentelemetry-exporter-otlp-proto-http)
+
+Если OpenTelemetry не установлен, все функции модуля работают как no-op.
+Сам OpenTelemetry импортируется только в setup_tracing, поэтому
+с выключенной трассировкой модуль не замедляет старт процесса.
+"""
+import importlib.util
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Mapping, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+OTEL_AVAILABLE = importlib.util.find_spec("opentelemetry") is not None
+
+logger = logging.getLogger(__name__)
+
+# Query-параметр WebApp ссылки с контекстом трассировки
+TRACEPARENT_PARAM = "traceparent"
+
+_enabled = False
+_memory_exporter = None
+
+
+def is_enabled() -> bool:
+    """Настроена ли трассировка в этом процессе"""
+    return _enabled
+
+
+def _json_file_exporter(path: str):
+    """Экспортер спанов в файл JSON lines"""
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+    class JsonFileSpanExporter(SpanExporter):
+        def __init__(self):
+            self._lock = threading.Lock()
+
+        def export(self, spans):
+            lines = [json.dumps(json.loads(span.to_json()), ensure_ascii=False) for span in spans]
+            try:
+                with self._lock, open(path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+            except OSError as e:
+                logger.error(f"Не удалось записать спаны в {path}: {e}")
+                return SpanExportResult.FAILURE
+            return SpanExportResult.SUCCESS
+
+        def shutdown(self):
+            pass
+
+    return JsonFileSpanExporter()
+
+
+def _create_exporter(exporter: str, file_path: Optional[str], otlp_endpoint: Optional[str]):
+    global _memory_exporter
+
+    if exporter == "memory":
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+        _memory_exporter = InMemorySpanExporter()
+        return _memory_exporter, True
+
+    if exporter == "file":
+        from pathlib import Path
+        path = Path(file_path or "traces.jsonl")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return _json_file_exporter(str(path)), False
+
+    if exporter == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        return ConsoleSpanExporter(), False
+
+    if exporter == "otlp":
+        # Требует установленный пакет opentelemetry-exporter-otlp-proto-http
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=otlp_endpoint) if otlp_endpoint else OTLPSpanExporter(), False
+
+    if exporter == "none":
+        return None, False
+
+    raise ValueError(f"Неизвестный экспортер трассировки: {exporter}")
+
+
+def setup_tracing(
+    service_name: str,
+    exporter: str = "file",
+    sample_ratio: float = 1.0,
+    file_path: Optional[str] = None,
+    otlp_endpoint: Optional[str] = None
+) -> bool:
+    """
+    Настраивает глобальный TracerProvider процесса
+
+    Семплирование parent-based: решение вызывающей стороны (флаг в traceparent)
+    сохраняется, для новых трасс берется доля sample_ratio.
+
+    Returns:
+        True если трассировка включена
+    """
+    global _enabled
+
+    if not OTEL_AVAILABLE:
+        logger.warning("OpenTelemetry не установлен, трассировка отключена")
+        return False
+
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio))
+    )
+
+    span_exporter, synchronous = _create_exporter(exporter, file_path, otlp_endpoint)
+    if span_exporter is not None:
+        # В памяти пишем сразу (тесты читают спаны без ожидания), остальное пачками
+        processor = SimpleSpanProcessor(span_exporter) if synchronous else BatchSpanProcessor(span_exporter)
+        provider.add_span_processor(processor)
+
+    trace.set_tracer_provider(provider)
+    _enabled = True
+    logger.info(f"🔭 Трассировка: {service_name}, exporter={exporter}, sample_ratio={sample_ratio}")
+    return True
+
+
+def shutdown_tracing():
+    """Сбрасывает накопленные спаны и останавливает экспортеры"""
+    if not _enabled:
+        return
+    from opentelemetry import trace
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+def get_memory_exporter():
+    """InMemorySpanExporter (только для exporter=memory)"""
+    return _memory_exporter
+
+
+def get_tracer(name: str):
+    """Tracer OpenTelemetry или None, если трассировка выключена"""
+    if not _enabled:
+        return None
+    from opentelemetry import trace
+    return trace.get_tracer(name)
+
+
+@contextmanager
+def span(name: str, attributes: Optional[Dict[str, Any]] = None, kind: str = "internal",
+         tracer_name: str = "oprosy") -> Iterator[Any]:
+    """
+    Спан вокруг блока кода (no-op, если трассировка выключена)
+
+    kind: internal | client | server | producer | consumer.
+    Исключения записываются в спан и пробрасываются дальше.
+    """
+    if not _enabled:
+        yield None
+        return
+
+    from opentelemetry import trace
+    from opentelemetry.trace import SpanKind
+
+    tracer = trace.get_tracer(tracer_name)
+    with tracer.start_as_current_span(name, kind=SpanKind[kind.upper()], attributes=attributes) as current:
+        yield current
+
+
+def set_error(current_span, exc: BaseException):
+    """Отмечает спан как ошибочный"""
+    if current_span is None:
+        return
+    from opentelemetry.trace import Status, StatusCode
+    current_span.record_exception(exc)
+    current_span.set_status(Status(StatusCode.ERROR, str(exc)))
+
+
+def extract_context(carrier: Mapping[str, str]):
+    """Контекст трассировки из заголовков (traceparent/tracestate)"""
+    if not _enabled:
+        return None
+    from opentelemetry import propagate
+    return propagate.extract(carrier)
+
+
+def attach_context(ctx):
+    """Делает контекст текущим; возвращает токен для detach_context"""
+    if ctx is None:
+        return None
+    from opentelemetry import context
+    return context.attach(ctx)
+
+
+def detach_context(token):
+    if token is not None:
+        from opentelemetry import context
+        context.detach(token)
+
+
+def current_traceparent() -> Optional[str]:
+    """traceparent текущего спана (None, если трассировки нет)"""
+    if not _enabled:
+        return None
+    from opentelemetry import propagate
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier.get("traceparent")
+
+
+def current_trace_id() -> Optional[str]:
+    """trace_id текущего спана в hex (для корреляции логов)"""
+    if not _enabled:
+        return None
+    from opentelemetry import trace
+    context = trace.get_current_span().get_span_context()
+    return format(context.trace_id, "032x") if context.is_valid else None
+
+
+def with_traceparent(url: str) -> str:
+    """
+    Добавляет traceparent текущего спана в query ссылки WebApp
+
+    WebApp передает его в API заголовком traceparent, и открытие опроса
+    продолжает трассу апдейта, в котором бот отправил кнопку.
+    """
+    traceparent = current_traceparent()
+    if not traceparent:
+        return url
+
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != TRACEPARENT_PARAM]
+    query.append((TRACEPARENT_PARAM, traceparent))
+    return urlunsplit(parts._replace(query=urlencode(query)))
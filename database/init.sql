@@ -30,6 +30,8 @@ CREATE TABLE IF NOT EXISTS quizzes (
     structure JSONB NOT NULL DEFAULT '{}',
     settings JSONB NOT NULL DEFAULT '{}',
     status VARCHAR(20) NOT NULL DEFAULT 'draft' CHECK (status IN ('draft', 'active', 'archived')),
+    response_count INTEGER NOT NULL DEFAULT 0,
+    last_response_at TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -37,6 +39,7 @@ CREATE TABLE IF NOT EXISTS quizzes (
 -- Индексы для quizzes
 CREATE INDEX IF NOT EXISTS idx_quizzes_creator_id ON quizzes(creator_id);
 CREATE INDEX IF NOT EXISTS idx_quizzes_status ON quizzes(status);
+CREATE INDEX IF NOT EXISTS ix_quizzes_creator_created ON quizzes(creator_id, created_at, id);
 CREATE INDEX IF NOT EXISTS idx_quizzes_structure ON quizzes USING GIN(structure);
 
 -- Таблица ответов
@@ -46,7 +49,7 @@ CREATE TABLE IF NOT EXISTS responses (
     user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     answers JSONB NOT NULL DEFAULT '{}',
     completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE(quiz_id, user_id)
+    CONSTRAINT uq_responses_quiz_user UNIQUE(quiz_id, user_id)
 );
 
 -- Индексы для responses
@@ -69,6 +72,18 @@ CREATE TABLE IF NOT EXISTS files (
 CREATE INDEX IF NOT EXISTS idx_files_quiz_id ON files(quiz_id);
 CREATE INDEX IF NOT EXISTS idx_files_user_id ON files(user_id);
 
+-- Таблица состояний FSM бота (общая для всех реплик)
+CREATE TABLE IF NOT EXISTS fsm_states (
+    key VARCHAR(255) PRIMARY KEY,
+    state VARCHAR(255),
+    data BYTEA,
+    expires_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Индексы для fsm_states
+CREATE INDEX IF NOT EXISTS ix_fsm_states_expires_at ON fsm_states(expires_at);
+
 -- Функция для автоматического обновления updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -82,16 +97,83 @@ $$ language 'plpgsql';
 CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
-CREATE TRIGGER update_quizzes_updated_at BEFORE UPDATE ON quizzes
+-- Обновление счетчиков ответов не меняет updated_at опроса
+CREATE TRIGGER update_quizzes_updated_at BEFORE UPDATE OF
+    creator_id, title, description, structure, settings, status
+    ON quizzes
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+-- Счетчики ответов опроса в транзакции вставки/удаления ответа
+CREATE OR REPLACE FUNCTION update_quiz_response_counters()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE quizzes
+        SET response_count = response_count + 1,
+            last_response_at = GREATEST(last_response_at, NEW.completed_at)
+        WHERE id = NEW.quiz_id;
+        RETURN NEW;
+    END IF;
+
+    UPDATE quizzes
+    SET response_count = GREATEST(response_count - 1, 0),
+        last_response_at = CASE
+            WHEN last_response_at IS DISTINCT FROM OLD.completed_at THEN last_response_at
+            ELSE (SELECT max(completed_at) FROM responses WHERE quiz_id = OLD.quiz_id)
+        END
+    WHERE id = OLD.quiz_id;
+    RETURN OLD;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER update_quiz_response_counters AFTER INSERT OR DELETE ON responses
+    FOR EACH ROW EXECUTE FUNCTION update_quiz_response_counters();
+
+-- Событие шины инвалидации кэшей (common/invalidation) при изменении опроса
+CREATE OR REPLACE FUNCTION notify_quiz_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('cache_invalidation', json_build_object(
+        'entity', 'quiz',
+        'op', lower(TG_OP),
+        'ids', json_build_array(CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END)
+    )::text);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Счетчики ответов событий не вызывают
+CREATE TRIGGER notify_quiz_change AFTER INSERT OR DELETE OR UPDATE OF
+    creator_id, title, description, structure, settings, status
+    ON quizzes
+    FOR EACH ROW EXECUTE FUNCTION notify_quiz_change();
+
+-- Новый ответ: кэши прохождения опросов всех процессов (API и бот)
+CREATE OR REPLACE FUNCTION notify_response_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('cache_invalidation', json_build_object(
+        'entity', 'response',
+        'op', 'insert',
+        'ids', json_build_array(NEW.id),
+        'data', json_build_object('quiz_id', NEW.quiz_id, 'user_id', NEW.user_id)
+    )::text);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER notify_response_insert AFTER INSERT ON responses
+    FOR EACH ROW EXECUTE FUNCTION notify_response_insert();
+
 -- Комментарии к таблицам
 COMMENT ON TABLE users IS 'Таблица пользователей бота';
 COMMENT ON TABLE quizzes IS 'Таблица опросов с JSONB структурой';
 COMMENT ON TABLE responses IS 'Таблица ответов пользователей на опросы';
 COMMENT ON TABLE files IS 'Таблица метаданных загруженных файлов';
+COMMENT ON TABLE fsm_states IS 'Таблица состояний FSM бота';
 
 -- Комментарии к важным колонкам
 COMMENT ON COLUMN quizzes.structure IS 'JSONB структура опроса: вопросы, типы, логика переходов';
 COMMENT ON COLUMN quizzes.settings IS 'JSONB настройки: онбординг, брендирование';
+COMMENT ON COLUMN quizzes.response_count IS 'Число ответов, поддерживается триггером на responses';
 COMMENT ON COLUMN responses.answers IS 'JSONB ответы пользователя на все вопросы';
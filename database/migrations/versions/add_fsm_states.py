@@ -0,0 +1,34 @@
+"""Add fsm_states table for shared bot FSM storage
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'fsm_states',
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('state', sa.String(length=255), nullable=True),
+        sa.Column('data', sa.LargeBinary(), nullable=True),
+        sa.Column('expires_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_fsm_states_expires_at'), 'fsm_states', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_fsm_states_expires_at'), table_name='fsm_states')
+    op.drop_table('fsm_states')
@@ -0,0 +1,44 @@
+"""Notify cache invalidation bus from a trigger on quizzes
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-20 10:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Событие уходит с COMMIT транзакции любого писателя (API, бот, ручной SQL)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_quiz_change()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            PERFORM pg_notify('cache_invalidation', json_build_object(
+                'entity', 'quiz',
+                'op', lower(TG_OP),
+                'ids', json_build_array(CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END)
+            )::text);
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql'
+    """)
+    # Счетчики ответов (response_count, last_response_at) событий не вызывают
+    op.execute("""
+        CREATE TRIGGER notify_quiz_change AFTER INSERT OR DELETE OR UPDATE OF
+            creator_id, title, description, structure, settings, status
+        ON quizzes
+        FOR EACH ROW EXECUTE FUNCTION notify_quiz_change()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS notify_quiz_change ON quizzes")
+    op.execute("DROP FUNCTION IF EXISTS notify_quiz_change()")
@@ -0,0 +1,85 @@
+"""Add response counters on quizzes maintained by trigger
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 18:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('quizzes', sa.Column('response_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('quizzes', sa.Column('last_response_at', sa.TIMESTAMP(), nullable=True))
+
+    # Счетчики меняются в транзакции вставки/удаления ответа
+    op.execute("""
+        CREATE OR REPLACE FUNCTION update_quiz_response_counters()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE quizzes
+                SET response_count = response_count + 1,
+                    last_response_at = GREATEST(last_response_at, NEW.completed_at)
+                WHERE id = NEW.quiz_id;
+                RETURN NEW;
+            END IF;
+
+            UPDATE quizzes
+            SET response_count = GREATEST(response_count - 1, 0),
+                last_response_at = CASE
+                    WHEN last_response_at IS DISTINCT FROM OLD.completed_at THEN last_response_at
+                    ELSE (SELECT max(completed_at) FROM responses WHERE quiz_id = OLD.quiz_id)
+                END
+            WHERE id = OLD.quiz_id;
+            RETURN OLD;
+        END;
+        $$ language 'plpgsql'
+    """)
+    op.execute("""
+        CREATE TRIGGER update_quiz_response_counters
+        AFTER INSERT OR DELETE ON responses
+        FOR EACH ROW EXECUTE FUNCTION update_quiz_response_counters()
+    """)
+
+    # Обновление счетчиков не должно менять updated_at опроса
+    op.execute("DROP TRIGGER IF EXISTS update_quizzes_updated_at ON quizzes")
+    op.execute("""
+        CREATE TRIGGER update_quizzes_updated_at BEFORE UPDATE OF
+            creator_id, title, description, structure, settings, status
+        ON quizzes
+        FOR EACH ROW EXECUTE FUNCTION update_updated_at_column()
+    """)
+
+    # Заполняем счетчики по существующим ответам
+    op.execute("""
+        UPDATE quizzes q
+        SET response_count = r.total,
+            last_response_at = r.last_at
+        FROM (
+            SELECT quiz_id, count(*) AS total, max(completed_at) AS last_at
+            FROM responses
+            GROUP BY quiz_id
+        ) r
+        WHERE r.quiz_id = q.id
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS update_quizzes_updated_at ON quizzes")
+    op.execute("""
+        CREATE TRIGGER update_quizzes_updated_at BEFORE UPDATE ON quizzes
+        FOR EACH ROW EXECUTE FUNCTION update_updated_at_column()
+    """)
+    op.execute("DROP TRIGGER IF EXISTS update_quiz_response_counters ON responses")
+    op.execute("DROP FUNCTION IF EXISTS update_quiz_response_counters()")
+    op.drop_column('quizzes', 'last_response_at')
+    op.drop_column('quizzes', 'response_count')
@@ -0,0 +1,24 @@
+"""Add index on quizzes (creator_id, created_at, id) for keyset pagination
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 19:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_quizzes_creator_created', 'quizzes', ['creator_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_quizzes_creator_created', table_name='quizzes')
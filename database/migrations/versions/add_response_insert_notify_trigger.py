@@ -0,0 +1,42 @@
+"""Notify cache invalidation bus about new responses
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-21 10:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Кэши прохождения опросов всех процессов узнают об ответе с COMMIT
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_response_insert()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            PERFORM pg_notify('cache_invalidation', json_build_object(
+                'entity', 'response',
+                'op', 'insert',
+                'ids', json_build_array(NEW.id),
+                'data', json_build_object('quiz_id', NEW.quiz_id, 'user_id', NEW.user_id)
+            )::text);
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql'
+    """)
+    op.execute("""
+        CREATE TRIGGER notify_response_insert AFTER INSERT ON responses
+        FOR EACH ROW EXECUTE FUNCTION notify_response_insert()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS notify_response_insert ON responses")
+    op.execute("DROP FUNCTION IF EXISTS notify_response_insert()")
@@ -0,0 +1,32 @@
+"""Add composite unique index on responses (quiz_id, user_id)
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Оставляем только первый ответ пользователя на опрос
+    op.execute("""
+        DELETE FROM responses r
+        USING responses older
+        WHERE r.quiz_id = older.quiz_id
+          AND r.user_id = older.user_id
+          AND r.id > older.id
+    """)
+    op.create_unique_constraint('uq_responses_quiz_user', 'responses', ['quiz_id', 'user_id'])
+
+
+def downgrade():
+    op.drop_constraint('uq_responses_quiz_user', 'responses', type_='unique')
@@ -1,7 +1,7 @@
 """
 SQLAlchemy модели для Alembic миграций
 """
-from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, TIMESTAMP, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, TIMESTAMP, ForeignKey, CheckConstraint, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -36,11 +36,16 @@ class Quiz(Base):
     structure = Column(JSONB, nullable=False, default={})
     settings = Column(JSONB, nullable=False, default={})
     status = Column(String(20), nullable=False, default='draft', index=True)
+    # Поддерживаются триггером update_quiz_response_counters, из кода не пишутся
+    response_count = Column(Integer, nullable=False, server_default='0')
+    last_response_at = Column(TIMESTAMP)
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
     __table_args__ = (
         CheckConstraint("status IN ('draft', 'active', 'archived')", name='check_quiz_status'),
+        # Список опросов администратора: keyset по created_at
+        Index('ix_quizzes_creator_created', 'creator_id', 'created_at', 'id'),
     )
 
 
@@ -67,7 +72,9 @@ class Response(Base):
     completed_at = Column(TIMESTAMP, server_default=func.now())
 
     __table_args__ = (
-        # Уникальная пара quiz_id + user_id (один пользователь - один ответ на опрос)
+        # Уникальная пара quiz_id + user_id (один пользователь - один ответ на опрос).
+        # Этот же индекс обслуживает проверки "проходил ли пользователь опрос"
+        UniqueConstraint('quiz_id', 'user_id', name='uq_responses_quiz_user'),
         {'sqlite_autoincrement': True},
     )
 
@@ -83,3 +90,14 @@ class File(Base):
     file_type = Column(String(50))
     file_size = Column(Integer)
     uploaded_at = Column(TIMESTAMP, server_default=func.now())
+
+
+class FSMState(Base):
+    """Модель состояния FSM бота (онбординг и другие диалоги)"""
+    __tablename__ = 'fsm_states'
+
+    key = Column(String(255), primary_key=True)
+    state = Column(String(255))
+    data = Column(LargeBinary)
+    expires_at = Column(TIMESTAMP, index=True)
+    updated_at = Column(TIMESTAMP, server_default=func.now())
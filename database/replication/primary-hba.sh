@@ -0,0 +1,5 @@
+#!/bin/sh
+# Разрешает потоковую репликацию с других контейнеров сети (профиль replica).
+# Выполняется docker-entrypoint только при инициализации пустого тома.
+set -e
+echo "host replication ${POSTGRES_USER} all scram-sha-256" >> "$PGDATA/pg_hba.conf"
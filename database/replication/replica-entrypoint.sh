@@ -0,0 +1,17 @@
+#!/bin/sh
+# Потоковая реплика primary (docker compose --profile replica up).
+# При пустом томе копирует primary через pg_basebackup (-R создает
+# standby.signal и primary_conninfo), затем запускает hot standby.
+set -e
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+    until pg_isready -h "$PRIMARY_HOST" -U "$POSTGRES_USER" -q; do
+        sleep 1
+    done
+    PGPASSWORD="$POSTGRES_PASSWORD" pg_basebackup \
+        -h "$PRIMARY_HOST" -U "$POSTGRES_USER" -D "$PGDATA" -R -X stream -c fast
+    chmod 700 "$PGDATA"
+fi
+
+# hot_standby_feedback: долгие отчеты на реплике не отменяются из-за VACUUM на primary
+exec postgres -c hot_standby=on -c hot_standby_feedback=on